@@ -1,37 +1,47 @@
 # Force reload - 2026-08-20 18:57
-from functools import wraps
-from flask import Blueprint, Flask, request, jsonify, Response, g
-from flask_cors import CORS
-from auth.auth import JWTValidator
-from configparser import ConfigParser
-from werkzeug.datastructures import ImmutableMultiDict
-
-from others.institute import insert_institute, get_institute_details, get_institute_list, get_campus_list, delete_institute, manage_institute, update_institute
-from others.users import insert_user, get_user_page_access, get_user_details, get_user_list, get_user_limit, user_bulk_upload, update_user_details, delete_user
-from others.exams import add_exam, autosave_exam_answers, get_active_exam_status, get_exam_details, get_exam_list, launch_exam_details, submit_exam_answers,get_user_exam_details
-from others.examschedule import add_exam_schedule, get_exam_schedule_details, delete_exam_schedule
-from others.examschedule import update_exam_schedule
-from others.category import add_categories, get_categories_list, get_category_details
-from others.questions import add_question, get_questions_details, bulk_upload_questions, create_question_using_llm, fine_tune_questions_using_llm
-from others.exam_review import review_user_exam, validate_answers, update_review_comments, update_manual_review_status
-from others.exam_reports import get_user_wise_report, get_exam_analytics
-from others.exam_reports import get_question_wrong_answers
-from others.exam_reports import get_resources_for_answer
-
-# Flask Application Core - Name Resolution Fix Reload
-import os
-from masters.location import get_location_hierarchy_details, get_registered_countries_details
-from masters.insititute_masters import get_institute_department_details, get_institute_team_details
-from masters.others import get_pages_list
-
-from dashboard.super_admin_dashboard import superadmin_dashboard_details
-from dashboard.admin_dashboard import admin_dashboard_details
-from dashboard.user_dashboard import user_dashboard_details, dashboard_users_list
+import startup_timing
+startup_timing.begin()
 
-from others.demo_request import submit_demo_request, get_demo_requests, get_demo_request_by_id, update_demo_request_status, delete_demo_request
-from db.db import SQLiteDB
-from db.models import User
-from others.settings import get_ai_confidence_threshold_response, update_ai_confidence_threshold
+try:
+    from functools import wraps
+    from flask import Blueprint, Flask, request, jsonify, Response, g
+    from flask_cors import CORS
+    from auth.auth import JWTValidator
+    from configparser import ConfigParser
+    from werkzeug.datastructures import ImmutableMultiDict
+
+    from others.institute import insert_institute, get_institute_details, get_institute_list, get_campus_list, delete_institute, manage_institute, update_institute
+    from others.users import insert_user, get_user_page_access, get_user_details, get_user_list, get_user_limit, user_bulk_upload, update_user_details, delete_user
+    from others.exams import add_exam, autosave_exam_answers, get_active_exam_status, get_exam_details, get_exam_list, launch_exam_details, submit_exam_answers,get_user_exam_details
+    from others.examschedule import add_exam_schedule, get_exam_schedule_details, delete_exam_schedule
+    from others.examschedule import update_exam_schedule
+    from others.category import add_categories, get_categories_list, get_category_details
+    from others.questions import add_question, get_questions_details, bulk_upload_questions, create_question_using_llm, fine_tune_questions_using_llm
+    from others.exam_review import review_user_exam, validate_answers, update_review_comments, update_manual_review_status
+    from others.exam_reports import get_user_wise_report, get_exam_analytics
+    from others.exam_reports import get_question_wrong_answers
+    from others.exam_reports import get_resources_for_answer
+
+    # Flask Application Core - Name Resolution Fix Reload
+    import os
+    from masters.location import get_location_hierarchy_details, get_registered_countries_details
+    from masters.insititute_masters import get_institute_department_details, get_institute_team_details
+    from masters.others import get_pages_list
+
+    from dashboard.super_admin_dashboard import superadmin_dashboard_details
+    from dashboard.admin_dashboard import admin_dashboard_details
+    from dashboard.user_dashboard import user_dashboard_details, dashboard_users_list
+
+    from others.demo_request import submit_demo_request, get_demo_requests, get_demo_request_by_id, update_demo_request_status, delete_demo_request
+    from db.db import SQLiteDB, begin_request_session, end_request_session, pool_stats
+    from db.models import User
+    from db.metrics import begin_request_stats, end_request_stats, enforce_query_budget, query_budget, render_prometheus
+    from others.settings import get_ai_confidence_threshold_response, get_settings_response, update_ai_confidence_threshold, update_settings
+    from others.background import start_background_tasks
+    from others.jobs import start_job_workers
+finally:
+    # Put the stock importer back even when an import fails.
+    startup_timing.end_imports()
 
 from dotenv import load_dotenv
 import os
@@ -45,11 +55,17 @@ jwt_secret = os.getenv('JWT_SECRET') or os.getenv('jwt_secret')
 if not jwt_secret:
     raise RuntimeError('JWT_SECRET environment variable is required')
 
-try:
-    from db.run_migrations import run_migrations
-    run_migrations()
-except Exception as _mig_err:
-    print(f"Auto-migration error on startup: {_mig_err}")
+startup_timing.mark('imports')
+
+# Deployments that run db/run_migrations.py as a release step can set
+# RUN_MIGRATIONS_ON_START=0 so workers skip the database round trip at boot.
+if os.getenv('RUN_MIGRATIONS_ON_START', '1').strip().lower() not in ('0', 'false', 'no', 'off'):
+    try:
+        from db.run_migrations import run_migrations
+        run_migrations()
+    except Exception as _mig_err:
+        print(f"Auto-migration error on startup: {_mig_err}")
+    startup_timing.mark('migrations')
 
 
 GLOBAL_SCOPE_EXCLUDED_PATHS = (
@@ -121,9 +137,14 @@ def normalize_global_scope_request():
 
     return None
 # Initialize JWT Validator
+jwt_validator = JWTValidator(jwt_secret)
+
 def initialize_jwt_validator(request):
-    jwt_validator = JWTValidator(jwt_secret)
-    return jwt_validator.token_validation(request)
+    # Decode once per request; get_current_user_from_request() reuses g.jwt_claims.
+    claims, validation_result = jwt_validator.authenticate_request(request)
+    if claims is not None:
+        g.jwt_claims = claims
+    return validation_result
 
 def jwt_required(f):
     @wraps(f)
@@ -142,22 +163,30 @@ def jwt_required(f):
     return decorated_function
 
 def get_current_user_from_request():
-    auth_header = request.headers.get("Authorization", "")
-    if not auth_header.startswith("Bearer "):
-        return None
-    token = auth_header.split(" ", 1)[1]
-    try:
-        decoded = JWTValidator(jwt_secret).validate_jwt(token)
-        email = decoded.get("sub")
-        if not email:
+    # Resolved at most once per request and shared by the scope check and the route.
+    if 'current_user' in g:
+        return g.current_user
+    claims = g.get('jwt_claims')
+    if claims is None:
+        auth_header = request.headers.get("Authorization", "")
+        if not auth_header.startswith("Bearer "):
             return None
-        db = SQLiteDB()
-        session = db.connect()
-        if not session:
+        try:
+            claims = jwt_validator.validate_jwt(auth_header.split(" ", 1)[1])
+        except Exception:
             return None
-        return session.query(User).filter_by(email=email).first()
+        g.jwt_claims = claims
+    user = None
+    try:
+        email = claims.get("sub")
+        if email:
+            session = SQLiteDB().connect()
+            if session:
+                user = session.query(User).filter_by(email=email).first()
     except Exception:
-        return None
+        user = None
+    g.current_user = user
+    return user
 
 def is_super_admin(user):
     role = str(getattr(user, "user_role", "") or "").lower()
@@ -173,8 +202,16 @@ def get_pagination():
 
 edu_blueprint = Blueprint('edu', __name__, url_prefix='/edu/api')
 
+@edu_blueprint.after_request
+def check_query_budget(response):
+    # N+1 guard: routes declare limits with @query_budget; undeclared routes
+    # still get the default repeated-statement ceiling.
+    view = app.view_functions.get(request.endpoint)
+    return enforce_query_budget(response, request.endpoint, view, app.config.get('QUERY_BUDGET_ENFORCE'))
+
 @edu_blueprint.route('/settings/ai-confidence-threshold', methods=['GET', 'PUT'])
 @jwt_required
+@query_budget(max_queries=8)
 def ai_confidence_threshold_route():
     current_user = get_current_user_from_request()
     if not current_user or not is_admin(current_user):
@@ -185,6 +222,27 @@ def ai_confidence_threshold_route():
         response_data, status_code = update_ai_confidence_threshold(request.get_json(silent=True) or {}, current_user)
     return jsonify(response_data), status_code
 
+@edu_blueprint.route('/settings', methods=['GET', 'PUT'])
+@jwt_required
+@query_budget(max_queries=12)
+def settings_route():
+    current_user = get_current_user_from_request()
+    if not current_user or not is_super_admin(current_user):
+        return jsonify({"status": False, "statusMessage": "Super admin access required"}), 403
+    if request.method == 'GET':
+        response_data, status_code = get_settings_response()
+    else:
+        response_data, status_code = update_settings(request.get_json(silent=True) or {}, current_user)
+    return jsonify(response_data), status_code
+
+@edu_blueprint.route('/system/db-pool', methods=['GET'])
+@jwt_required
+def db_pool_stats_route():
+    current_user = get_current_user_from_request()
+    if not current_user or not is_super_admin(current_user):
+        return jsonify({"status": False, "statusMessage": "Super admin access required"}), 403
+    return jsonify({"status": True, "statusMessage": "Success", "data": pool_stats()}), 200
+
 @edu_blueprint.route('/register-institute', methods=['POST'])
 @jwt_required
 def register_institute():
@@ -432,6 +490,23 @@ def update_manual_review_status_route():
     response_data, status_code = update_manual_review_status(request)
     return jsonify(response_data), status_code
 
+@edu_blueprint.route('/review-queue', methods=['GET'])
+@jwt_required
+@query_budget(max_queries=8)
+def review_queue_route():
+    current_user = get_current_user_from_request()
+    if not current_user or not is_admin(current_user):
+        return jsonify({"status": False, "statusMessage": "Admin access required"}), 403
+    # Institute admins only ever see their own institute, whatever the query asks for.
+    institute_id = None
+    if not is_super_admin(current_user):
+        institute_id = current_user.institute_id
+        if not institute_id:
+            return jsonify({"status": False, "statusMessage": "No institute assigned to this admin"}), 403
+    from others.review_queue import get_review_queue
+    response_data, status_code = get_review_queue(request, institute_id)
+    return jsonify(response_data), status_code
+
 @edu_blueprint.route('/update-descriptive-marks', methods=['POST'])
 @jwt_required
 def update_descriptive_marks_route():
@@ -470,6 +545,13 @@ def get_exams():
 
 @edu_blueprint.route('/launch-exam', methods=['GET'])
 @jwt_required
+# Cold worker, pregenerated schedule: session lookup (1), schedule with the
+# previous attempt number (1), paper compile (exam, mappings, category banks,
+# hand-picks, questions, options: 6), stored paper read and savepointed
+# insert (4), attempt insert (1). A warm launch issues 2-3. None of this
+# grows with the size of the paper; settings and version stamps are
+# cache fills and not charged.
+@query_budget(max_queries=13)
 def launch_exam_route():
     schedule_id = request.args.get('schedule_id')
     user_id = request.args.get('user_id')
@@ -581,6 +663,16 @@ def update_question_route(question_id):
     response_data, status_code = update_question(question_id, request)
     return jsonify(response_data), status_code
 
+@edu_blueprint.route('/question-rescore-status/<question_id>', methods=['GET'])
+@jwt_required
+def question_rescore_status_route(question_id):
+    current_user = get_current_user_from_request()
+    if not current_user or not is_admin(current_user):
+        return jsonify({"status": False, "statusMessage": "Admin access required"}), 403
+    from others.questions import get_question_rescore_status
+    response_data, status_code = get_question_rescore_status(question_id)
+    return jsonify(response_data), status_code
+
 @edu_blueprint.route('/get-questions-details', methods=['GET'])
 @jwt_required
 def get_questions_route():
@@ -705,20 +797,18 @@ def dashboard_users_route():
 def login():
     data = request.get_json(silent=True) or {}
 
-    jwt_validator = JWTValidator(jwt_secret) 
-
     login_status, status_code = jwt_validator.login(data)
     return jsonify(login_status), status_code
 
 
 @edu_blueprint.route('/refresh-token', methods=['POST'])
 def refresh_token_route():
-    jwt_validator = JWTValidator(jwt_secret)
     response_data, status_code = jwt_validator.refresh_token(request)
     return jsonify(response_data), status_code
 
 @edu_blueprint.route('/session/validate', methods=['GET'])
 @jwt_required
+@query_budget(max_queries=4)
 def validate_session_route():
     user = get_current_user_from_request()
     if not user:
@@ -737,8 +827,8 @@ def validate_session_route():
 
 @edu_blueprint.route('/logout', methods=['POST'])
 @jwt_required
+@query_budget(max_queries=8)
 def logout():
-    jwt_validator = JWTValidator(jwt_secret)
     logout_status, status_code = jwt_validator.logout(request)
     return jsonify(logout_status), status_code
 
@@ -783,6 +873,8 @@ def delete_demo_request_route(request_id):
     return jsonify(response_data), status_code
 
 app = Flask(__name__)
+# Test suites set QUERY_BUDGET_ENFORCE=1 so budget violations fail the request.
+app.config['QUERY_BUDGET_ENFORCE'] = str(os.getenv('QUERY_BUDGET_ENFORCE', '')).strip().lower() in ('1', 'true', 'yes', 'on')
 # CORS(app, resources={r"/edu/api/*": {"origins": ["http://localhost:4200","http://192.168.1.5:4200" ]}}, supports_credentials=True)
 # CORS(app, resources={r"/edu/api/*": {"origins": "*" }}, supports_credentials=True)
 
@@ -805,6 +897,32 @@ CORS(
     supports_credentials=True,
 )
 
+@app.before_request
+def open_db_request_scope():
+    begin_request_stats(request.endpoint)
+    begin_request_session()
+
+@app.before_request
+def ensure_background_tasks():
+    # Started per worker on its first request so forked workers get their own threads.
+    start_background_tasks()
+    start_job_workers()
+
+@app.after_request
+def record_db_request_outcome(response):
+    stats = end_request_stats()
+    if stats is not None:
+        response.headers['X-DB-Queries'] = str(stats.queries)
+        response.headers['X-DB-Time'] = f"{stats.total_seconds * 1000:.1f}"
+        response.headers['X-DB-Slowest'] = f"{stats.slowest_seconds * 1000:.1f}"
+    return response
+
+@app.teardown_appcontext
+def close_db_request_scope(exc):
+    # Handlers commit their own work; anything left pending is rolled back,
+    # so a 200 response with an error payload never half-commits.
+    end_request_session()
+
 @app.after_request
 def add_local_cors_headers(response):
     # Authenticated API data must not be reused across user or institute scopes.
@@ -820,7 +938,18 @@ def add_local_cors_headers(response):
         response.headers["Access-Control-Allow-Methods"] = "GET, POST, PUT, DELETE, OPTIONS"
     return response
 
+@app.route('/metrics', methods=['GET'])
+def metrics_route():
+    # Per-worker Prometheus text; set METRICS_TOKEN to require a bearer token.
+    metrics_token = os.getenv('METRICS_TOKEN')
+    if metrics_token and request.headers.get('Authorization', '') != f"Bearer {metrics_token}":
+        return jsonify({"status": False, "statusMessage": "Unauthorized"}), 401
+    return Response(render_prometheus(), mimetype='text/plain; version=0.0.4')
+
 app.register_blueprint(edu_blueprint)
+startup_timing.mark('routes')
+startup_timing.report()
+
 if __name__ == '__main__':
    app.run(debug=True, host='0.0.0.0', port=5001)
     # app.run(debug=False, host='0.0.0.0', port=5001) (venv) ubuntu@profluent--ar-webportal:/opt/ActualResults/backend$
@@ -1,18 +1,116 @@
-from db.models import Institute, User, AppSession, Credential
+from db.models import Institute, User, AppSession, Credential, RevokedSession
 from sqlalchemy import or_
 
+from collections import OrderedDict
 import datetime
+import os
 import re
+import threading
+import time
 import jwt
-import requests
 import base64
-import rsa
-from cryptography.hazmat.backends import default_backend
-from cryptography.hazmat.primitives import serialization
+import hashlib
 from passlib.hash import argon2
-import pandas as pd
 
 from db.db import SQLiteDB
+from db.metrics import cache_fill
+from others.settings import get_setting
+
+# Tokens whose App_Session row was found recently, keyed by the token's
+# SHA-256. A hit skips the per-request App_Session lookup; entries expire
+# after the auth_session_cache_ttl setting. logout and refresh drop the old
+# token locally and record its hash in dbo.RevokedSessions; every worker
+# reads the new hashes at most every AUTH_SESSION_REVOCATION_CHECK_SECS and
+# drops just those tokens, so the rest of its cache stays warm.
+SESSION_REVOCATION_CHECK_SECS = float(os.getenv('AUTH_SESSION_REVOCATION_CHECK_SECS', 5))
+# Each poll re-reads this much of the previous window, so a revocation whose
+# transaction committed late is still seen.
+_REVOCATION_OVERLAP_SECS = 60
+_session_cache_size = int(os.getenv('AUTH_SESSION_CACHE_SIZE', 10000))
+_session_cache = OrderedDict()
+_session_cache_lock = threading.Lock()
+_revocations_lock = threading.Lock()
+_revocations_checked_at = 0.0
+_revocations_since = datetime.datetime.utcnow() - datetime.timedelta(seconds=_REVOCATION_OVERLAP_SECS)
+
+
+def _token_hash(token):
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+def _session_cache_hit(token):
+    key = _token_hash(token)
+    with _session_cache_lock:
+        expires_at = _session_cache.get(key)
+        if expires_at is None:
+            return False
+        if expires_at < time.monotonic():
+            del _session_cache[key]
+            return False
+        _session_cache.move_to_end(key)
+        return True
+
+
+def _remember_session(token, session=None):
+    ttl = get_setting('auth_session_cache_ttl', session)
+    if ttl <= 0:
+        return
+    key = _token_hash(token)
+    with _session_cache_lock:
+        _session_cache[key] = time.monotonic() + ttl
+        _session_cache.move_to_end(key)
+        while len(_session_cache) > _session_cache_size:
+            _session_cache.popitem(last=False)
+
+
+def invalidate_cached_session(token):
+    with _session_cache_lock:
+        _session_cache.pop(_token_hash(token), None)
+
+
+def clear_session_cache():
+    with _session_cache_lock:
+        _session_cache.clear()
+
+
+def _apply_revocations(session):
+    """Drop the tokens other workers revoked since the last poll; polls at most every SESSION_REVOCATION_CHECK_SECS."""
+    global _revocations_checked_at, _revocations_since
+    now = time.monotonic()
+    if now - _revocations_checked_at < SESSION_REVOCATION_CHECK_SECS:
+        return
+    with _revocations_lock:
+        if now - _revocations_checked_at < SESSION_REVOCATION_CHECK_SECS:
+            return
+        _revocations_checked_at = now
+        polled_at = datetime.datetime.utcnow()
+        try:
+            with cache_fill():
+                rows = session.query(RevokedSession.token_hash).filter(
+                    RevokedSession.revoked_at >= _revocations_since
+                ).all()
+        except Exception as e:
+            # Before the migration ran; entries still expire after the TTL.
+            print(f"Session revocation check failed: {e}")
+            return
+        _revocations_since = polled_at - datetime.timedelta(seconds=_REVOCATION_OVERLAP_SECS)
+    with _session_cache_lock:
+        for row in rows:
+            _session_cache.pop(row.token_hash.strip(), None)
+
+
+def _revoke_session(session, token):
+    """Record token's revocation in the caller's transaction (the caller commits) and prune old ones.
+
+    A row is only needed until every worker's cache entry for the token
+    has expired, so rows older than the cache TTL plus the poll overlap go.
+    """
+    session.add(RevokedSession(token_hash=_token_hash(token)))
+    retention = get_setting('auth_session_cache_ttl', session) + 2 * _REVOCATION_OVERLAP_SECS
+    session.query(RevokedSession).filter(
+        RevokedSession.revoked_at < datetime.datetime.utcnow() - datetime.timedelta(seconds=retention)
+    ).delete(synchronize_session=False)
+
 
 class JWTValidator:
     def __init__(self, jwt_secret, issuer=None, audience=None):
@@ -26,6 +124,7 @@ class JWTValidator:
 
     # Convert query result to DataFrame with headers
     def query_result_to_dataframe(self, cursor, data):
+        import pandas as pd
         if data is None:
             return pd.DataFrame()
         columns = [desc[0] for desc in cursor.description]
@@ -56,6 +155,8 @@ class JWTValidator:
         return token
 
     def get_public_keys(self):
+        # Only the Azure AD (no shared secret) path needs these.
+        import requests
         try:
             JWK_URL = f"https://login.microsoftonline.com/{self.tenant_id}/discovery/v2.0/keys"
             response = requests.get(JWK_URL)
@@ -66,6 +167,10 @@ class JWTValidator:
             return []
 
     def jwk_to_pem(self, jwk):
+        import rsa
+        from cryptography.hazmat.backends import default_backend
+        from cryptography.hazmat.primitives import serialization
+
         def base64url_decode(input):
             input += '=' * (4 - len(input) % 4)
             return base64.urlsafe_b64decode(input)
@@ -112,30 +217,43 @@ class JWTValidator:
             raise
 
     def token_validation(self, request):
+        _, message = self.authenticate_request(request)
+        return message
+
+    def authenticate_request(self, request):
+        """Verify the bearer token and its App_Session once.
+
+        Returns (claims, "Access granted") on success and (None, reason)
+        otherwise, so callers can keep the decoded claims for the request.
+        """
         auth_header = request.headers.get("Authorization")
 
         if auth_header is None:
-            return "Authorization header is missing"
+            return None, "Authorization header is missing"
 
         if not re.match(r"^Bearer\s[\w-]+\.[\w-]+\.[\w-]+$", auth_header):
-            return "Invalid Authorization header format. Expected format: 'Bearer <token>'"
+            return None, "Invalid Authorization header format. Expected format: 'Bearer <token>'"
 
         try:
             token = auth_header.split(" ")[1]
-            self.validate_jwt(token)
+            decoded = self.validate_jwt(token)
             db = SQLiteDB()
             session = db.connect()
             if not session:
-                return "Database connection failed"
+                return None, "Database connection failed"
             try:
+                _apply_revocations(session)
+                if _session_cache_hit(token):
+                    return decoded, "Access granted"
                 active_session = session.query(AppSession).filter_by(token=token).first()
                 if not active_session:
-                    return "Session is not active"
+                    return None, "Session is not active"
+                _remember_session(token, session)
             finally:
                 session.close()
-            return "Access granted"
+            return decoded, "Access granted"
         except Exception as e:
-            return str(e)
+            return None, str(e)
 
     def login(self, data):
         session = None
@@ -250,7 +368,9 @@ class JWTValidator:
                 new_token = new_token.decode('utf-8')
             session_row.token = new_token
             session_row.expires_at = None
+            _revoke_session(session, token)
             session.commit()
+            invalidate_cached_session(token)
 
             institute = None
             if user.institute_id:
@@ -296,7 +416,9 @@ class JWTValidator:
             session_data = session.query(AppSession).filter_by(token=token).first()
             if session_data:
                 session.delete(session_data)
+                _revoke_session(session, token)
                 session.commit()
+            invalidate_cached_session(token)
             return {"status": True, "message": "Logout successful"}, 200
         except (jwt.ExpiredSignatureError, jwt.InvalidTokenError) as e:
             return {"status": False, "message": str(e) or "Invalid or expired token"}, 401
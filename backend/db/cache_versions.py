@@ -0,0 +1,68 @@
+import datetime
+import threading
+import time
+
+from db.db import get_session_factory
+from db.metrics import cache_fill
+from db.models import CacheVersion
+
+
+def get_cache_version(session, name):
+    row = session.query(CacheVersion.version).filter(CacheVersion.name == name).first()
+    return int(row[0]) if row else 0
+
+
+def bump_cache_version(session, name):
+    """Increment a version stamp in the caller's transaction; the caller commits."""
+    updated = session.query(CacheVersion).filter(CacheVersion.name == name).update(
+        {CacheVersion.version: CacheVersion.version + 1, CacheVersion.updated_at: datetime.datetime.utcnow()},
+        synchronize_session=False
+    )
+    if not updated:
+        session.add(CacheVersion(name=name, version=1, updated_at=datetime.datetime.utcnow()))
+
+
+class VersionWatcher:
+    """Polls one version stamp at most every check_interval seconds.
+
+    changed() returns True once each time another worker has bumped the
+    stamp, so the owner can drop its in-process cache. Lookup failures
+    (for example before the migration ran) are treated as "unchanged".
+    Without a session the check uses a private one, never the request's,
+    so it cannot touch the caller's uncommitted work.
+    """
+
+    def __init__(self, name, check_interval=5.0):
+        self.name = name
+        self.check_interval = check_interval
+        self._version = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def mark_current(self, version):
+        with self._lock:
+            self._version = version
+            self._checked_at = time.monotonic()
+
+    def changed(self, session=None):
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return False
+        with self._lock:
+            if now - self._checked_at < self.check_interval:
+                return False
+            self._checked_at = now
+            owns_session = session is None
+            if owns_session:
+                session = get_session_factory()()
+            try:
+                with cache_fill():
+                    version = get_cache_version(session, self.name)
+            except Exception as e:
+                print(f"Cache version check failed for {self.name}: {e}")
+                return False
+            finally:
+                if owns_session and session:
+                    session.close()
+            previous, self._version = self._version, version
+            return previous is not None and previous != version
@@ -1,71 +1,221 @@
 # Python flask API file for edu using SQLAlchemy
 
 from sqlalchemy import create_engine, text
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, scoped_session, sessionmaker
+from sqlalchemy.pool import QueuePool
 from urllib.parse import quote_plus
 import os
+import threading
 from dotenv import load_dotenv
+from db.metrics import install_query_hooks
 
 _backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 load_dotenv(os.path.join(_backend_dir, ".env"))
 
-class SQLiteDB:
-    def __init__(self):
-        environment_flag = os.getenv('environment_flag')
-        if environment_flag == 'local':
-            server = 'localhost'
-            database = 'actual-result-prod'
-            driver = 'ODBC Driver 17 for SQL Server'
-
-            # Windows Authentication
-            db_url = f"mssql+pyodbc://@{server}/{database}?driver={driver}&trusted_connection=yes"
-        else:
-            server = os.getenv('SQL_SERVER', 'localhost')  # e.g., localhost\SQLEXPRESS
-            database = os.getenv('SQL_DATABASE', 'actual-result-prod')
-            username = os.getenv('SQL_USER', 'sa')
-            password = os.getenv('SQL_PASSWORD', 'YourStrong!Passw0rd')
-            req_driver = os.getenv('DRIVER', 'ODBC Driver 17 for SQL Server')
-            driver = req_driver
-            try:
-                import pyodbc
-                available = pyodbc.drivers()
-                if req_driver not in available:
-                    odbc_drivers = [d for d in available if d.startswith('ODBC Driver')]
-                    sql_drivers = [d for d in available if 'sql server' in d.lower()]
-                    candidates = odbc_drivers if odbc_drivers else sql_drivers
-                    if candidates:
-                        candidates.sort(reverse=True)
-                        driver = candidates[0]
-                        print(f"Driver '{req_driver}' not found. Auto-selected installed driver: '{driver}'")
-                    else:
-                        print(f"WARNING: No SQL Server driver found. Available drivers: {available}")
-            except Exception as _d_err:
-                pass
-
-            # SQL Server connection string
-            params = quote_plus(
-                f"DRIVER={{{driver}}};"
-                f"SERVER={server};"
-                f"DATABASE={database};"
-                f"UID={username};"
-                f"PWD={password};"
-                "TrustServerCertificate=yes;"
+# One engine (and therefore one connection pool) per process. Every
+# SQLiteDB() instance shares it; it is built on first use so importing this
+# module never opens a connection.
+_engine = None
+_session_factory = None
+_request_session_factory = None
+_engine_lock = threading.Lock()
+
+# Request-scoped session registry. app.py opens the scope in before_request
+# and releases it in teardown_appcontext; while it is open every
+# SQLiteDB().connect() on that thread returns the same session.
+_request_scope = threading.local()
+_request_sessions = scoped_session(lambda: get_request_session_factory()())
+
+
+class RequestSession(Session):
+    """Session shared by all handlers that run within one Flask request.
+
+    Handler code was written to own its session and close it, but a nested
+    helper's close() must not discard the work its caller has not committed
+    yet, so close() does nothing here. Handlers commit what they mean to
+    keep, and a commit or rollback anywhere in the request applies to all of
+    the request's pending work. Whatever is still pending when the request
+    ends is rolled back by end_request_session().
+    """
+
+    def close(self):
+        pass
+
+    def release(self):
+        super().close()
+
+
+def _env_int(name, default):
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _env_bool(name, default):
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return str(value).strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def _build_db_url():
+    environment_flag = os.getenv('environment_flag')
+    if environment_flag == 'local':
+        server = 'localhost'
+        database = 'actual-result-prod'
+        driver = 'ODBC Driver 17 for SQL Server'
+
+        # Windows Authentication
+        db_url = f"mssql+pyodbc://@{server}/{database}?driver={driver}&trusted_connection=yes"
+    else:
+        server = os.getenv('SQL_SERVER', 'localhost')  # e.g., localhost\SQLEXPRESS
+        database = os.getenv('SQL_DATABASE', 'actual-result-prod')
+        username = os.getenv('SQL_USER', 'sa')
+        password = os.getenv('SQL_PASSWORD', 'YourStrong!Passw0rd')
+        req_driver = os.getenv('DRIVER', 'ODBC Driver 17 for SQL Server')
+        driver = req_driver
+        try:
+            import pyodbc
+            available = pyodbc.drivers()
+            if req_driver not in available:
+                odbc_drivers = [d for d in available if d.startswith('ODBC Driver')]
+                sql_drivers = [d for d in available if 'sql server' in d.lower()]
+                candidates = odbc_drivers if odbc_drivers else sql_drivers
+                if candidates:
+                    candidates.sort(reverse=True)
+                    driver = candidates[0]
+                    print(f"Driver '{req_driver}' not found. Auto-selected installed driver: '{driver}'")
+                else:
+                    print(f"WARNING: No SQL Server driver found. Available drivers: {available}")
+        except Exception as _d_err:
+            pass
+
+        # SQL Server connection string
+        params = quote_plus(
+            f"DRIVER={{{driver}}};"
+            f"SERVER={server};"
+            f"DATABASE={database};"
+            f"UID={username};"
+            f"PWD={password};"
+            "TrustServerCertificate=yes;"
+        )
+
+        db_url = f"mssql+pyodbc:///?odbc_connect={params}"
+
+    print(f"Connecting to SQL Server at {server}, database {database}")
+    return db_url
+
+
+def get_engine():
+    """Return the process-wide engine, creating it on first use.
+
+    Pool sizing is read from the environment once:
+    DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT (seconds),
+    DB_POOL_RECYCLE (seconds, -1 disables), DB_POOL_PRE_PING and
+    DB_FAST_EXECUTEMANY.
+    """
+    global _engine, _session_factory, _request_session_factory
+    if _engine is not None:
+        return _engine
+    with _engine_lock:
+        if _engine is None:
+            engine = create_engine(
+                _build_db_url(),
+                echo=False,
+                future=True,
+                poolclass=QueuePool,
+                pool_size=_env_int('DB_POOL_SIZE', 10),
+                max_overflow=_env_int('DB_MAX_OVERFLOW', 20),
+                pool_timeout=_env_int('DB_POOL_TIMEOUT', 30),
+                pool_recycle=_env_int('DB_POOL_RECYCLE', 1800),
+                pool_pre_ping=_env_bool('DB_POOL_PRE_PING', True),
+                # Send executemany batches (bulk updates) in one round trip.
+                fast_executemany=_env_bool('DB_FAST_EXECUTEMANY', True),
             )
+            install_query_hooks(engine)
+            _session_factory = sessionmaker(bind=engine)
+            _request_session_factory = sessionmaker(bind=engine, class_=RequestSession)
+            _engine = engine
+    return _engine
+
+
+def get_session_factory():
+    get_engine()
+    return _session_factory
+
+
+def get_request_session_factory():
+    get_engine()
+    return _request_session_factory
+
+
+def begin_request_session():
+    """Open the request scope; the session itself is created on first use."""
+    _request_scope.active = True
+
 
-            db_url = f"mssql+pyodbc:///?odbc_connect={params}"
+def end_request_session():
+    """Roll back anything left uncommitted and return the connection to the pool."""
+    _request_scope.active = False
+    if not _request_sessions.registry.has():
+        return
+    session = _request_sessions()
+    try:
+        session.rollback()
+    except Exception as e:
+        print(f"Error finishing request session: {e}")
+    finally:
+        session.release()
+        _request_sessions.remove()
 
 
-        print(f"Connecting to SQL Server at {server}, database {database}")
+def in_request_scope():
+    return getattr(_request_scope, 'active', False)
 
-        self.engine = create_engine(db_url, echo=False, future=True)
-        self.Session = sessionmaker(bind=self.engine)
+
+def pool_stats():
+    """Snapshot of the shared pool; all zeros before the engine exists."""
+    if _engine is None:
+        return {"size": 0, "checked_in": 0, "checked_out": 0, "overflow": 0, "status": "not initialized"}
+    pool = _engine.pool
+    return {
+        "size": pool.size(),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": pool.overflow(),
+        "status": pool.status(),
+    }
+
+
+def dispose_engine(close=True):
+    """Drop pooled connections. A forked child passes close=False: the
+    connections it inherited belong to the parent and must not be closed
+    from the child."""
+    if _engine is not None:
+        _engine.dispose(close=close)
+
+
+if hasattr(os, 'register_at_fork'):
+    # Pre-fork servers (gunicorn --preload) fork after the engine may exist;
+    # each child opens its own connections instead of sharing the parent's.
+    os.register_at_fork(after_in_child=lambda: dispose_engine(close=False))
+
+
+class SQLiteDB:
+    def __init__(self):
+        self.engine = get_engine()
+        self.Session = get_session_factory()
         self.session = None
 
     def connect(self):
         if self.session:
             return self.session
         try:
-            self.session = self.Session()
+            if in_request_scope():
+                self.session = _request_sessions()
+            else:
+                self.session = self.Session()
             return self.session
         except Exception as e:
             print(f"Error connecting to the database: {e}")
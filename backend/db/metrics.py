@@ -0,0 +1,233 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import jsonify
+from sqlalchemy import event
+
+# Per-request SQL statistics collected from engine cursor events, plus
+# per-endpoint histograms rendered in Prometheus text format by /metrics.
+# Everything here is per process; each worker exposes its own series.
+
+SLOW_QUERY_MS = float(os.getenv('DB_SLOW_QUERY_MS', 500))
+# Default ceiling on how often one parameterized statement may run in a
+# request before it is reported as an N+1 pattern.
+DEFAULT_MAX_REPEATS = int(os.getenv('QUERY_BUDGET_MAX_REPEATS', 10))
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+DB_TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_request_stats = threading.local()
+_histograms_lock = threading.Lock()
+_histograms = {}
+_metrics_providers = []
+
+
+class RequestStats:
+    def __init__(self, endpoint=None):
+        self.endpoint = endpoint
+        self.queries = 0
+        self.total_seconds = 0.0
+        self.slowest_seconds = 0.0
+        self.slowest_statement = None
+        self.statement_counts = {}
+        # Statements run inside cache_fill(); counted, but not budgeted.
+        self.cache_fill_queries = 0
+        self.cache_fill_depth = 0
+
+    @property
+    def budgeted_queries(self):
+        return self.queries - self.cache_fill_queries
+
+    def most_repeated(self):
+        if not self.statement_counts:
+            return None, 0
+        return max(self.statement_counts.items(), key=lambda item: item[1])
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, upper in enumerate(self.buckets):
+            if value <= upper:
+                self.counts[i] += 1
+        self.total += 1
+        self.sum += value
+
+
+def _statement_preview(statement, limit=300):
+    statement = ' '.join(str(statement).split())
+    return statement if len(statement) <= limit else statement[:limit] + '...'
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start_time', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('query_start_time')
+    if not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    stats = getattr(_request_stats, 'current', None)
+    if stats is not None:
+        stats.queries += 1
+        stats.total_seconds += elapsed
+        if stats.cache_fill_depth:
+            stats.cache_fill_queries += 1
+        # Cache fills still count towards repeats: a fill that runs the same
+        # statement per item is an N+1 like any other.
+        stats.statement_counts[statement] = stats.statement_counts.get(statement, 0) + 1
+        if elapsed > stats.slowest_seconds:
+            stats.slowest_seconds = elapsed
+            stats.slowest_statement = statement
+    if SLOW_QUERY_MS >= 0 and elapsed * 1000 >= SLOW_QUERY_MS:
+        endpoint = stats.endpoint if stats is not None else None
+        print(f"Slow query ({elapsed * 1000:.1f} ms, endpoint={endpoint}): {_statement_preview(statement)}", flush=True)
+
+
+def install_query_hooks(engine):
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+
+def begin_request_stats(endpoint=None):
+    _request_stats.current = RequestStats(endpoint)
+    return _request_stats.current
+
+
+def current_request_stats():
+    return getattr(_request_stats, 'current', None)
+
+
+@contextmanager
+def cache_fill():
+    """Mark the one-off load of a small per-process cache (settings, version
+    stamps). Its statements are timed, counted and checked for repeats like
+    any other, but not charged to the route's max_queries: they run once per
+    worker and invalidation, not per request. Loads whose cost grows with
+    the data (compiled papers) are charged and belong in the route's budget.
+    """
+    stats = current_request_stats()
+    if stats is None:
+        yield
+        return
+    stats.cache_fill_depth += 1
+    try:
+        yield
+    finally:
+        stats.cache_fill_depth -= 1
+
+
+def end_request_stats():
+    """Detach the thread's stats and record them against their endpoint."""
+    stats = getattr(_request_stats, 'current', None)
+    _request_stats.current = None
+    if stats is None:
+        return None
+    endpoint = stats.endpoint or 'unmatched'
+    with _histograms_lock:
+        series = _histograms.get(endpoint)
+        if series is None:
+            series = _histograms[endpoint] = {
+                'queries': Histogram(QUERY_COUNT_BUCKETS),
+                'seconds': Histogram(DB_TIME_BUCKETS),
+            }
+        series['queries'].observe(stats.queries)
+        series['seconds'].observe(stats.total_seconds)
+    return stats
+
+
+def query_budget(max_queries=None, max_repeats=None):
+    """Declare how many statements a route may issue per request.
+
+    max_queries caps the total statement count and max_repeats caps how
+    often one parameterized statement may repeat (defaults to
+    QUERY_BUDGET_MAX_REPEATS). Statements run inside cache_fill() are not
+    charged to max_queries but still count as repeats. The app checks the
+    budget after each edu request with enforce_query_budget: it always logs
+    a violation, and fails the request when QUERY_BUDGET_ENFORCE is on (the
+    test-suite setting).
+    """
+    def decorator(f):
+        f._query_budget = {"max_queries": max_queries, "max_repeats": max_repeats}
+        return f
+    return decorator
+
+
+def budget_violation(stats, budget=None):
+    """Return a description of the first exceeded limit, or None."""
+    if stats is None:
+        return None
+    budget = budget or {}
+    max_queries = budget.get("max_queries")
+    max_repeats = budget.get("max_repeats") or DEFAULT_MAX_REPEATS
+    if max_queries is not None and stats.budgeted_queries > max_queries:
+        return f"{stats.budgeted_queries} SQL statements exceed the budget of {max_queries}"
+    statement, repeats = stats.most_repeated()
+    if max_repeats and repeats > max_repeats:
+        return f"statement repeated {repeats} times (limit {max_repeats}): {_statement_preview(statement, 200)}"
+    return None
+
+
+def enforce_query_budget(response, endpoint, view, enforce=False):
+    """Check the current request against view's @query_budget.
+
+    A violation is logged; with enforce it also replaces the response with
+    a 500 naming the violation.
+    """
+    violation = budget_violation(current_request_stats(), getattr(view, '_query_budget', None))
+    if not violation:
+        return response
+    print(f"Query budget exceeded on {endpoint}: {violation}", flush=True)
+    if enforce:
+        response = jsonify({"status": False, "statusMessage": f"Query budget exceeded on {endpoint}: {violation}"})
+        response.status_code = 500
+    return response
+
+
+def _format_le(value):
+    return f"{value:g}"
+
+
+def _render_histogram(lines, name, help_text, key):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} histogram")
+    for endpoint, series in sorted(_histograms.items()):
+        hist = series[key]
+        label = endpoint.replace('\\', '\\\\').replace('"', '\\"')
+        for upper, count in zip(hist.buckets, hist.counts):
+            lines.append(f'{name}_bucket{{endpoint="{label}",le="{_format_le(upper)}"}} {count}')
+        lines.append(f'{name}_bucket{{endpoint="{label}",le="+Inf"}} {hist.total}')
+        lines.append(f'{name}_sum{{endpoint="{label}"}} {hist.sum:g}')
+        lines.append(f'{name}_count{{endpoint="{label}"}} {hist.total}')
+
+
+def register_metrics_provider(provider):
+    """Add a callable returning extra exposition lines to /metrics."""
+    if provider not in _metrics_providers:
+        _metrics_providers.append(provider)
+
+
+def render_prometheus():
+    from db.db import pool_stats
+
+    lines = []
+    with _histograms_lock:
+        _render_histogram(lines, 'edu_db_queries_per_request', 'SQL statements issued per request.', 'queries')
+        _render_histogram(lines, 'edu_db_seconds_per_request', 'Time spent in SQL statements per request.', 'seconds')
+    stats = pool_stats()
+    for key in ('size', 'checked_in', 'checked_out', 'overflow'):
+        lines.append(f"# TYPE edu_db_pool_{key} gauge")
+        lines.append(f"edu_db_pool_{key} {stats[key]}")
+    for provider in list(_metrics_providers):
+        try:
+            lines.extend(provider())
+        except Exception as e:
+            print(f"Metrics provider {getattr(provider, '__name__', provider)} failed: {e}")
+    return "\n".join(lines) + "\n"
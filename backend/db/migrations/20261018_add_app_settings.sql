@@ -0,0 +1,12 @@
+-- Runtime overrides for the tunables served by others/settings.py
+IF OBJECT_ID('dbo.AppSettings', 'U') IS NULL
+BEGIN
+    CREATE TABLE dbo.AppSettings (
+        name NVARCHAR(100) NOT NULL CONSTRAINT PK_AppSettings PRIMARY KEY,
+        value NVARCHAR(255) NOT NULL,
+        updated_by UNIQUEIDENTIFIER NULL,
+        updated_at DATETIME2 NOT NULL CONSTRAINT DF_AppSettings_updated_at DEFAULT SYSUTCDATETIME(),
+        CONSTRAINT FK_AppSettings_updated_by FOREIGN KEY (updated_by) REFERENCES dbo.Users (user_id)
+    );
+END;
+GO
@@ -0,0 +1,7 @@
+-- Incremental autosave: last client revision applied to an attempt
+IF COL_LENGTH('dbo.Exam_Attempts', 'autosave_revision') IS NULL
+BEGIN
+    ALTER TABLE dbo.Exam_Attempts
+    ADD autosave_revision INT NULL;
+END;
+GO
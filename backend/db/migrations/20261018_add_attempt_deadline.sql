@@ -0,0 +1,28 @@
+-- Stored attempt deadline used by the expired-attempt sweeper
+IF COL_LENGTH('dbo.Exam_Attempts', 'deadline_at') IS NULL
+BEGIN
+    ALTER TABLE dbo.Exam_Attempts
+    ADD deadline_at DATETIME2 NULL;
+END;
+GO
+
+-- Backfill attempts that were already running when the column was added
+UPDATE a
+SET deadline_at = CASE
+    WHEN e.duration_mins > 0 AND (s.end_time IS NULL OR DATEADD(MINUTE, e.duration_mins, a.started_date) < s.end_time)
+        THEN DATEADD(MINUTE, e.duration_mins, a.started_date)
+    ELSE s.end_time
+END
+FROM dbo.Exam_Attempts a
+JOIN dbo.ExamSchedules s ON s.schedule_id = a.schedule_id
+JOIN dbo.Exams e ON e.exam_id = s.exam_id
+WHERE a.status = 'in_progress'
+  AND a.deadline_at IS NULL
+  AND a.started_date IS NOT NULL;
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_Exam_Attempts_status_deadline' AND object_id = OBJECT_ID('dbo.Exam_Attempts'))
+BEGIN
+    CREATE INDEX IX_Exam_Attempts_status_deadline ON dbo.Exam_Attempts (status, deadline_at);
+END;
+GO
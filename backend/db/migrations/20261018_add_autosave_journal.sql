@@ -0,0 +1,13 @@
+-- Write-behind autosave staging, flushed into dbo.Answers in batches
+IF OBJECT_ID('dbo.AutosaveJournal', 'U') IS NULL
+BEGIN
+    CREATE TABLE dbo.AutosaveJournal (
+        entry_id BIGINT IDENTITY(1,1) NOT NULL CONSTRAINT PK_AutosaveJournal PRIMARY KEY,
+        attempt_id VARCHAR(255) NOT NULL,
+        revision INT NOT NULL,
+        changes NVARCHAR(MAX) NOT NULL,
+        created_date DATETIME2 NOT NULL CONSTRAINT DF_AutosaveJournal_created_date DEFAULT SYSUTCDATETIME()
+    );
+    CREATE INDEX IX_AutosaveJournal_attempt ON dbo.AutosaveJournal (attempt_id, entry_id);
+END;
+GO
@@ -0,0 +1,23 @@
+-- Durable job queue used for background evaluation and other deferred work
+IF OBJECT_ID('dbo.BackgroundJobs', 'U') IS NULL
+BEGIN
+    CREATE TABLE dbo.BackgroundJobs (
+        job_id UNIQUEIDENTIFIER NOT NULL CONSTRAINT PK_BackgroundJobs PRIMARY KEY DEFAULT NEWID(),
+        job_type VARCHAR(50) NOT NULL,
+        target_id VARCHAR(255) NULL,
+        payload NVARCHAR(MAX) NULL,
+        status VARCHAR(20) NOT NULL CONSTRAINT DF_BackgroundJobs_status DEFAULT ('queued')
+            CONSTRAINT CK_BackgroundJobs_status CHECK (status IN ('queued', 'running', 'done', 'failed')),
+        attempts INT NOT NULL CONSTRAINT DF_BackgroundJobs_attempts DEFAULT (0),
+        run_after DATETIME2 NOT NULL CONSTRAINT DF_BackgroundJobs_run_after DEFAULT SYSUTCDATETIME(),
+        locked_by VARCHAR(255) NULL,
+        locked_at DATETIME2 NULL,
+        last_error NVARCHAR(MAX) NULL,
+        result NVARCHAR(MAX) NULL,
+        created_date DATETIME2 NOT NULL CONSTRAINT DF_BackgroundJobs_created_date DEFAULT SYSUTCDATETIME(),
+        updated_date DATETIME2 NULL
+    );
+    CREATE INDEX IX_BackgroundJobs_claim ON dbo.BackgroundJobs (status, run_after);
+    CREATE INDEX IX_BackgroundJobs_target ON dbo.BackgroundJobs (job_type, target_id);
+END;
+GO
@@ -0,0 +1,10 @@
+-- Version stamps used to invalidate per-worker in-memory caches
+IF OBJECT_ID('dbo.CacheVersions', 'U') IS NULL
+BEGIN
+    CREATE TABLE dbo.CacheVersions (
+        name NVARCHAR(100) NOT NULL CONSTRAINT PK_CacheVersions PRIMARY KEY,
+        version INT NOT NULL CONSTRAINT DF_CacheVersions_version DEFAULT (0),
+        updated_at DATETIME2 NOT NULL CONSTRAINT DF_CacheVersions_updated_at DEFAULT SYSUTCDATETIME()
+    );
+END;
+GO
@@ -0,0 +1,14 @@
+-- Content-addressed cache of descriptive answer evaluations
+IF OBJECT_ID('dbo.EvaluationCache', 'U') IS NULL
+BEGIN
+    CREATE TABLE dbo.EvaluationCache (
+        cache_key CHAR(64) NOT NULL CONSTRAINT PK_EvaluationCache PRIMARY KEY,
+        model VARCHAR(100) NOT NULL,
+        prompt_version VARCHAR(50) NOT NULL,
+        result NVARCHAR(MAX) NOT NULL,
+        hits INT NOT NULL CONSTRAINT DF_EvaluationCache_hits DEFAULT (0),
+        created_date DATETIME2 NOT NULL CONSTRAINT DF_EvaluationCache_created_date DEFAULT SYSUTCDATETIME(),
+        last_hit_date DATETIME2 NULL
+    );
+END;
+GO
@@ -0,0 +1,11 @@
+-- Token buckets for OpenAI calls, shared by every worker (one row per scope)
+IF OBJECT_ID('dbo.LLMRateBuckets', 'U') IS NULL
+BEGIN
+    CREATE TABLE dbo.LLMRateBuckets (
+        scope NVARCHAR(64) NOT NULL CONSTRAINT PK_LLMRateBuckets PRIMARY KEY,
+        requests_level FLOAT NOT NULL,
+        tokens_level FLOAT NOT NULL,
+        updated_at DATETIME2 NOT NULL CONSTRAINT DF_LLMRateBuckets_updated_at DEFAULT SYSUTCDATETIME()
+    );
+END;
+GO
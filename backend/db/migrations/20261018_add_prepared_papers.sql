@@ -0,0 +1,22 @@
+-- Optional per-schedule mode: question sets drawn ahead of start_time
+IF COL_LENGTH('dbo.ExamSchedules', 'pregenerate_papers') IS NULL
+BEGIN
+    ALTER TABLE dbo.ExamSchedules
+        ADD pregenerate_papers BIT NOT NULL
+            CONSTRAINT DF_ExamSchedules_pregenerate_papers DEFAULT (0) WITH VALUES;
+END;
+GO
+
+IF OBJECT_ID('dbo.PreparedPapers', 'U') IS NULL
+BEGIN
+    CREATE TABLE dbo.PreparedPapers (
+        paper_id UNIQUEIDENTIFIER NOT NULL CONSTRAINT PK_PreparedPapers PRIMARY KEY DEFAULT NEWID(),
+        schedule_id VARCHAR(255) NOT NULL,
+        user_id VARCHAR(255) NOT NULL,
+        exam_id VARCHAR(255) NOT NULL,
+        question_ids NVARCHAR(MAX) NOT NULL,
+        created_date DATETIME2 NOT NULL CONSTRAINT DF_PreparedPapers_created_date DEFAULT SYSUTCDATETIME(),
+        CONSTRAINT UX_PreparedPapers_schedule_user UNIQUE (schedule_id, user_id)
+    );
+END;
+GO
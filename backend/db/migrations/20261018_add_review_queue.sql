@@ -0,0 +1,59 @@
+-- Maintained queue of AI-graded descriptive answers for manual review
+IF OBJECT_ID('dbo.ReviewQueue', 'U') IS NULL
+BEGIN
+    CREATE TABLE dbo.ReviewQueue (
+        answer_id UNIQUEIDENTIFIER NOT NULL CONSTRAINT PK_ReviewQueue PRIMARY KEY,
+        schedule_id UNIQUEIDENTIFIER NOT NULL,
+        attempt_id UNIQUEIDENTIFIER NOT NULL,
+        question_id UNIQUEIDENTIFIER NOT NULL,
+        user_id UNIQUEIDENTIFIER NOT NULL,
+        institute_id UNIQUEIDENTIFIER NULL,
+        ai_confidence INT NULL,
+        manual_review_required INT NOT NULL CONSTRAINT DF_ReviewQueue_manual_review_required DEFAULT (0),
+        reviewed INT NOT NULL CONSTRAINT DF_ReviewQueue_reviewed DEFAULT (0),
+        reviewed_by UNIQUEIDENTIFIER NULL,
+        reviewed_date DATETIME2 NULL,
+        created_date DATETIME2 NOT NULL CONSTRAINT DF_ReviewQueue_created_date DEFAULT SYSUTCDATETIME(),
+        updated_date DATETIME2 NOT NULL CONSTRAINT DF_ReviewQueue_updated_date DEFAULT SYSUTCDATETIME(),
+        CONSTRAINT FK_ReviewQueue_answer FOREIGN KEY (answer_id) REFERENCES dbo.Answers (answer_id),
+        CONSTRAINT FK_ReviewQueue_schedule FOREIGN KEY (schedule_id) REFERENCES dbo.ExamSchedules (schedule_id),
+        CONSTRAINT FK_ReviewQueue_attempt FOREIGN KEY (attempt_id) REFERENCES dbo.Exam_Attempts (attempt_id)
+    );
+END;
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_ReviewQueue_confidence' AND object_id = OBJECT_ID('dbo.ReviewQueue'))
+BEGIN
+    CREATE INDEX IX_ReviewQueue_confidence ON dbo.ReviewQueue (reviewed, ai_confidence);
+END;
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_ReviewQueue_schedule' AND object_id = OBJECT_ID('dbo.ReviewQueue'))
+BEGIN
+    CREATE INDEX IX_ReviewQueue_schedule ON dbo.ReviewQueue (schedule_id, reviewed, ai_confidence);
+END;
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_ReviewQueue_attempt' AND object_id = OBJECT_ID('dbo.ReviewQueue'))
+BEGIN
+    CREATE INDEX IX_ReviewQueue_attempt ON dbo.ReviewQueue (attempt_id);
+END;
+GO
+
+-- Backfill answers graded before the queue existed; marks edited by an
+-- instructor (MarksHistory) count as reviewed.
+INSERT INTO dbo.ReviewQueue (answer_id, schedule_id, attempt_id, question_id, user_id, institute_id,
+                             ai_confidence, manual_review_required, reviewed)
+SELECT
+    a.answer_id, t.schedule_id, a.attempt_id, a.question_id, a.user_id, e.institute_id,
+    a.ai_confidence, ISNULL(a.manual_review_required, 0),
+    CASE WHEN EXISTS (SELECT 1 FROM dbo.MarksHistory h WHERE h.answer_id = a.answer_id) THEN 1 ELSE 0 END
+FROM dbo.Answers a
+JOIN dbo.Questions q ON q.question_id = a.question_id
+JOIN dbo.Exam_Attempts t ON t.attempt_id = a.attempt_id
+JOIN dbo.ExamSchedules s ON s.schedule_id = t.schedule_id
+JOIN dbo.Exams e ON e.exam_id = s.exam_id
+WHERE q.question_type = 'descriptive'
+  AND a.is_validated = 1
+  AND NOT EXISTS (SELECT 1 FROM dbo.ReviewQueue r WHERE r.answer_id = a.answer_id);
+GO
@@ -0,0 +1,11 @@
+-- Hashes of logged-out and refreshed tokens, polled by every worker's session cache
+IF OBJECT_ID('dbo.RevokedSessions', 'U') IS NULL
+BEGIN
+    CREATE TABLE dbo.RevokedSessions (
+        revocation_id BIGINT IDENTITY(1,1) NOT NULL CONSTRAINT PK_RevokedSessions PRIMARY KEY,
+        token_hash CHAR(64) NOT NULL,
+        revoked_at DATETIME2 NOT NULL CONSTRAINT DF_RevokedSessions_revoked_at DEFAULT SYSUTCDATETIME()
+    );
+    CREATE INDEX IX_RevokedSessions_revoked_at ON dbo.RevokedSessions (revoked_at) INCLUDE (token_hash);
+END;
+GO
@@ -0,0 +1,28 @@
+-- Per-schedule assigned/finished counters for the after_everyone_finishes review mode
+IF OBJECT_ID('dbo.ScheduleCompletions', 'U') IS NULL
+BEGIN
+    CREATE TABLE dbo.ScheduleCompletions (
+        schedule_id UNIQUEIDENTIFIER NOT NULL CONSTRAINT PK_ScheduleCompletions PRIMARY KEY,
+        assigned_users INT NOT NULL CONSTRAINT DF_ScheduleCompletions_assigned_users DEFAULT (0),
+        finished_users INT NOT NULL CONSTRAINT DF_ScheduleCompletions_finished_users DEFAULT (0),
+        updated_date DATETIME2 NOT NULL CONSTRAINT DF_ScheduleCompletions_updated_date DEFAULT SYSUTCDATETIME(),
+        CONSTRAINT FK_ScheduleCompletions_schedule FOREIGN KEY (schedule_id) REFERENCES dbo.ExamSchedules (schedule_id)
+    );
+END;
+GO
+
+-- Backfill existing schedules with the same counts is_after_everyone_finished_available used to compute
+INSERT INTO dbo.ScheduleCompletions (schedule_id, assigned_users, finished_users)
+SELECT
+    s.schedule_id,
+    (SELECT COUNT(DISTINCT m.user_id)
+     FROM dbo.ExamScheduleMapping m
+     WHERE m.schedule_id = s.schedule_id AND m.user_id IS NOT NULL),
+    (SELECT COUNT(DISTINCT a.user_id)
+     FROM dbo.Exam_Attempts a
+     WHERE a.schedule_id = s.schedule_id
+       AND (a.submitted_date IS NOT NULL OR a.status IN ('submitted', 'evaluated'))
+       AND a.user_id IN (SELECT m.user_id FROM dbo.ExamScheduleMapping m WHERE m.schedule_id = s.schedule_id))
+FROM dbo.ExamSchedules s
+WHERE NOT EXISTS (SELECT 1 FROM dbo.ScheduleCompletions c WHERE c.schedule_id = s.schedule_id);
+GO
@@ -1,6 +1,6 @@
 import uuid
 from sqlalchemy import (
-     Column, Date, String, Integer, Boolean, DateTime, ForeignKey, Text, CheckConstraint, UniqueConstraint, Float
+     Column, Date, String, Integer, BigInteger, Boolean, DateTime, ForeignKey, Text, CheckConstraint, UniqueConstraint, Float, Index
 )
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.dialects.mssql import UNIQUEIDENTIFIER
@@ -284,6 +284,8 @@ class ExamSchedule(Base):
      show_correct_answers = Column(Boolean, default=True)
      show_student_answers = Column(Boolean, default=True)
      show_explanations = Column(Boolean, default=True)
+     # Materialize each assigned user's question set shortly before start_time.
+     pregenerate_papers = Column(Boolean, nullable=False, default=False)
      created_by = Column(String)
      created_date = Column(DateTime, default=datetime.datetime.utcnow)
      updated_by = Column(String)
@@ -383,6 +385,14 @@ class Setting(Base):
      updated_by = Column(String, ForeignKey('Users.user_id'))
      updated_at = Column(DateTime, default=datetime.datetime.utcnow)
 
+class AppSetting(Base):
+     """Runtime override of one tunable from others/settings.py, stored as text."""
+     __tablename__ = 'AppSettings'
+     name = Column(String(100), primary_key=True)
+     value = Column(String(255), nullable=False)
+     updated_by = Column(String, ForeignKey('Users.user_id'))
+     updated_at = Column(DateTime, default=datetime.datetime.utcnow)
+
 class MarksHistory(Base):
      __tablename__ = 'MarksHistory'
      history_id = Column(UNIQUEIDENTIFIER, primary_key=True, default=generate_uuid)
@@ -396,6 +406,7 @@ class MarksHistory(Base):
 
 class Exam_Attempt(Base):
     __tablename__ = 'Exam_Attempts'
+    __table_args__ = (Index('IX_Exam_Attempts_status_deadline', 'status', 'deadline_at'),)
     attempt_id = Column(UNIQUEIDENTIFIER, primary_key=True, default=generate_uuid)
     schedule_id = Column(String, ForeignKey('ExamSchedules.schedule_id'), nullable=False)
     user_id = Column(String, ForeignKey('Users.user_id'), nullable=False)
@@ -407,6 +418,11 @@ class Exam_Attempt(Base):
     score = Column(Float, default=0.0)
     percentage = Column(Float)
     feedback = Column(Text)
+    # Highest incremental autosave revision applied; older ones are rejected.
+    autosave_revision = Column(Integer)
+    # Effective time limit fixed at launch: the earlier of started_date plus
+    # the exam duration and the schedule's end_time.
+    deadline_at = Column(DateTime)
 
 class ExamReviewComments(Base):
     __tablename__ = 'ExamReviewComments'
@@ -564,3 +580,111 @@ class ExamsTeams(Base):
     team_id = Column(String)
     created_by = Column(String)
     created_date = Column(DateTime, default=datetime.datetime.utcnow)
+
+class CacheVersion(Base):
+    """Version stamp bumped by any worker to invalidate in-process caches."""
+    __tablename__ = 'CacheVersions'
+    name = Column(String(100), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+class PreparedPaper(Base):
+    """One user's question set for a schedule, drawn once and served on every launch."""
+    __tablename__ = 'PreparedPapers'
+    __table_args__ = (UniqueConstraint('schedule_id', 'user_id', name='UX_PreparedPapers_schedule_user'),)
+    paper_id = Column(UNIQUEIDENTIFIER, primary_key=True, default=generate_uuid)
+    schedule_id = Column(String, ForeignKey('ExamSchedules.schedule_id'), nullable=False)
+    user_id = Column(String, ForeignKey('Users.user_id'), nullable=False)
+    exam_id = Column(String, ForeignKey('Exams.exam_id'), nullable=False)
+    # JSON array of question ids in serving order.
+    question_ids = Column(Text, nullable=False)
+    created_date = Column(DateTime, default=datetime.datetime.utcnow)
+
+class AutosaveJournal(Base):
+    """Append-only autosave staging; entries are folded into Answers in batches."""
+    __tablename__ = 'AutosaveJournal'
+    __table_args__ = (Index('IX_AutosaveJournal_attempt', 'attempt_id', 'entry_id'),)
+    entry_id = Column(BigInteger, primary_key=True, autoincrement=True)
+    attempt_id = Column(String, ForeignKey('Exam_Attempts.attempt_id'), nullable=False)
+    revision = Column(Integer, nullable=False)
+    # JSON object of question_id -> browser answer value.
+    changes = Column(Text, nullable=False)
+    created_date = Column(DateTime, default=datetime.datetime.utcnow)
+
+class RevokedSession(Base):
+    """Hash of a logged-out or refreshed token; workers poll these to drop it from their session caches."""
+    __tablename__ = 'RevokedSessions'
+    __table_args__ = (Index('IX_RevokedSessions_revoked_at', 'revoked_at'),)
+    revocation_id = Column(BigInteger, primary_key=True, autoincrement=True)
+    token_hash = Column(String(64), nullable=False)
+    revoked_at = Column(DateTime, nullable=False, default=datetime.datetime.utcnow)
+
+class EvaluationCacheEntry(Base):
+    """Stored descriptive-answer evaluation, keyed by a hash of everything that shapes the result."""
+    __tablename__ = 'EvaluationCache'
+    cache_key = Column(String(64), primary_key=True)
+    model = Column(String(100), nullable=False)
+    prompt_version = Column(String(50), nullable=False)
+    result = Column(Text, nullable=False)
+    hits = Column(Integer, nullable=False, default=0)
+    created_date = Column(DateTime, default=datetime.datetime.utcnow)
+    last_hit_date = Column(DateTime)
+
+class BackgroundJob(Base):
+    """Durable work item claimed and run by the job workers in others/jobs.py."""
+    __tablename__ = 'BackgroundJobs'
+    __table_args__ = (
+        Index('IX_BackgroundJobs_claim', 'status', 'run_after'),
+        Index('IX_BackgroundJobs_target', 'job_type', 'target_id'),
+    )
+    job_id = Column(UNIQUEIDENTIFIER, primary_key=True, default=generate_uuid)
+    job_type = Column(String(50), nullable=False)
+    target_id = Column(String(255))
+    payload = Column(Text)
+    status = Column(String(20), CheckConstraint("status IN ('queued', 'running', 'done', 'failed')"), nullable=False, default='queued')
+    attempts = Column(Integer, nullable=False, default=0)
+    run_after = Column(DateTime, default=datetime.datetime.utcnow)
+    locked_by = Column(String(255))
+    locked_at = Column(DateTime)
+    last_error = Column(Text)
+    result = Column(Text)
+    created_date = Column(DateTime, default=datetime.datetime.utcnow)
+    updated_date = Column(DateTime)
+
+class ScheduleCompletion(Base):
+    """Assigned and finished student counts per schedule, kept current on submit and mapping changes."""
+    __tablename__ = 'ScheduleCompletions'
+    schedule_id = Column(String, ForeignKey('ExamSchedules.schedule_id'), primary_key=True)
+    assigned_users = Column(Integer, nullable=False, default=0)
+    finished_users = Column(Integer, nullable=False, default=0)
+    updated_date = Column(DateTime, default=datetime.datetime.utcnow)
+
+class ReviewQueueEntry(Base):
+    """An AI-graded descriptive answer, kept for reviewers to work through by confidence."""
+    __tablename__ = 'ReviewQueue'
+    __table_args__ = (
+        Index('IX_ReviewQueue_confidence', 'reviewed', 'ai_confidence'),
+        Index('IX_ReviewQueue_schedule', 'schedule_id', 'reviewed', 'ai_confidence'),
+        Index('IX_ReviewQueue_attempt', 'attempt_id'),
+    )
+    answer_id = Column(UNIQUEIDENTIFIER, ForeignKey('Answers.answer_id'), primary_key=True)
+    schedule_id = Column(String, ForeignKey('ExamSchedules.schedule_id'), nullable=False)
+    attempt_id = Column(String, ForeignKey('Exam_Attempts.attempt_id'), nullable=False)
+    question_id = Column(String, nullable=False)
+    user_id = Column(String, nullable=False)
+    institute_id = Column(String)
+    ai_confidence = Column(Integer)
+    manual_review_required = Column(Integer, nullable=False, default=0)
+    reviewed = Column(Integer, nullable=False, default=0)
+    reviewed_by = Column(String)
+    reviewed_date = Column(DateTime)
+    created_date = Column(DateTime, default=datetime.datetime.utcnow)
+    updated_date = Column(DateTime, default=datetime.datetime.utcnow)
+
+class LLMRateBucket(Base):
+    """Request and token levels of one OpenAI rate-limit scope, shared by every worker."""
+    __tablename__ = 'LLMRateBuckets'
+    scope = Column(String(64), primary_key=True)
+    requests_level = Column(Float, nullable=False)
+    tokens_level = Column(Float, nullable=False)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow)
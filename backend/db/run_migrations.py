@@ -1,6 +1,7 @@
 import os
 import sys
 import glob
+import hashlib
 
 from dotenv import load_dotenv
 
@@ -11,52 +12,164 @@ if backend_dir not in sys.path:
 
 load_dotenv(os.path.join(backend_dir, ".env"))
 
-from sqlalchemy import text
 from db.db import SQLiteDB
 
-def run_migrations():
-    print("Starting database migrations check/execution...")
-    db = SQLiteDB()
-    session = db.connect()
-    if not session:
-        print("Failed to connect to database.")
-        return False
+# Every applied file is recorded in dbo.schema_migrations with its checksum,
+# so a worker that boots against an up-to-date database only runs one SELECT.
+# A file that failed is recorded too (succeeded = 0, with its errors) and is
+# not replayed on every boot, since older scripts are not all safe to re-run.
+# It is retried once its checksum changes (the script was fixed) or an
+# operator deletes its row after repairing the schema by hand. Pending files
+# are applied under an application lock so that concurrent workers never
+# replay DDL at the same time.
+MIGRATION_LOCK_NAME = 'edu_schema_migrations'
+MIGRATION_LOCK_TIMEOUT_MS = int(os.getenv('MIGRATION_LOCK_TIMEOUT_MS', 120000))
+
+CREATE_LEDGER_SQL = """
+IF OBJECT_ID('dbo.schema_migrations', 'U') IS NULL
+BEGIN
+    CREATE TABLE dbo.schema_migrations (
+        filename NVARCHAR(255) NOT NULL CONSTRAINT PK_schema_migrations PRIMARY KEY,
+        checksum CHAR(64) NOT NULL,
+        succeeded BIT NOT NULL,
+        error_message NVARCHAR(MAX) NULL,
+        applied_at DATETIME2 NOT NULL CONSTRAINT DF_schema_migrations_applied_at DEFAULT SYSUTCDATETIME()
+    );
+END;
+"""
+
 
+def _load_migration_files():
     migrations_dir = os.path.join(os.path.dirname(__file__), "migrations")
-    sql_files = sorted(glob.glob(os.path.join(migrations_dir, "*.sql")))
+    migrations = []
+    for filepath in sorted(glob.glob(os.path.join(migrations_dir, "*.sql"))):
+        with open(filepath, "r", encoding="utf-8") as f:
+            content = f.read()
+        checksum = hashlib.sha256(content.encode("utf-8")).hexdigest()
+        migrations.append((os.path.basename(filepath), content, checksum))
+    return migrations
+
+
+def _split_batches(content):
+    # Split script into batches by 'GO' keyword (case-insensitive on its own line)
+    batches = []
+    current_batch = []
+    for line in content.splitlines():
+        if line.strip().upper() == "GO":
+            if current_batch:
+                batches.append("\n".join(current_batch))
+                current_batch = []
+        else:
+            current_batch.append(line)
+    if current_batch:
+        batches.append("\n".join(current_batch))
+    return batches
+
+
+def _read_ledger(cursor):
+    """{filename: (checksum, succeeded)} for every recorded file."""
+    cursor.execute("SELECT filename, checksum, succeeded FROM dbo.schema_migrations")
+    return {row[0]: (row[1].strip(), bool(row[2])) for row in cursor.fetchall()}
+
+
+def _is_pending(ledger, filename, checksum):
+    recorded = ledger.get(filename)
+    if recorded is None:
+        return True
+    recorded_checksum, succeeded = recorded
+    # A failed file is retried only after it has been edited.
+    return not succeeded and recorded_checksum != checksum
 
+
+def _report_checksum_changes(migrations, ledger):
+    for filename, _, checksum in migrations:
+        recorded = ledger.get(filename)
+        if recorded is None:
+            continue
+        recorded_checksum, succeeded = recorded
+        if not succeeded and recorded_checksum == checksum:
+            print(f"  WARNING: {filename} failed when it was applied; fix it or delete its schema_migrations row to retry.")
+        elif succeeded and recorded_checksum != checksum:
+            print(f"  WARNING: {filename} changed after it was applied; add a new migration instead of editing it.")
+
+
+def _apply_migration(raw_conn, cursor, filename, content):
+    print(f"Applying migration: {filename}...")
+    errors = []
+    for i, batch in enumerate(_split_batches(content)):
+        cleaned_batch = batch.strip()
+        if not cleaned_batch:
+            continue
+        try:
+            cursor.execute(cleaned_batch)
+            raw_conn.commit()
+        except Exception as ex:
+            print(f"  Error in {filename} (batch {i+1}): {ex}")
+            errors.append(f"batch {i+1}: {ex}")
+            raw_conn.rollback()
+    return errors
+
+
+def run_migrations():
+    migrations = _load_migration_files()
+    db = SQLiteDB()
     raw_conn = db.engine.raw_connection()
     try:
         cursor = raw_conn.cursor()
-        for filepath in sql_files:
-            filename = os.path.basename(filepath)
-            print(f"Applying migration: {filename}...")
-            with open(filepath, "r", encoding="utf-8") as f:
-                content = f.read()
-
-            # Split script into batches by 'GO' keyword (case-insensitive on its own line)
-            batches = []
-            current_batch = []
-            for line in content.splitlines():
-                if line.strip().upper() == "GO":
-                    if current_batch:
-                        batches.append("\n".join(current_batch))
-                        current_batch = []
-                else:
-                    current_batch.append(line)
-            if current_batch:
-                batches.append("\n".join(current_batch))
+        try:
+            ledger = _read_ledger(cursor)
+            raw_conn.commit()
+        except Exception:
+            raw_conn.rollback()
+            ledger = None
+
+        if ledger is not None and not any(_is_pending(ledger, f, c) for f, _, c in migrations):
+            _report_checksum_changes(migrations, ledger)
+            print("Database schema is up to date.")
+            cursor.close()
+            return True
+
+        print("Starting database migrations check/execution...")
+        cursor.execute(
+            "DECLARE @result INT; "
+            "EXEC @result = sp_getapplock @Resource = ?, @LockMode = 'Exclusive', "
+            "@LockOwner = 'Session', @LockTimeout = ?; "
+            "SELECT @result",
+            MIGRATION_LOCK_NAME, MIGRATION_LOCK_TIMEOUT_MS
+        )
+        lock_result = cursor.fetchone()[0]
+        raw_conn.commit()
+        if lock_result is None or lock_result < 0:
+            print(f"Could not acquire the migration lock (result {lock_result}); skipping migrations.")
+            cursor.close()
+            return False
+
+        try:
+            cursor.execute(CREATE_LEDGER_SQL)
+            raw_conn.commit()
+            # Another worker may have finished while this one waited for the lock.
+            ledger = _read_ledger(cursor)
+            raw_conn.commit()
+            _report_checksum_changes(migrations, ledger)
 
-            for i, batch in enumerate(batches):
-                cleaned_batch = batch.strip()
-                if not cleaned_batch:
+            for filename, content, checksum in migrations:
+                if not _is_pending(ledger, filename, checksum):
                     continue
-                try:
-                    cursor.execute(cleaned_batch)
-                    raw_conn.commit()
-                except Exception as ex:
-                    print(f"  Error in {filename} (batch {i+1}): {ex}")
-                    raw_conn.rollback()
+                errors = _apply_migration(raw_conn, cursor, filename, content)
+                # Failed files are recorded too, with their errors; a retry of
+                # an edited file replaces its earlier row.
+                cursor.execute("DELETE FROM dbo.schema_migrations WHERE filename = ?", filename)
+                cursor.execute(
+                    "INSERT INTO dbo.schema_migrations (filename, checksum, succeeded, error_message) VALUES (?, ?, ?, ?)",
+                    filename, checksum, 0 if errors else 1, "\n".join(errors) or None
+                )
+                raw_conn.commit()
+        finally:
+            cursor.execute(
+                "EXEC sp_releaseapplock @Resource = ?, @LockOwner = 'Session'",
+                MIGRATION_LOCK_NAME
+            )
+            raw_conn.commit()
 
         cursor.close()
         print("All migrations completed!")
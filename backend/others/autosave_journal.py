@@ -0,0 +1,218 @@
+import datetime
+import json
+import os
+import sys
+import threading
+
+from sqlalchemy import func, text
+
+from db.db import SQLiteDB
+from db.metrics import register_metrics_provider
+from db.models import Answer, AutosaveJournal, Exam_Attempt
+from others.background import register_periodic_task
+from others.settings import get_setting
+
+# Write-behind autosave. /autosave-exam appends the changed questions to
+# dbo.AutosaveJournal (one narrow insert) instead of touching Answers; a
+# background task folds the journal into Answers every
+# autosave_flush_interval_secs (others/settings.py), coalescing all pending revisions of an
+# attempt into one set of row changes. Only one worker flushes at a time
+# (application lock). submit_exam_answers and finalize_expired_attempts call
+# flush_autosave_journal() for their attempts first, so nothing staged is
+# lost. AUTOSAVE_WRITE_BEHIND=0 writes autosaves straight to Answers.
+AUTOSAVE_WRITE_BEHIND = str(os.getenv('AUTOSAVE_WRITE_BEHIND', '1')).strip().lower() in ('1', 'true', 'yes', 'on')
+AUTOSAVE_FLUSH_TASK_NAME = 'flush_autosave_journal'
+AUTOSAVE_FLUSH_BATCH_SIZE = int(os.getenv('AUTOSAVE_FLUSH_BATCH_SIZE', 2000))
+AUTOSAVE_FLUSH_LOCK_NAME = 'edu_autosave_flush'
+_IN_CHUNK_SIZE = 1000
+
+_flush_stats_lock = threading.Lock()
+_flush_stats = {
+    "buffer_depth": 0,
+    "flush_lag_seconds": 0.0,
+    "flushed_entries_total": 0,
+    "flushes_total": 0,
+    "last_flush_seconds": 0.0,
+}
+
+
+def _chunks(values):
+    for i in range(0, len(values), _IN_CHUNK_SIZE):
+        yield values[i:i + _IN_CHUNK_SIZE]
+
+
+def answer_values(answer_value):
+    """Return (selected_option_id, written_answer) pairs for one question's browser value."""
+    values = answer_value if isinstance(answer_value, list) else [answer_value]
+    pairs = []
+    for value in values:
+        if value is None or value == '':
+            continue
+        is_option = isinstance(value, str) and len(value) == 36 and '-' in value
+        pairs.append((value if is_option else None, None if is_option else str(value)))
+    return pairs
+
+
+def upsert_attempt_answers(session, exam_attempt, changes, existing=None):
+    """Apply only the changed questions: existing rows are updated in place,
+    then rows are added or removed to match the new value.
+
+    existing maps str(question_id) to the attempt's Answer rows; it is
+    loaded here when the caller has not already fetched it.
+    """
+    if not changes:
+        return
+    if existing is None:
+        existing = {}
+        rows = session.query(Answer).filter(
+            Answer.attempt_id == exam_attempt.attempt_id,
+            Answer.question_id.in_(list(changes))
+        ).all()
+        for answer in rows:
+            existing.setdefault(str(answer.question_id), []).append(answer)
+
+    for question_id, answer_value in changes.items():
+        current = existing.get(str(question_id), [])
+        values = answer_values(answer_value)
+        for answer, (selected_option_id, written_answer) in zip(current, values):
+            answer.selected_option_id = selected_option_id
+            answer.written_answer = written_answer
+        for selected_option_id, written_answer in values[len(current):]:
+            session.add(Answer(
+                user_id=exam_attempt.user_id,
+                schedule_id=exam_attempt.schedule_id,
+                question_id=question_id,
+                attempt_id=exam_attempt.attempt_id,
+                selected_option_id=selected_option_id,
+                written_answer=written_answer
+            ))
+        for answer in current[len(values):]:
+            session.delete(answer)
+
+
+def append_autosave(session, exam_attempt, revision, changes):
+    """Stage one autosave; the caller commits."""
+    session.add(AutosaveJournal(
+        attempt_id=exam_attempt.attempt_id,
+        revision=revision,
+        changes=json.dumps(changes)
+    ))
+
+
+def _apply_entries(session, entries):
+    """Fold journal entries into Answers and delete them; returns the number applied."""
+    if not entries:
+        return 0
+    merged = {}
+    for entry in sorted(entries, key=lambda e: (e.revision, e.entry_id)):
+        try:
+            merged.setdefault(str(entry.attempt_id), {}).update(json.loads(entry.changes) or {})
+        except (TypeError, ValueError) as e:
+            print(f"Skipping unreadable autosave entry {entry.entry_id}: {e}")
+
+    attempt_ids = list(merged)
+    attempts = {}
+    existing = {}
+    for chunk in _chunks(attempt_ids):
+        for attempt in session.query(Exam_Attempt).filter(Exam_Attempt.attempt_id.in_(chunk)).all():
+            attempts[str(attempt.attempt_id)] = attempt
+        for answer in session.query(Answer).filter(Answer.attempt_id.in_(chunk)).all():
+            existing.setdefault(str(answer.attempt_id), {}).setdefault(str(answer.question_id), []).append(answer)
+
+    for attempt_id, changes in merged.items():
+        attempt = attempts.get(attempt_id)
+        # A submitted attempt's answers came from its submit snapshot, which
+        # supersedes anything still staged. Deadline finalization flushes
+        # before it changes the status, so its entries are applied above.
+        if attempt is None or attempt.status != 'in_progress':
+            print(f"Discarding staged autosaves of finalized attempt {attempt_id}")
+            continue
+        upsert_attempt_answers(session, attempt, changes, existing.get(attempt_id, {}))
+
+    entry_ids = [entry.entry_id for entry in entries]
+    for chunk in _chunks(entry_ids):
+        session.query(AutosaveJournal).filter(AutosaveJournal.entry_id.in_(chunk)).delete(synchronize_session=False)
+    return len(entries)
+
+
+def flush_autosave_journal(session, attempt_ids):
+    """Apply the staged autosaves of the given attempts inside the caller's transaction."""
+    attempt_ids = [attempt_id for attempt_id in attempt_ids if attempt_id]
+    entries = []
+    for chunk in _chunks(attempt_ids):
+        # Blocks until a concurrent batch flush holding these rows commits.
+        entries.extend(session.query(AutosaveJournal).filter(
+            AutosaveJournal.attempt_id.in_(chunk)
+        ).with_for_update().all())
+    return _apply_entries(session, entries)
+
+
+def _acquire_flush_lock(session):
+    # Held until the transaction ends; other workers skip this cycle.
+    result = session.execute(text(
+        "DECLARE @result INT; "
+        "EXEC @result = sp_getapplock @Resource = :resource, @LockMode = 'Exclusive', "
+        "@LockOwner = 'Transaction', @LockTimeout = 0; "
+        "SELECT @result"
+    ), {"resource": AUTOSAVE_FLUSH_LOCK_NAME}).scalar()
+    return result is not None and result >= 0
+
+
+def _record_buffer_stats(session):
+    depth, oldest = session.query(func.count(AutosaveJournal.entry_id), func.min(AutosaveJournal.created_date)).one()
+    lag = (datetime.datetime.utcnow() - oldest).total_seconds() if oldest else 0.0
+    with _flush_stats_lock:
+        _flush_stats["buffer_depth"] = int(depth or 0)
+        _flush_stats["flush_lag_seconds"] = max(lag, 0.0)
+
+
+def flush_pending_autosaves():
+    db = SQLiteDB()
+    session = db.connect()
+    if not session:
+        return
+    try:
+        _record_buffer_stats(session)
+        session.commit()
+        if not _acquire_flush_lock(session):
+            session.rollback()
+            return
+        started = datetime.datetime.utcnow()
+        entries = session.query(AutosaveJournal).order_by(AutosaveJournal.entry_id).with_for_update(
+            skip_locked=True
+        ).limit(AUTOSAVE_FLUSH_BATCH_SIZE).all()
+        applied = _apply_entries(session, entries)
+        session.commit()
+        with _flush_stats_lock:
+            _flush_stats["flushes_total"] += 1
+            _flush_stats["flushed_entries_total"] += applied
+            _flush_stats["last_flush_seconds"] = (datetime.datetime.utcnow() - started).total_seconds()
+    except Exception as e:
+        session.rollback()
+        print(f"{e} occurred while flushing autosaves at line {sys.exc_info()[-1].tb_lineno}")
+    finally:
+        session.close()
+
+
+def autosave_metrics():
+    with _flush_stats_lock:
+        stats = dict(_flush_stats)
+    return [
+        "# HELP edu_autosave_buffer_depth Autosave journal entries waiting to be flushed.",
+        "# TYPE edu_autosave_buffer_depth gauge",
+        f"edu_autosave_buffer_depth {stats['buffer_depth']}",
+        "# HELP edu_autosave_flush_lag_seconds Age of the oldest unflushed autosave entry.",
+        "# TYPE edu_autosave_flush_lag_seconds gauge",
+        f"edu_autosave_flush_lag_seconds {stats['flush_lag_seconds']:g}",
+        "# TYPE edu_autosave_flushed_entries_total counter",
+        f"edu_autosave_flushed_entries_total {stats['flushed_entries_total']}",
+        "# TYPE edu_autosave_flushes_total counter",
+        f"edu_autosave_flushes_total {stats['flushes_total']}",
+        "# TYPE edu_autosave_last_flush_seconds gauge",
+        f"edu_autosave_last_flush_seconds {stats['last_flush_seconds']:g}",
+    ]
+
+
+register_metrics_provider(autosave_metrics)
+# Registered even with write-behind off so entries staged before a switch drain.
+register_periodic_task(AUTOSAVE_FLUSH_TASK_NAME, lambda: get_setting('autosave_flush_interval_secs'), flush_pending_autosaves)
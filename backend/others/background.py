@@ -0,0 +1,94 @@
+import os
+import sys
+import threading
+import time
+
+# Periodic jobs run on one daemon thread per worker process. The thread is
+# started lazily by the first request a worker serves (after any fork), so
+# importing the app never spawns it. Every worker runs every job, so jobs
+# must be idempotent or claim their work in the database.
+# Set BACKGROUND_TASKS_ENABLED=0 on processes that should not run them.
+BACKGROUND_TASKS_ENABLED = str(os.getenv('BACKGROUND_TASKS_ENABLED', '1')).strip().lower() in ('1', 'true', 'yes', 'on')
+
+_tasks = {}
+_tasks_lock = threading.Lock()
+_wake = threading.Event()
+_started_pid = None
+
+
+class PeriodicTask:
+    def __init__(self, name, interval, func):
+        self.name = name
+        # A callable interval is read again after every run.
+        self._interval = interval
+        self.func = func
+        self.next_run = time.monotonic()
+        self.last_duration = None
+        self.last_error = None
+        self.runs = 0
+
+    def run(self):
+        started = time.monotonic()
+        try:
+            self.func()
+            self.last_error = None
+        except Exception as e:
+            self.last_error = str(e)
+            print(f"{e} occurred in background task {self.name} at line {sys.exc_info()[-1].tb_lineno}")
+        finally:
+            self.runs += 1
+            self.last_duration = time.monotonic() - started
+            self.next_run = time.monotonic() + self.interval
+
+    @property
+    def interval(self):
+        return float(self._interval() if callable(self._interval) else self._interval)
+
+
+def register_periodic_task(name, interval, func):
+    """Run func every interval seconds (a number or a callable returning one); re-registering a name replaces it."""
+    with _tasks_lock:
+        _tasks[name] = PeriodicTask(name, interval, func)
+    _wake.set()
+
+
+def trigger_task(name):
+    """Run a registered task as soon as the background thread wakes up."""
+    with _tasks_lock:
+        task = _tasks.get(name)
+        if task is not None:
+            task.next_run = time.monotonic()
+    _wake.set()
+
+
+def _run_loop():
+    while True:
+        with _tasks_lock:
+            due = [task for task in _tasks.values() if task.next_run <= time.monotonic()]
+        for task in due:
+            task.run()
+        with _tasks_lock:
+            next_runs = [task.next_run for task in _tasks.values()]
+        timeout = max(min(next_runs) - time.monotonic(), 0.05) if next_runs else None
+        _wake.wait(timeout)
+        _wake.clear()
+
+
+def start_background_tasks():
+    """Start this process's background thread once; safe to call per request."""
+    global _started_pid
+    if not BACKGROUND_TASKS_ENABLED or _started_pid == os.getpid():
+        return
+    with _tasks_lock:
+        if _started_pid == os.getpid():
+            return
+        _started_pid = os.getpid()
+    threading.Thread(target=_run_loop, name='edu-background-tasks', daemon=True).start()
+
+
+def background_task_stats():
+    with _tasks_lock:
+        return {
+            name: {"runs": task.runs, "last_duration": task.last_duration, "last_error": task.last_error}
+            for name, task in _tasks.items()
+        }
@@ -6,6 +6,7 @@ from sqlalchemy import func, text, or_
 # pyrefly: ignore [missing-import]
 from sqlalchemy.exc import IntegrityError
 import uuid
+from others.paper_cache import invalidate_exam_papers
 
 def ensure_category_columns(session):
     try:
@@ -456,6 +457,7 @@ def update_category(category_id, request):
         for t in team_ids:
             ct = CategoriesTeams(category_id=category_id, team_id=t)
             session.add(ct)
+        invalidate_exam_papers(session)
         session.commit()
         return {"statusMessage": "Category updated successfully", "status": True}, 200
     except IntegrityError as e:
@@ -491,6 +493,7 @@ def delete_category(category_id, deleted_by):
         category.is_deleted = 1
         category.updated_by = deleted_by
         category.updated_date = datetime.utcnow()
+        invalidate_exam_papers(session)
         session.commit()
         return {"statusMessage": "Category deleted successfully", "status": True}, 200
     except Exception as e:
@@ -522,11 +525,13 @@ def manage_category(action, uuid, updated_by):
         category.is_deleted = 1
         category.updated_by = updated_by
         category.updated_date = datetime.utcnow()
+        invalidate_exam_papers(session)
         session.commit()
         return {"statusMessage": "Category deleted", "status": True}, 200
     # activate/deactivate
     category.active_status = 1 if action == 'activate' else 0
     category.updated_by = updated_by
     category.updated_date = datetime.utcnow()
+    invalidate_exam_papers(session)
     session.commit()
     return {"statusMessage": f"Category {'activated' if category.active_status else 'deactivated'} successfully", "status": True}, 200
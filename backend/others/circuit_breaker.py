@@ -0,0 +1,134 @@
+import collections
+import os
+import threading
+import time
+
+from db.metrics import register_metrics_provider
+
+# Per-process circuit breaker for slow or failing dependencies. Calls are
+# recorded in a rolling window of CIRCUIT_WINDOW_SECS; once at least
+# CIRCUIT_MIN_CALLS calls are in the window and either the error share
+# reaches CIRCUIT_ERROR_RATE or the share slower than CIRCUIT_SLOW_CALL_SECS
+# reaches CIRCUIT_SLOW_RATE, the breaker opens and callers fail fast for
+# CIRCUIT_OPEN_SECS. It then lets CIRCUIT_HALF_OPEN_PROBES calls through
+# (half-open); if they all succeed it closes, any failure re-opens it.
+CIRCUIT_WINDOW_SECS = float(os.getenv('CIRCUIT_WINDOW_SECS', 60))
+CIRCUIT_MIN_CALLS = int(os.getenv('CIRCUIT_MIN_CALLS', 10))
+CIRCUIT_ERROR_RATE = float(os.getenv('CIRCUIT_ERROR_RATE', 0.5))
+CIRCUIT_SLOW_CALL_SECS = float(os.getenv('CIRCUIT_SLOW_CALL_SECS', 20))
+CIRCUIT_SLOW_RATE = float(os.getenv('CIRCUIT_SLOW_RATE', 0.8))
+CIRCUIT_OPEN_SECS = float(os.getenv('CIRCUIT_OPEN_SECS', 30))
+CIRCUIT_HALF_OPEN_PROBES = int(os.getenv('CIRCUIT_HALF_OPEN_PROBES', 2))
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+_breakers = []
+
+
+class CircuitBreaker:
+    def __init__(self, name):
+        self.name = name
+        self.state = CLOSED
+        self.opened_at = None
+        self.opens = 0
+        self.rejected = 0
+        self._calls = collections.deque()
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        self._lock = threading.Lock()
+        _breakers.append(self)
+
+    def _trim(self, now):
+        while self._calls and self._calls[0][0] < now - CIRCUIT_WINDOW_SECS:
+            self._calls.popleft()
+
+    def _open(self, now):
+        self.state = OPEN
+        self.opened_at = now
+        self.opens += 1
+        self._calls.clear()
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        print(f"Circuit {self.name} opened; failing fast for {CIRCUIT_OPEN_SECS:g}s")
+
+    def allow(self):
+        """True when a call may go ahead; a half-open breaker admits a few probes."""
+        with self._lock:
+            if self.state == OPEN:
+                if time.monotonic() - self.opened_at < CIRCUIT_OPEN_SECS:
+                    self.rejected += 1
+                    return False
+                self.state = HALF_OPEN
+            if self.state == HALF_OPEN:
+                if self._probes_in_flight + self._probe_successes >= CIRCUIT_HALF_OPEN_PROBES:
+                    self.rejected += 1
+                    return False
+                self._probes_in_flight += 1
+            return True
+
+    def cancel(self):
+        """Give back an admitted call that was never made."""
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probes_in_flight = max(self._probes_in_flight - 1, 0)
+
+    def retry_after(self):
+        """Seconds until an open breaker starts probing again (0 when it is not open)."""
+        with self._lock:
+            if self.state != OPEN:
+                return 0.0
+            return max(CIRCUIT_OPEN_SECS - (time.monotonic() - self.opened_at), 0.0)
+
+    def is_open(self):
+        with self._lock:
+            return self.state != CLOSED
+
+    def record(self, ok, seconds):
+        now = time.monotonic()
+        slow = seconds >= CIRCUIT_SLOW_CALL_SECS
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probes_in_flight = max(self._probes_in_flight - 1, 0)
+                if not ok or slow:
+                    self._open(now)
+                    return
+                self._probe_successes += 1
+                if self._probe_successes >= CIRCUIT_HALF_OPEN_PROBES:
+                    self.state = CLOSED
+                    self._calls.clear()
+                    print(f"Circuit {self.name} closed")
+                return
+            if self.state == OPEN:
+                # A call admitted before the breaker opened.
+                return
+            self._calls.append((now, ok, slow))
+            self._trim(now)
+            total = len(self._calls)
+            if total < CIRCUIT_MIN_CALLS:
+                return
+            errors = sum(1 for _, call_ok, _ in self._calls if not call_ok)
+            slow_calls = sum(1 for _, _, call_slow in self._calls if call_slow)
+            if errors / total >= CIRCUIT_ERROR_RATE or slow_calls / total >= CIRCUIT_SLOW_RATE:
+                self._open(now)
+
+
+def circuit_breaker_metrics():
+    lines = [
+        "# HELP edu_circuit_state Circuit breaker state (0 closed, 1 half-open, 2 open).",
+        "# TYPE edu_circuit_state gauge",
+    ]
+    for breaker in _breakers:
+        lines.append(f'edu_circuit_state{{circuit="{breaker.name}"}} {_STATE_VALUES[breaker.state]}')
+    lines.append("# TYPE edu_circuit_opens_total counter")
+    for breaker in _breakers:
+        lines.append(f'edu_circuit_opens_total{{circuit="{breaker.name}"}} {breaker.opens}')
+    lines.append("# TYPE edu_circuit_rejected_calls_total counter")
+    for breaker in _breakers:
+        lines.append(f'edu_circuit_rejected_calls_total{{circuit="{breaker.name}"}} {breaker.rejected}')
+    return lines
+
+
+register_metrics_provider(circuit_breaker_metrics)
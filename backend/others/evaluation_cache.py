@@ -0,0 +1,187 @@
+import datetime
+import hashlib
+import json
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+from sqlalchemy.exc import IntegrityError
+
+from db.db import get_session_factory
+from db.metrics import register_metrics_provider
+from db.models import EvaluationCacheEntry
+from others.llm import DESCRIPTIVE_PROMPT_VERSION
+
+# Content-addressed cache of descriptive evaluations. The key hashes the
+# model, the version of the prompt that graded the answer (single-answer or
+# batched, see others/llm.py), the question marks and the normalized
+# expected and student answers, so identical answers (and regrades after
+# evaluation_failures) skip the OpenAI round trip. An answer is looked up
+# under every prompt version the caller accepts. Entries live in
+# dbo.EvaluationCache with a per-process LRU of EVALUATION_CACHE_SIZE in
+# front. Only successful evaluations are stored.
+EVALUATION_CACHE_ENABLED = str(os.getenv('EVALUATION_CACHE_ENABLED', '1')).strip().lower() in ('1', 'true', 'yes', 'on')
+EVALUATION_CACHE_SIZE = int(os.getenv('EVALUATION_CACHE_SIZE', 5000))
+_IN_CHUNK_SIZE = 1000
+
+_lru = OrderedDict()
+_lock = threading.Lock()
+# schedule_id -> {"memory": n, "db": n, "miss": n}
+_schedule_stats = {}
+
+
+def _normalize(text):
+    return " ".join(str(text or "").split()).lower()
+
+
+def evaluation_cache_key(model, question_mark, expected_answer, student_answer, prompt_version=DESCRIPTIVE_PROMPT_VERSION):
+    material = json.dumps([
+        model or "",
+        prompt_version,
+        str(question_mark),
+        _normalize(expected_answer),
+        _normalize(student_answer),
+    ])
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+def _remember(key, result):
+    with _lock:
+        _lru[key] = result
+        _lru.move_to_end(key)
+        while len(_lru) > EVALUATION_CACHE_SIZE:
+            _lru.popitem(last=False)
+
+
+def _copy(result):
+    result = dict(result)
+    result["status"] = True
+    return result
+
+
+def cached_evaluations(key_groups, schedule_id=None, count=True):
+    """Return {group: evaluation} for the answers already evaluated; counts hits for schedule_id.
+
+    Each group is a tuple of one answer's keys, one per accepted prompt
+    version in order of preference; the first key found is used. Pass
+    count=False for lookups that should not show in the schedule's stats.
+    """
+    if not EVALUATION_CACHE_ENABLED or not key_groups:
+        return {}
+    keys = [key for group in key_groups for key in group]
+    found = {}
+    missing = []
+    with _lock:
+        for key in dict.fromkeys(keys):
+            if key in _lru:
+                _lru.move_to_end(key)
+                found[key] = _copy(_lru[key])
+            else:
+                missing.append(key)
+    memory_hits = set(found)
+
+    # Read and count hits in a short session of its own: a deadlock on the
+    # hits UPDATE must not roll back the caller's grading transaction.
+    db_hits = []
+    cache_session = get_session_factory()()
+    try:
+        for i in range(0, len(missing), _IN_CHUNK_SIZE):
+            chunk = missing[i:i + _IN_CHUNK_SIZE]
+            for row in cache_session.query(EvaluationCacheEntry.cache_key, EvaluationCacheEntry.result).filter(
+                EvaluationCacheEntry.cache_key.in_(chunk)
+            ).all():
+                result = json.loads(row.result)
+                _remember(row.cache_key, result)
+                found[row.cache_key] = _copy(result)
+                db_hits.append(row.cache_key)
+        for i in range(0, len(db_hits), _IN_CHUNK_SIZE):
+            cache_session.query(EvaluationCacheEntry).filter(
+                EvaluationCacheEntry.cache_key.in_(db_hits[i:i + _IN_CHUNK_SIZE])
+            ).update({
+                EvaluationCacheEntry.hits: EvaluationCacheEntry.hits + 1,
+                EvaluationCacheEntry.last_hit_date: datetime.datetime.utcnow()
+            }, synchronize_session=False)
+        cache_session.commit()
+    except Exception as e:
+        # The cache only saves work; grading goes ahead without it.
+        cache_session.rollback()
+        print(f"{e} occurred while reading the evaluation cache at line {sys.exc_info()[-1].tb_lineno}")
+    finally:
+        cache_session.close()
+
+    db_hit_keys = set(db_hits)
+    counts = {"memory": 0, "db": 0, "miss": 0}
+    evaluations = {}
+    for group in key_groups:
+        key = next((key for key in group if key in found), None)
+        counts["miss" if key is None else "memory" if key in memory_hits else "db"] += 1
+        if key is not None:
+            evaluations[group] = found[key]
+    if not count:
+        return evaluations
+    with _lock:
+        stats = _schedule_stats.setdefault(str(schedule_id or "unknown"), {"memory": 0, "db": 0, "miss": 0})
+        for name, value in counts.items():
+            stats[name] += value
+    return evaluations
+
+
+def store_evaluations(session, model, evaluations):
+    """Add successful {(question_mark, expected_answer, student_answer): evaluation} results
+    to the caller's transaction, keyed by the prompt version that graded each."""
+    if not EVALUATION_CACHE_ENABLED:
+        return
+    for (question_mark, expected_answer, student_answer), evaluation in evaluations.items():
+        if not evaluation.get("status", False):
+            continue
+        prompt_version = evaluation.get("prompt_version") or DESCRIPTIVE_PROMPT_VERSION
+        key = evaluation_cache_key(model, question_mark, expected_answer, student_answer, prompt_version)
+        result = {name: value for name, value in evaluation.items() if name not in ("status", "error", "prompt_version")}
+        _remember(key, result)
+        try:
+            # A concurrent grader may store the same answer first.
+            with session.begin_nested():
+                session.add(EvaluationCacheEntry(
+                    cache_key=key,
+                    model=(model or "")[:100],
+                    prompt_version=prompt_version,
+                    result=json.dumps(result, default=str)
+                ))
+        except IntegrityError:
+            pass
+
+
+def clear_evaluation_cache():
+    with _lock:
+        _lru.clear()
+
+
+def evaluation_cache_stats():
+    with _lock:
+        return {schedule_id: dict(stats) for schedule_id, stats in _schedule_stats.items()}
+
+
+def evaluation_cache_metrics():
+    lines = [
+        "# HELP edu_evaluation_cache_lookups_total Descriptive answers looked up in the evaluation cache, by schedule and outcome.",
+        "# TYPE edu_evaluation_cache_lookups_total counter",
+    ]
+    stats = evaluation_cache_stats()
+    for schedule_id, counts in sorted(stats.items()):
+        for outcome in ("memory", "db", "miss"):
+            lines.append(f'edu_evaluation_cache_lookups_total{{schedule_id="{schedule_id}",outcome="{outcome}"}} {counts[outcome]}')
+    lines.append("# HELP edu_evaluation_cache_hit_ratio Share of looked-up answers served from the cache, by schedule.")
+    lines.append("# TYPE edu_evaluation_cache_hit_ratio gauge")
+    for schedule_id, counts in sorted(stats.items()):
+        total = counts["memory"] + counts["db"] + counts["miss"]
+        ratio = (counts["memory"] + counts["db"]) / total if total else 0.0
+        lines.append(f'edu_evaluation_cache_hit_ratio{{schedule_id="{schedule_id}"}} {ratio:g}')
+    with _lock:
+        size = len(_lru)
+    lines.append("# TYPE edu_evaluation_cache_memory_entries gauge")
+    lines.append(f"edu_evaluation_cache_memory_entries {size}")
+    return lines
+
+
+register_metrics_provider(evaluation_cache_metrics)
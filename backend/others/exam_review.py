@@ -1,57 +1,144 @@
 import datetime
-from sqlalchemy import func
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import case, exists, func, or_, update
 from db.db import SQLiteDB
-from db.models import User, Exam, ExamSchedule, Question, Option, Answer,Exam_Attempt, ExamScheduleMapping, ExamReviewComments,ExamReviewCommentsHistory, MarksHistory
-from others.settings import get_ai_confidence_threshold
-from others.llm import descriptive_evaluation, openai_client
+from db.models import User, Exam, ExamSchedule, Question, Option, Answer,Exam_Attempt, ExamScheduleMapping, ExamReviewComments,ExamReviewCommentsHistory, MarksHistory, BackgroundJob
+from others.settings import get_ai_confidence_threshold, get_setting
+from others.llm import DESCRIPTIVE_BATCH_PROMPT_VERSION, DESCRIPTIVE_PROMPT_VERSION, descriptive_evaluation, descriptive_evaluation_batch, openai_circuit, openai_client, plan_evaluation_batches
+from others.autosave_journal import flush_autosave_journal
+from others.evaluation_cache import EVALUATION_CACHE_ENABLED, cached_evaluations, evaluation_cache_key, store_evaluations
+from others.background import register_periodic_task
+from others.jobs import enqueue_job, latest_job_status, register_job_handler, wake_job_workers
+from others.schedule_completion import record_attempts_finished, schedule_completion
+from others.review_queue import mark_answer_reviewed, queue_graded_answers, set_manual_review_required
+
+# Submitted attempts are scored by the job workers, not in the request.
+EVALUATE_ATTEMPT_JOB = 'evaluate_attempt'
+# Abandoned attempts are finalized by the sweeper once deadline_at passes.
+ATTEMPT_SWEEP_INTERVAL_SECS = float(os.getenv('ATTEMPT_SWEEP_INTERVAL_SECS', 30))
+ATTEMPT_SWEEP_BATCH_SIZE = int(os.getenv('ATTEMPT_SWEEP_BATCH_SIZE', 200))
+# Delay before re-grading answers that failed while the OpenAI circuit was open.
+EVALUATION_DEFER_SECS = float(os.getenv('EVALUATION_DEFER_SECS', 60))
+# Pack several answers into each grading request instead of one per answer.
+GRADING_BATCH_MODE = str(os.getenv('GRADING_BATCH_MODE', '0')).strip().lower() in ('1', 'true', 'yes', 'on')
+# In batch mode an evaluation also grades pending descriptive answers of the
+# schedule's other submitted attempts, up to this many answers in all, so
+# batches are formed across the schedule; those attempts' own evaluations
+# then find their answers in the evaluation cache. An evaluation takes on at
+# most GRADING_PEER_ANSWERS_PER_ANSWER peer answers per answer of its own and
+# reads at most GRADING_PEER_SCAN_PAGES pages of candidates to find them.
+GRADING_SCHEDULE_BATCH_ANSWERS = int(os.getenv('GRADING_SCHEDULE_BATCH_ANSWERS', 200))
+GRADING_PEER_ANSWERS_PER_ANSWER = int(os.getenv('GRADING_PEER_ANSWERS_PER_ANSWER', 4))
+GRADING_PEER_SCAN_PAGES = int(os.getenv('GRADING_PEER_SCAN_PAGES', 3))
 
 def is_review_eligible_attempt(attempt):
     """Only finalized attempts can participate in student review flows."""
     return getattr(attempt, 'status', None) in ('submitted', 'evaluated')
 
+def attempt_deadline(started_date, duration_mins, end_time):
+    """The earlier of started_date + duration_mins and the schedule end_time (None when neither applies)."""
+    duration_mins = int(duration_mins or 0)
+    duration_deadline = started_date + datetime.timedelta(minutes=duration_mins) if started_date and duration_mins > 0 else None
+    deadlines = [value for value in (duration_deadline, end_time) if value]
+    return min(deadlines) if deadlines else None
+
+def _finalize_attempts(session, expired):
+    """Submit (attempt, deadline) pairs and queue their evaluation; the caller commits."""
+    finalized_ids = [attempt.attempt_id for attempt, _ in expired]
+    if not finalized_ids:
+        return finalized_ids
+    # Fold in staged autosaves while the attempts are still in_progress:
+    # these attempts have no submit snapshot, and the journal only applies
+    # entries to in-progress attempts.
+    flush_autosave_journal(session, finalized_ids)
+    for attempt, deadline in expired:
+        # The effective deadline is authoritative when a browser closes or loses connectivity.
+        attempt.status = 'submitted'
+        attempt.submitted_date = deadline
+        session.add(attempt)
+    record_attempts_finished(session, [attempt for attempt, _ in expired])
+    for attempt_id in finalized_ids:
+        queue_attempt_evaluation(session, attempt_id)
+    return finalized_ids
+
 def finalize_expired_attempts(session, exam_schedule, attempts, now=None):
     """Finalize timed-out attempts even when the student's browser never submitted."""
     now = now or datetime.datetime.utcnow()
-    exam = session.query(Exam).filter(Exam.exam_id == exam_schedule.exam_id).first()
-    duration_mins = int(getattr(exam, 'duration_mins', 0) or 0)
-    finalized_ids = []
-    for attempt in attempts:
-        if attempt.status != 'in_progress' or not attempt.started_date:
-            continue
-        duration_deadline = attempt.started_date + datetime.timedelta(minutes=duration_mins) if duration_mins > 0 else None
-        deadlines = [value for value in (duration_deadline, exam_schedule.end_time) if value]
-        if not deadlines:
-            continue
-        deadline = min(deadlines)
-        if now >= deadline:
-            # The effective deadline is authoritative when a browser closes or loses connectivity.
-            attempt.status = 'submitted'
-            attempt.submitted_date = deadline
-            session.add(attempt)
-            finalized_ids.append(attempt.attempt_id)
+    running = [attempt for attempt in attempts if attempt.status == 'in_progress' and attempt.started_date]
+    duration_mins = 0
+    if any(attempt.deadline_at is None for attempt in running):
+        # Attempts launched before deadline_at was stored.
+        exam = session.query(Exam).filter(Exam.exam_id == exam_schedule.exam_id).first()
+        duration_mins = getattr(exam, 'duration_mins', 0)
+    expired = []
+    for attempt in running:
+        deadline = attempt.deadline_at or attempt_deadline(attempt.started_date, duration_mins, exam_schedule.end_time)
+        if deadline and now >= deadline:
+            expired.append((attempt, deadline))
+    finalized_ids = _finalize_attempts(session, expired)
     if finalized_ids:
         session.commit()
+        wake_job_workers()
     return finalized_ids
 
+def sweep_expired_attempts():
+    """Finalize in-progress attempts past their stored deadline, ATTEMPT_SWEEP_BATCH_SIZE at a time."""
+    db = SQLiteDB()
+    session = db.connect()
+    if not session:
+        return
+    finalized = 0
+    try:
+        while True:
+            now = datetime.datetime.utcnow()
+            # Served by IX_Exam_Attempts_status_deadline; rows another worker is
+            # finalizing are skipped.
+            attempts = session.query(Exam_Attempt).filter(
+                Exam_Attempt.status == 'in_progress',
+                Exam_Attempt.deadline_at <= now
+            ).order_by(Exam_Attempt.deadline_at).limit(ATTEMPT_SWEEP_BATCH_SIZE).with_for_update(skip_locked=True).all()
+            if not attempts:
+                break
+            # _finalize_attempts folds each attempt's journaled autosaves in
+            # before submitting it, so nothing typed before the deadline is lost.
+            finalized += len(_finalize_attempts(session, [(attempt, attempt.deadline_at) for attempt in attempts]))
+            session.commit()
+            if len(attempts) < ATTEMPT_SWEEP_BATCH_SIZE:
+                break
+    except Exception as e:
+        session.rollback()
+        print(f"{e} occurred while sweeping expired attempts at line {sys.exc_info()[-1].tb_lineno}")
+    finally:
+        session.close()
+    if finalized:
+        print(f"Finalized {finalized} expired attempts")
+        wake_job_workers()
+
+def queue_attempt_evaluation(session, attempt_id):
+    """Enqueue background evaluation in the caller's transaction; the caller commits."""
+    enqueue_job(session, EVALUATE_ATTEMPT_JOB, attempt_id)
+
+def attempt_evaluation_status(session, attempt):
+    """Progress of an attempt: in_progress, submitted, evaluating, evaluation_failed or evaluated."""
+    if attempt.status != 'submitted':
+        return attempt.status
+    job_status = latest_job_status(session, EVALUATE_ATTEMPT_JOB, attempt.attempt_id)
+    if job_status == 'running':
+        return 'evaluating'
+    if job_status == 'failed':
+        return 'evaluation_failed'
+    return 'submitted'
+
 def is_after_everyone_finished_available(session, exam_schedule, now=None):
     """Unlock when all currently assigned students submitted, or time expired."""
     now = now or datetime.datetime.utcnow()
     if exam_schedule.end_time and now >= exam_schedule.end_time:
         return True
 
-    assigned_user_ids = session.query(ExamScheduleMapping.user_id).filter(
-        ExamScheduleMapping.schedule_id == exam_schedule.schedule_id
-    ).distinct().all()
-    assigned_user_ids = [row[0] for row in assigned_user_ids]
-    if not assigned_user_ids:
-        return False
-
-    completed_count = session.query(func.count(func.distinct(Exam_Attempt.user_id))).filter(
-        Exam_Attempt.schedule_id == exam_schedule.schedule_id,
-        Exam_Attempt.user_id.in_(assigned_user_ids),
-        (Exam_Attempt.submitted_date.isnot(None) | Exam_Attempt.status.in_(('submitted', 'evaluated')))
-    ).scalar() or 0
-    return completed_count == len(assigned_user_ids)
+    assigned, finished = schedule_completion(session, exam_schedule.schedule_id)
+    return assigned > 0 and finished >= assigned
 
 def review_user_exam(request, current_user=None):
 
@@ -92,9 +179,7 @@ def review_user_exam(request, current_user=None):
         if not exam_schedule:
             return {"statusMessage": "Schedule not found", "status": False}, 404
 
-        finalized_ids = finalize_expired_attempts(session, exam_schedule, attempts)
-        for finalized_id in finalized_ids:
-            validate_answers(finalized_id)
+        finalize_expired_attempts(session, exam_schedule, attempts)
         completed_attempts = [attempt for attempt in attempts if is_review_eligible_attempt(attempt)]
         completed_attempts.sort(key=lambda attempt: attempt.attempt_number or 0)
         review_mode = exam_schedule.review_mode or ('instant' if exam_schedule.user_review == 1 else 'no_review')
@@ -352,17 +437,196 @@ def review_user_exam(request, current_user=None):
     finally:
         session.close()
     return {"statusMessage": "Success", "status": True, "data": attempt_reviews}, 200
+def _grade_descriptive_answers(api_client, items):
+    """Grade (key, question_mark, expected_answer, student_answer) items concurrently.
+
+    At most grading_concurrency (others/settings.py) requests are in flight; returns {key: evaluation}.
+    With GRADING_BATCH_MODE each request carries a batch of answers (see
+    descriptive_evaluation_batch). Only the HTTP calls run on pool threads,
+    never the database session.
+    """
+    if not items:
+        return {}
+    keys = [item[0] for item in items]
+    triples = [item[1:] for item in items]
+    if GRADING_BATCH_MODE:
+        tasks = [(descriptive_evaluation_batch, [triples[index] for index in batch], batch)
+                 for batch in plan_evaluation_batches(triples)]
+    else:
+        tasks = [(_evaluate_one, [triple], [index]) for index, triple in enumerate(triples)]
+    workers = max(1, min(get_setting('grading_concurrency'), len(tasks)))
+    results = {}
+    if workers == 1:
+        for func, task_items, indexes in tasks:
+            results.update(zip((keys[i] for i in indexes), func(api_client, task_items)))
+        return results
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='edu-grading') as pool:
+        futures = [(pool.submit(func, api_client, task_items), indexes) for func, task_items, indexes in tasks]
+        for future, indexes in futures:
+            results.update(zip((keys[i] for i in indexes), future.result()))
+    return results
+
+def _evaluate_one(api_client, items):
+    return [descriptive_evaluation(api_client, *items[0])]
+
+def _cache_key_group(model, question_mark, expected_answer, student_answer):
+    """The answer's evaluation cache keys under each prompt version this worker grades with."""
+    versions = (DESCRIPTIVE_PROMPT_VERSION, DESCRIPTIVE_BATCH_PROMPT_VERSION) if GRADING_BATCH_MODE else (DESCRIPTIVE_PROMPT_VERSION,)
+    return tuple(
+        evaluation_cache_key(model, question_mark, expected_answer, student_answer, version)
+        for version in versions
+    )
+
+def _schedule_peer_answers(session, model, schedule_id, attempt_id, questions, options_by_question, limit, skip_groups):
+    """{cache key group: (question_mark, expected_answer, student_answer)} for up to limit
+    ungraded descriptive answers in the schedule's other submitted attempts that are
+    not in the evaluation cache yet.
+
+    Attempts are walked in attempt_id order starting after attempt_id, so
+    evaluations running side by side start from different peers, and attempts
+    whose own evaluation job is running are left to it.
+    """
+    peers = {}
+    if not schedule_id or limit <= 0:
+        return peers
+    query = session.query(Answer.question_id, Answer.written_answer).join(
+        Exam_Attempt, Exam_Attempt.attempt_id == Answer.attempt_id
+    ).join(
+        Question, Question.question_id == Answer.question_id
+    ).filter(
+        Exam_Attempt.schedule_id == schedule_id,
+        Exam_Attempt.status == 'submitted',
+        Exam_Attempt.attempt_id != attempt_id,
+        Question.question_type == 'descriptive',
+        or_(Answer.is_validated == None, Answer.is_validated != 1),
+        Answer.written_answer != None,
+        ~exists().where(
+            BackgroundJob.job_type == EVALUATE_ATTEMPT_JOB,
+            BackgroundJob.target_id == Exam_Attempt.attempt_id,
+            BackgroundJob.status == 'running'
+        )
+    ).order_by(
+        case((Exam_Attempt.attempt_id > attempt_id, 0), else_=1),
+        Exam_Attempt.attempt_id,
+        Answer.answer_id
+    )
+    for page in range(GRADING_PEER_SCAN_PAGES):
+        rows = query.offset(page * limit).limit(limit).all()
+        missing = list({str(row.question_id) for row in rows} - set(questions))
+        if missing:
+            more_questions, more_options = _load_attempt_questions(session, missing)
+            questions = {**questions, **more_questions}
+            options_by_question = {**options_by_question, **more_options}
+        candidates = {}
+        for row in rows:
+            question = questions.get(str(row.question_id))
+            if not question:
+                continue
+            correct_options = [opt for opt in options_by_question.get(str(row.question_id), []) if opt.active_status == 1]
+            expected_answer = correct_options[0].option_text if correct_options else ""
+            triple = (question.marks, expected_answer, row.written_answer)
+            group = _cache_key_group(model, *triple)
+            if group not in skip_groups and group not in peers:
+                candidates.setdefault(group, triple)
+        already_graded = cached_evaluations(list(candidates), count=False)
+        for group, triple in candidates.items():
+            if group not in already_graded and len(peers) < limit:
+                peers[group] = triple
+        if len(peers) >= limit or len(rows) < limit:
+            break
+    return peers
+
+def _chunks(values, size=1000):
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+def score_fill_answers(question, options, question_answers):
+    """Exact-match scoring of fill answers against the first active option.
+
+    options are the question's option rows; returns one Answer update dict per answer.
+    """
+    correct_options = [opt for opt in options if opt.active_status == 1]
+    correct_answers = correct_options[0].option_text.strip().lower() if correct_options and correct_options[0].option_text else ""
+    results = []
+    for ans in question_answers:
+        written_answer = ans.written_answer.strip().lower() if ans.written_answer else ""
+        if written_answer and written_answer == correct_answers:
+            is_correct = 1
+            marks_awarded = question.marks
+            feedback_part = None
+        else:
+            is_correct = 0
+            marks_awarded = 0
+            feedback_part = "Answer does not match the expected response."
+        results.append({
+            "answer_id": ans.answer_id,
+            "is_correct": is_correct,
+            "marks_awarded": marks_awarded,
+            "is_validated": 1,
+            "feedback": feedback_part
+        })
+    return results
+
+def score_choice_answers(question, options, question_answers):
+    """All-or-nothing scoring of one attempt's answer rows for a choose/multi question."""
+    # get the correct options for the question
+    correct_option_ids = set(
+        str(opt.options_id).lower() for opt in options if opt.is_correct == 1
+    )
+
+    selected_option_ids = set(
+        str(ans.selected_option_id).lower() for ans in question_answers if ans.selected_option_id
+    )
+
+    missing_options = correct_option_ids - selected_option_ids
+    incorrect_options = selected_option_ids - correct_option_ids
+
+    is_fully_correct = len(correct_option_ids) > 0 and len(missing_options) == 0 and len(incorrect_options) == 0
+    awarded_marks = question.marks if is_fully_correct else 0
+    if is_fully_correct:
+        feedback = None
+    else:
+        feedback = f"Incorrect. Missing correct options: {missing_options}. " if missing_options else "" f"Incorrectly selected options: {incorrect_options}."
+
+    return [{
+        "answer_id": ans.answer_id,
+        "is_correct": 1 if is_fully_correct else 0,
+        "marks_awarded": awarded_marks,
+        "is_validated": 1,
+        "feedback": feedback
+    } for ans in question_answers]
+
+def _load_attempt_questions(session, question_ids):
+    """Return ({question_id: Question}, {question_id: [Option, ...]}) in two queries."""
+    questions = {}
+    options_by_question = {}
+    for chunk in _chunks(question_ids):
+        for question in session.query(Question).filter(Question.question_id.in_(chunk)).all():
+            questions[str(question.question_id)] = question
+    for chunk in _chunks(question_ids):
+        for option in session.query(
+            Option.question_id, Option.options_id, Option.option_text, Option.is_correct, Option.active_status
+        ).filter(Option.question_id.in_(chunk)).all():
+            options_by_question.setdefault(str(option.question_id), []).append(option)
+    return questions, options_by_question
+
+def _manually_marked_answer_ids(session, answer_ids):
+    """Lower-cased ids of the answers an instructor has already marked (MarksHistory)."""
+    marked = set()
+    for chunk in _chunks(answer_ids):
+        for row in session.query(MarksHistory.answer_id).filter(MarksHistory.answer_id.in_(chunk)).distinct().all():
+            marked.add(str(row.answer_id).lower())
+    return marked
+
 def validate_answers(attempt_id):
     db = SQLiteDB()
     session = db.connect()
 
-    # connect llm model
-    openai_client_instance = openai_client()
-
     if not session:
         return {"statusMessage": "Error connecting to database", "status": False}, 500
     
     evaluation_failures = 0
+    pending_descriptive = []
 
     # get answer records
     answers = session.query(Answer).filter_by(attempt_id=attempt_id).all()
@@ -372,132 +636,140 @@ def validate_answers(attempt_id):
     for ans in answers:
         answers_by_question.setdefault(ans.question_id, []).append(ans)
 
+    # Questions and options of the whole attempt in two queries; objective
+    # answers are scored in memory and written back in one bulk update.
+    questions, options_by_question = _load_attempt_questions(session, list(answers_by_question))
+    objective_results = {}
+
     for question_id, question_answers in answers_by_question.items():
         # get the corresponding question
-        question = session.query(Question).filter_by(question_id=question_id).first()
+        question = questions.get(str(question_id))
         if not question:
             continue
-        correct_options = session.query(Option).filter_by(question_id=question_id, active_status=1).all()
+        options = options_by_question.get(str(question_id), [])
+        correct_options = [opt for opt in options if opt.active_status == 1]
         if question.question_type == 'fill' :
             # For text or code questions, manual validation is required
-            for ans in question_answers:
-                written_answer = ans.written_answer.strip().lower() if ans.written_answer else ""
-                correct_answers = correct_options[0].option_text.strip().lower() if correct_options else ""
-                if written_answer and written_answer == correct_answers:
-                    is_correct = 1
-                    marks_awarded = question.marks
-                    feedback_part = None
-                else:
-                    is_correct = 0
-                    marks_awarded = 0
-                    feedback_part = "Answer does not match the expected response."
-                ans.is_correct = is_correct
-                ans.marks_awarded = marks_awarded
-                ans.is_validated = 1
-                ans.feedback = feedback_part
-                session.add(ans)
+            for result in score_fill_answers(question, options, question_answers):
+                objective_results[result["answer_id"]] = result
         elif question.question_type == 'descriptive':
-            # For descriptive questions, use LLM to evaluate
+            # Graded concurrently once every question has been visited.
+            expected_answer = correct_options[0].option_text if correct_options else ""
             for ans in question_answers:
                 if ans.is_validated == 1:
                     continue
-                student_answer = ans.written_answer
-                expected_answer = correct_options[0].option_text if correct_options else ""
-                question_mark = question.marks
-                evaluation = descriptive_evaluation(openai_client_instance, question_mark, expected_answer, student_answer)
-                if not evaluation.get("status", False):
-                    # Keep the answer retryable, but persist a visible diagnostic instead
-                    # of silently returning an empty feedback section.
-                    evaluation_failures += 1
-                    error_detail = evaluation.get("error") or "The AI evaluation service did not return a valid result."
-                    print(f"AI evaluation failed for answer {ans.answer_id}: {error_detail}")
-                    ans.feedback = "AI evaluation could not be completed. Please retry the evaluation."
-                    ans.ai_confidence = None
-                    ans.is_validated = 0
-                    session.add(ans)
-                    continue
-                score = evaluation.get("score", 0)
-                max_marks = question.marks
-                marks_awarded = (score / question_mark) * max_marks if question_mark > 0 else 0
-                ans.is_correct = 1 if marks_awarded == max_marks else 0
-                ans.ai_marks = marks_awarded
-                # A retry must not overwrite marks that an instructor already
-                # assigned while the AI evaluation was unavailable.
-                has_manual_marks = session.query(MarksHistory).filter(
-                    MarksHistory.answer_id == ans.answer_id
-                ).first() is not None
-                if not has_manual_marks:
-                    ans.marks_awarded = marks_awarded
-                ans.is_validated = 1
-                feedback_part = evaluation.get("feedback", "")
-                ans.feedback = feedback_part
-                ai_confidence = evaluation.get("ai_confidence", 0)
-                ans.ai_confidence = ai_confidence
-                session.add(ans)
-
-                # update ExamReviewComments table category wise comments
-                for key in ["missing", "incomplete", "incorrect"]:
-                    comment = str(evaluation.get(key) or "").strip()
-                    if comment and comment.lower() not in {"none", "null", "n/a"}:
-                        for commt in (part.strip() for part in comment.split('|')):
-                            if not commt:
-                                continue
-                            review_comment = ExamReviewComments(
-                                attempt_id=attempt_id,
-                                question_id=question_id,
-                                comment_text=commt,
-                                category=key,
-                                reviewer_id='cac37fab-4de6-4792-969b-96e57e3c910a'  # or some system user id
-                            )
-                            session.add(review_comment)
+                pending_descriptive.append((ans, question, expected_answer))
         else:
-
-            # get the correct options for the question
-            correct_option_ids = set(
-                str(opt.options_id).lower() for opt in session.query(Option).filter_by(question_id=question_id, is_correct=1).all()
-            )
-
-            selected_option_ids = set(
-                str(ans.selected_option_id).lower() for ans in question_answers if ans.selected_option_id
-            )
-
-            missing_options = correct_option_ids - selected_option_ids
-            incorrect_options = selected_option_ids - correct_option_ids
-
-            is_fully_correct = len(correct_option_ids) > 0 and len(missing_options) == 0 and len(incorrect_options) == 0
-            awarded_marks = question.marks if is_fully_correct else 0
-            if is_fully_correct:
-                feedback = None
-            else:
-                feedback = f"Incorrect. Missing correct options: {missing_options}. " if missing_options else "" f"Incorrectly selected options: {incorrect_options}."
-
             # Update all answer rows for this question
-            for ans in question_answers:
-                ans.is_correct = 1 if is_fully_correct else 0
-                ans.marks_awarded = awarded_marks
-                ans.is_validated = 1
-                ans.feedback = feedback
-                session.add(ans)
+            results = score_choice_answers(question, options, question_answers)
+            for result in results:
+                objective_results[result["answer_id"]] = result
             # Optional: print/log debug info
-            if not is_fully_correct:
+            if results and not results[0]["is_correct"]:
                 print(f"[INVALID] Question: {question_id}")
-                print(f"  Selected: {selected_option_ids}")
-                print(f"  Missing correct options: {missing_options}")
-                print(f"  Incorrectly selected options: {incorrect_options}")
-    session.commit()
-    session.close()
+                print(f"  {results[0]['feedback']}")
 
-    # Update exam attempt score
-    session = db.connect()
+    if objective_results:
+        # Bulk UPDATE by primary key (one executemany); the loaded Answer
+        # objects are not marked dirty, so the flush does not repeat it.
+        session.execute(update(Answer), list(objective_results.values()))
+
+    # For descriptive questions, use LLM to evaluate. Answers already in the
+    # evaluation cache (or repeated within this attempt) are graded once; in
+    # batch mode the schedule's other pending answers join the batches.
+    schedule_id = pending_descriptive[0][0].schedule_id if pending_descriptive else None
+    institute_id = None
+    if schedule_id:
+        institute_id = session.query(Exam.institute_id).join(
+            ExamSchedule, ExamSchedule.exam_id == Exam.exam_id
+        ).filter(ExamSchedule.schedule_id == schedule_id).scalar()
+    # connect llm model; usage is rate limited per institute
+    openai_client_instance = openai_client(institute_id=institute_id)
+    model = openai_client_instance.model1
+    cache_key_groups = [
+        _cache_key_group(model, question.marks, expected_answer, ans.written_answer)
+        for ans, question, expected_answer in pending_descriptive
+    ]
+    evaluations = cached_evaluations(cache_key_groups, schedule_id=schedule_id)
+    to_grade = {}
+    for group, (ans, question, expected_answer) in zip(cache_key_groups, pending_descriptive):
+        if group not in evaluations:
+            to_grade.setdefault(group, (question.marks, expected_answer, ans.written_answer))
+    if to_grade and GRADING_BATCH_MODE and EVALUATION_CACHE_ENABLED:
+        peer_limit = min(GRADING_SCHEDULE_BATCH_ANSWERS - len(to_grade), GRADING_PEER_ANSWERS_PER_ANSWER * len(to_grade))
+        to_grade.update(_schedule_peer_answers(session, model, schedule_id, attempt_id, questions,
+                                               options_by_question, peer_limit, to_grade))
+    graded = _grade_descriptive_answers(
+        openai_client_instance, [(group,) + triple for group, triple in to_grade.items()]
+    )
+    store_evaluations(session, model, {to_grade[group]: evaluation for group, evaluation in graded.items()})
+    evaluations.update(graded)
+    manually_marked = _manually_marked_answer_ids(session, [ans.answer_id for ans, _, _ in pending_descriptive])
+    graded_answers = []
+    for group, (ans, question, expected_answer) in zip(cache_key_groups, pending_descriptive):
+        question_id = question.question_id
+        question_mark = question.marks
+        evaluation = evaluations[group]
+        if not evaluation.get("status", False):
+            # Keep the answer retryable, but persist a visible diagnostic instead
+            # of silently returning an empty feedback section.
+            evaluation_failures += 1
+            error_detail = evaluation.get("error") or "The AI evaluation service did not return a valid result."
+            print(f"AI evaluation failed for answer {ans.answer_id}: {error_detail}")
+            ans.feedback = "AI evaluation could not be completed. Please retry the evaluation."
+            ans.ai_confidence = None
+            ans.is_validated = 0
+            session.add(ans)
+            continue
+        score = evaluation.get("score", 0)
+        max_marks = question.marks
+        marks_awarded = (score / question_mark) * max_marks if question_mark > 0 else 0
+        ans.is_correct = 1 if marks_awarded == max_marks else 0
+        ans.ai_marks = marks_awarded
+        # A retry must not overwrite marks that an instructor already
+        # assigned while the AI evaluation was unavailable.
+        if str(ans.answer_id).lower() not in manually_marked:
+            ans.marks_awarded = marks_awarded
+        ans.is_validated = 1
+        feedback_part = evaluation.get("feedback", "")
+        ans.feedback = feedback_part
+        ai_confidence = evaluation.get("ai_confidence", 0)
+        ans.ai_confidence = ai_confidence
+        session.add(ans)
+        graded_answers.append((ans, str(ans.answer_id).lower() in manually_marked))
+
+        # update ExamReviewComments table category wise comments
+        for key in ["missing", "incomplete", "incorrect"]:
+            comment = str(evaluation.get(key) or "").strip()
+            if comment and comment.lower() not in {"none", "null", "n/a"}:
+                for commt in (part.strip() for part in comment.split('|')):
+                    if not commt:
+                        continue
+                    review_comment = ExamReviewComments(
+                        attempt_id=attempt_id,
+                        question_id=question_id,
+                        comment_text=commt,
+                        category=key,
+                        reviewer_id='cac37fab-4de6-4792-969b-96e57e3c910a'  # or some system user id
+                    )
+                    session.add(review_comment)
+
+    # Update exam attempt score in the same transaction as the answer marks
     try:
+        queue_graded_answers(session, institute_id, graded_answers)
         attempt = session.query(Exam_Attempt).filter_by(attempt_id=attempt_id).first()
         if attempt:
-            total_score = session.query(Answer).filter_by(attempt_id=attempt_id).with_entities(func.sum(Answer.marks_awarded)).scalar() or 0
-            attempt.score = total_score
-            total_possible_marks = session.query(Question).join(Answer, Answer.question_id == Question.question_id).filter(
-                Answer.attempt_id == attempt_id
-            ).with_entities(func.sum(Question.marks)).scalar() or 0
             passing_score = session.query(ExamSchedule).filter_by(schedule_id=attempt.schedule_id).first().pass_mark
+            # Totals from the rows already in memory, as SUM() would see them.
+            awarded = [
+                objective_results[ans.answer_id]["marks_awarded"] if ans.answer_id in objective_results else ans.marks_awarded
+                for ans in answers
+            ]
+            total_score = sum(marks for marks in awarded if marks is not None) or 0
+            attempt.score = total_score
+            total_possible_marks = sum(
+                questions[str(ans.question_id)].marks or 0 for ans in answers if str(ans.question_id) in questions
+            ) or 0
             if total_possible_marks > 0 and (total_score / total_possible_marks * 100) >= passing_score:
                 attempt.feedback = 'Pass'
             else:
@@ -505,8 +777,9 @@ def validate_answers(attempt_id):
             attempt.percentage = (total_score / total_possible_marks * 100) if total_possible_marks > 0 else 0
             attempt.status = 'evaluated'
             session.add(attempt)
-            session.commit()
+        session.commit()
     except Exception as e:
+        session.rollback()
         return {"statusMessage": f"Error updating exam attempt score: {str(e)}", "status": False}, 500
     finally:
         session.close()
@@ -519,6 +792,37 @@ def validate_answers(attempt_id):
         }, 200
     return {"statusMessage": "Answers validated successfully", "status": True, "evaluation_failures": 0}, 200
 
+def _defer_attempt_evaluation(attempt_id, delay_secs):
+    """Queue another evaluation run once the OpenAI circuit is expected to probe again."""
+    db = SQLiteDB()
+    session = db.connect()
+    if not session:
+        return
+    try:
+        run_after = datetime.datetime.utcnow() + datetime.timedelta(seconds=delay_secs)
+        # The running job would satisfy dedupe, so add the follow-up unconditionally.
+        enqueue_job(session, EVALUATE_ATTEMPT_JOB, attempt_id, run_after=run_after, dedupe=False)
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        print(f"{e} occurred while deferring evaluation of {attempt_id} at line {sys.exc_info()[-1].tb_lineno}")
+    finally:
+        session.close()
+
+def _run_evaluation_job(job):
+    response, status_code = validate_answers(job.target_id)
+    if status_code >= 500:
+        raise RuntimeError(response.get("statusMessage"))
+    if response.get("evaluation_failures") and openai_circuit.is_open():
+        # Answers that could not be graded stay unvalidated with
+        # ai_confidence None; grade them again after the outage.
+        _defer_attempt_evaluation(job.target_id, max(openai_circuit.retry_after(), EVALUATION_DEFER_SECS))
+        response["deferred"] = True
+    return response
+
+register_job_handler(EVALUATE_ATTEMPT_JOB, _run_evaluation_job)
+register_periodic_task('sweep_expired_attempts', ATTEMPT_SWEEP_INTERVAL_SECS, sweep_expired_attempts)
+
 # update review comments function can be added here
 def update_review_comments(request, action_type="edit", current_user=None):
     db = SQLiteDB()
@@ -624,6 +928,7 @@ def update_manual_review_status(request):
             return {"statusMessage": "Answer record not found", "status": False}, 404
         answer.manual_review_required = 1 if bool(data.get("manual_review_required")) else 0
         session.add(answer)
+        set_manual_review_required(session, answer)
         session.commit()
         return {"statusMessage": "Manual review status updated", "status": True,
                 "data": {"manual_review_required": bool(answer.manual_review_required)}}, 200
@@ -713,6 +1018,7 @@ def update_descriptive_marks(request, current_user=None):
         if hasattr(answer_record, 'edit_reason'):
             answer_record.edit_reason = edit_reason
         session.add(answer_record)
+        mark_answer_reviewed(session, answer_record, updated_by)
         session.commit()
 
         # Update exam attempt score
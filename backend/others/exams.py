@@ -1,10 +1,16 @@
 from db.models import Exam, ExamSchedule, Question, Option, Answer, Exam_Attempt, ExamMapping, Categories, ExamScheduleMapping, QuestionMapping, ExamQuestionMapping, CategoriesDepartments, CategoriesTeams, ExamsDepartments, ExamsTeams
 from db.db import SQLiteDB
-from others.exam_review import finalize_expired_attempts, is_after_everyone_finished_available, is_review_eligible_attempt, validate_answers
+from others.exam_review import attempt_deadline, attempt_evaluation_status, finalize_expired_attempts, is_after_everyone_finished_available, is_review_eligible_attempt, queue_attempt_evaluation
+from others.jobs import wake_job_workers
+from others.paper_cache import get_compiled_paper, invalidate_exam_papers
+from others.prepared_papers import prepared_question_ids
+from others.schedule_completion import record_attempts_finished
+from others.review_queue import discard_attempt_entries
+from others.autosave_journal import AUTOSAVE_WRITE_BEHIND, answer_values, append_autosave, flush_autosave_journal, upsert_attempt_answers
 import sys
 from datetime import datetime, timezone
-from db.models import Institute, InstituteCampus, User
-from sqlalchemy import func, or_
+from db.models import Institute, InstituteCampus, PreparedPaper, User
+from sqlalchemy import func, or_, select
 from sqlalchemy.orm import load_only
 import random
 
@@ -73,20 +79,17 @@ def safe_utc_isoformat(val):
 
 def _replace_attempt_answers(session, exam_attempt, answers):
     """Persist the latest browser answer snapshot without creating duplicates."""
+    discard_attempt_entries(session, exam_attempt.attempt_id)
     session.query(Answer).filter(Answer.attempt_id == exam_attempt.attempt_id).delete(synchronize_session=False)
     for question_id, answer_value in (answers or {}).items():
-        values = answer_value if isinstance(answer_value, list) else [answer_value]
-        for value in values:
-            if value is None or value == '':
-                continue
-            is_option = isinstance(value, str) and len(value) == 36 and '-' in value
+        for selected_option_id, written_answer in answer_values(answer_value):
             session.add(Answer(
                 user_id=exam_attempt.user_id,
                 schedule_id=exam_attempt.schedule_id,
                 question_id=question_id,
                 attempt_id=exam_attempt.attempt_id,
-                selected_option_id=value if is_option else None,
-                written_answer=None if is_option else str(value)
+                selected_option_id=selected_option_id,
+                written_answer=written_answer
             ))
 
 
@@ -105,12 +108,13 @@ def _category_pool_question_ids(session, category_id):
     return [r.question_id for r in rows]
 
 
-def _resolve_fixed_question_ids(session, category_id, number_of_questions, question_ids):
+def _resolve_fixed_question_ids(session, category_id, number_of_questions, question_ids, pool_ids=None):
     """Resolve the fixed (non-randomized) question set for a category.
 
     Admin hand-picks (if any) are honored as-is. Any remaining slots up to
     number_of_questions are filled with a one-time random pick from the
     category's question bank, so every user is served the exact same set.
+    Callers that already loaded the bank pass it as pool_ids.
     """
     seen = set()
     unique_ids = []
@@ -121,7 +125,8 @@ def _resolve_fixed_question_ids(session, category_id, number_of_questions, quest
             unique_ids.append(qid)
 
     if number_of_questions and len(unique_ids) < number_of_questions:
-        pool_ids = _category_pool_question_ids(session, category_id)
+        if pool_ids is None:
+            pool_ids = _category_pool_question_ids(session, category_id)
         remaining_pool = [qid for qid in pool_ids if str(qid) not in seen]
         needed = number_of_questions - len(unique_ids)
         if needed >= len(remaining_pool):
@@ -346,6 +351,10 @@ def update_exam(request):
                     )
                     session.add(add_exam_question_mapping)
 
+        # No schedule of this exam has attempts yet, so question sets drawn
+        # ahead of time can simply be drawn again from the new definition.
+        session.query(PreparedPaper).filter(PreparedPaper.exam_id == exam_id).delete(synchronize_session=False)
+        invalidate_exam_papers(session)
         session.commit()
         return {"statusMessage": "Exam updated successfully", "status": True}, 200
     except Exception as e:
@@ -371,6 +380,7 @@ def delete_exam(exam_id, deleted_by):
         session.query(ExamMapping).filter_by(exam_id=exam_id).delete()
         # delete the exam
         session.delete(exam)
+        invalidate_exam_papers(session)
         session.commit()
         return {"statusMessage": "Exam deleted successfully", "status": True}, 200
     except Exception as e:
@@ -784,9 +794,7 @@ def get_user_exam_details(request):
             attempted = user_attempt > 0
             expired = bool(schedule_obj.end_time and current_time > schedule_obj.end_time)
             # Finalize expired browser-abandoned attempts before calculating review eligibility.
-            finalized_ids = finalize_expired_attempts(session, schedule_obj, attempts, current_time)
-            for finalized_id in finalized_ids:
-                validate_answers(finalized_id)
+            finalize_expired_attempts(session, schedule_obj, attempts, current_time)
             # Review eligibility follows persisted attempt status, never the frontend Completed label.
             submitted_attempts = [attempt for attempt in attempts if is_review_eligible_attempt(attempt)]
             # Keep user completion separate from the schedule becoming expired.
@@ -947,79 +955,49 @@ def launch_exam_details(schedule_id, user_id):
 
     try:
         # An unpublished schedule must behave like a missing schedule for all
-        # student-facing access, including direct launch requests.
-        exam_schedule = session.query(ExamSchedule).filter(
+        # student-facing access, including direct launch requests. The user's
+        # latest attempt number comes back with it to save a round trip.
+        last_attempt_number = select(func.max(Exam_Attempt.attempt_number)).where(
+            Exam_Attempt.schedule_id == schedule_id,
+            Exam_Attempt.user_id == user_id
+        ).scalar_subquery()
+        row = session.query(ExamSchedule, last_attempt_number).filter(
             ExamSchedule.schedule_id == schedule_id,
             ExamSchedule.published == 1
         ).first()
-        if not exam_schedule:
+        if not row:
             return {"statusMessage": "Schedule not found", "status": False}, 404
+        exam_schedule, last_attempt_number = row
 
-        # get Exam details
-        exam_data = session.query(Exam).filter_by(exam_id=exam_schedule.exam_id).first()
-
-        # get ExamMapping details
-        exam_mapping = session.query(ExamMapping).filter_by(exam_id=exam_schedule.exam_id).all()
-
-        category_ids = [m.category_id for m in exam_mapping if getattr(m, "category_id", None)]
-
-
-        randomized_question_ids = []
-        non_randomized_question_ids = []
-        
-        for mapping in exam_mapping:
-            if mapping.randomize_questions == 1:
-                # Get random questions for this category
-                all_questions = session.query(QuestionMapping.question_id).filter(
-                    QuestionMapping.category_id == mapping.category_id
-                ).all()
-                question_ids_for_category = [q.question_id for q in all_questions]
-                
-                # Randomly select the specified number of questions
-                if len(question_ids_for_category) >= mapping.number_of_questions:
-                    selected_questions = random.sample(question_ids_for_category, mapping.number_of_questions)
-                else:
-                    selected_questions = question_ids_for_category  # Take all if not enough
-                randomized_question_ids.extend(selected_questions)
-            else:
-                # Prefer the fixed questions saved with the test. Legacy tests
-                # may have the category mapping but no ExamQuestionMapping rows;
-                # fill those from the same category pool used when tests are
-                # created so a valid test does not fail launch with a 404.
-                predefined_questions = session.query(ExamQuestionMapping.question_id).filter(
-                    ExamQuestionMapping.exam_id == exam_schedule.exam_id,
-                    ExamQuestionMapping.category_id == mapping.category_id
-                ).all()
-                fixed_question_ids = [q.question_id for q in predefined_questions]
-                non_randomized_question_ids.extend(_resolve_fixed_question_ids(
-                    session,
-                    mapping.category_id,
-                    mapping.number_of_questions or len(fixed_question_ids),
-                    fixed_question_ids
-                ))
-        
-        # Combine both randomized and non-randomized questions
-        question_ids = randomized_question_ids + non_randomized_question_ids
+        # The exam header, category pools, fixed sets and question payloads
+        # come from the compiled paper; only the per-student draw happens here.
+        paper = get_compiled_paper(session, exam_schedule.exam_id)
+        if not paper:
+            return {"statusMessage": "Exam not found", "status": False}, 404
+        if exam_schedule.pregenerate_papers:
+            question_ids = prepared_question_ids(session, exam_schedule, user_id, paper)
+        else:
+            question_ids = paper.draw_question_ids()
 
-        questions = session.query(Question).filter(Question.question_id.in_(question_ids)).all()
-        if not questions:
+        if not question_ids:
             return {"statusMessage": "No questions found for this test", "status": False}, 404
 
         # Only consume an attempt after the schedule and its questions have
         # passed validation. A failed launch must not increment attempt count.
-        existing_attempt = session.query(Exam_Attempt).filter_by(
-            schedule_id=schedule_id,
-            user_id=user_id
-        ).order_by(Exam_Attempt.attempt_number.desc()).first()
-        attempt_number = existing_attempt.attempt_number + 1 if existing_attempt else 1
+        attempt_number = (last_attempt_number or 0) + 1
+        started_date = datetime.utcnow()
         new_attempt = Exam_Attempt(
             schedule_id=schedule_id,
             user_id=user_id,
             attempt_number=attempt_number,
-            started_date=datetime.utcnow(),
+            started_date=started_date,
+            deadline_at=attempt_deadline(started_date, paper.duration_mins, exam_schedule.end_time),
             status="in_progress"
         )
         session.add(new_attempt)
+        session.flush()
+        # Read before the commit expires the row, which would cost a reload.
+        attempt_id = new_attempt.attempt_id
         session.commit()
         # get list of question ids from question mapping
         # question_ids = []
@@ -1049,25 +1027,16 @@ def launch_exam_details(schedule_id, user_id):
         # question_ids = question_mapping.question_ids.split(',') if question_mapping and question_mapping.question_ids else []
 
         exam_detail = {        
-            "exam_id": exam_data.exam_id,
+            "exam_id": paper.exam_id,
             "schedule_id": schedule_id,
-            "title": exam_data.title,
-            "attempt_id": new_attempt.attempt_id,
-            "duration_mins": exam_data.duration_mins,
-            "total_questions": exam_data.total_questions}
-
-
-        # get all the Questions and options for exam id
-        question_list = []
-        for question in questions:
-            options = session.query(Option).filter_by(question_id=question.question_id).all()
-            option_list = [{"id": opt.options_id, "text": opt.option_text} for opt in options]
-            question_list.append({
-                "question_id": question.question_id,
-                "question_text": question.question_text,
-                "question_type": question.question_type,
-                "options": option_list if question.question_type in ['choose', 'multi'] else []
-            })
+            "title": paper.title,
+            "attempt_id": attempt_id,
+            # Autosave revisions continue from here; a new attempt has stored none.
+            "autosave_revision": 0,
+            "duration_mins": paper.duration_mins,
+            "total_questions": paper.total_questions}
+
+        question_list = paper.question_payloads(question_ids)
 
         json_data = {
             "statusMessage": "Exam details retrieved successfully",
@@ -1105,15 +1074,15 @@ def get_active_exam_status(attempt_id, user_id):
         if not exam_schedule:
             return {"statusMessage": "Schedule not found", "status": False}, 404
 
-        finalized_ids = finalize_expired_attempts(session, exam_schedule, [exam_attempt])
-        for finalized_id in finalized_ids:
-            validate_answers(finalized_id)
+        finalize_expired_attempts(session, exam_schedule, [exam_attempt])
 
         return {
             "statusMessage": "Exam status retrieved successfully",
             "status": True,
             "published": bool(exam_schedule.published),
-            "attempt_status": exam_attempt.status
+            "attempt_status": exam_attempt.status,
+            "autosave_revision": exam_attempt.autosave_revision or 0,
+            "evaluation_status": attempt_evaluation_status(session, exam_attempt)
         }, 200
     except Exception as e:
         print(f"{e} occurred while retrieving active exam status at line {sys.exc_info()[-1].tb_lineno}")
@@ -1133,9 +1102,43 @@ def autosave_exam_answers(data, authenticated_user_id=None):
             return {"statusMessage": "Attempt not found", "status": False}, 404
         if attempt.status != 'in_progress':
             return {"statusMessage": "Attempt is already finalized", "status": False}, 409
-        _replace_attempt_answers(session, attempt, data.get("answers", {}))
+
+        if "changes" not in data:
+            # Older clients post the whole answer snapshot.
+            _replace_attempt_answers(session, attempt, data.get("answers", {}))
+            session.commit()
+            return {"statusMessage": "Answers saved", "status": True}, 200
+
+        changes = data.get("changes") or {}
+        try:
+            revision = int(data.get("revision"))
+        except (TypeError, ValueError):
+            return {"statusMessage": "revision must be an integer", "status": False}, 400
+        if not isinstance(changes, dict):
+            return {"statusMessage": "changes must map question ids to answers", "status": False}, 400
+
+        # Claim the revision atomically so that a delayed or retried request
+        # can never overwrite answers saved by a newer one.
+        claimed = session.query(Exam_Attempt).filter(
+            Exam_Attempt.attempt_id == attempt.attempt_id,
+            Exam_Attempt.status == 'in_progress',
+            or_(Exam_Attempt.autosave_revision == None, Exam_Attempt.autosave_revision < revision)
+        ).update({Exam_Attempt.autosave_revision: revision}, synchronize_session=False)
+        if not claimed:
+            session.rollback()
+            # The rollback expired the attempt, so this reads the stored revision.
+            return {
+                "statusMessage": "A newer autosave has already been applied",
+                "status": False,
+                "errorCode": "STALE_REVISION",
+                "revision": attempt.autosave_revision
+            }, 409
+        if AUTOSAVE_WRITE_BEHIND:
+            append_autosave(session, attempt, revision, changes)
+        else:
+            upsert_attempt_answers(session, attempt, changes)
         session.commit()
-        return {"statusMessage": "Answers saved", "status": True}, 200
+        return {"statusMessage": "Answers saved", "status": True, "revision": revision}, 200
     except Exception as e:
         session.rollback()
         print(f"{e} occurred while autosaving exam answers at line {sys.exc_info()[-1].tb_lineno}")
@@ -1160,7 +1163,9 @@ def submit_exam_answers(data, authenticated_user_id=None):
         # been unpublished after the student launched it. When an attempt
         # exists, bind this check to its actual schedule as well as the
         # request's schedule_id so a different published ID cannot bypass it.
-        exam_attempt = session.query(Exam_Attempt).filter_by(attempt_id=attempt_id).first()
+        # The row is locked so the expiry sweeper (which skips locked rows)
+        # cannot finalize it between this read and the status change below.
+        exam_attempt = session.query(Exam_Attempt).filter_by(attempt_id=attempt_id).with_for_update().first()
         if not exam_attempt or (authenticated_user_id and str(exam_attempt.user_id) != str(authenticated_user_id)):
             session.close()
             return {"statusMessage": "Attempt not found", "status": False}, 404
@@ -1184,15 +1189,21 @@ def submit_exam_answers(data, authenticated_user_id=None):
         schedule_id = attempt_schedule_id
 
         # Save the final snapshot and status atomically so retries cannot duplicate answers.
+        flush_autosave_journal(session, [exam_attempt.attempt_id])
         _replace_attempt_answers(session, exam_attempt, answers)
+        already_finished = exam_attempt.submitted_date is not None or exam_attempt.status in ("submitted", "evaluated")
         exam_attempt.submitted_date = submitted_date
         exam_attempt.status = "submitted"
+        if not already_finished:
+            record_attempts_finished(session, [exam_attempt])
+        queue_attempt_evaluation(session, exam_attempt.attempt_id)
         session.commit()
         session.close()
-        validate_answers(attempt_id)
+        wake_job_workers()
         json_data = {
             "statusMessage": "Exam answers submitted successfully",
             "status": True,
+            "evaluation_status": "submitted",
         }
         return json_data, 200
     except Exception as e:
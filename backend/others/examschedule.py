@@ -11,11 +11,18 @@ from db.models import (
     InstituteDepartment,
     InstituteTeam,
     InstituteCampus,
+    PreparedPaper,
 )
 from db.db import SQLiteDB
 import sys
 import datetime
 from others.exam_review import validate_answers
+from others.prepared_papers import queue_paper_preparation
+from others.schedule_completion import (
+    delete_schedule_completion,
+    recompute_schedule_completion,
+    record_attempts_finished,
+)
 from sqlalchemy import func, or_, String
 from sqlalchemy.exc import DBAPIError
 
@@ -157,6 +164,7 @@ def add_exam_schedule(request):
     multiple_review = _as_bool(
         data.get("multiple_review", data.get("multiplereview")), False
     )
+    pregenerate_papers = _as_bool(data.get("pregenerate_papers"), False)
     created_by = data.get("created_by")
 
     missing_fields = [
@@ -210,6 +218,7 @@ def add_exam_schedule(request):
             show_correct_answers=review_settings["show_correct_answers"],
             show_student_answers=review_settings["show_student_answers"],
             show_explanations=review_settings["show_explanations"],
+            pregenerate_papers=pregenerate_papers,
             duration_mins=duration_mins,
             total_questions=total_questions,
             created_by=created_by,
@@ -224,7 +233,9 @@ def add_exam_schedule(request):
         for user_id in assigned_user_ids:
             mapping = ExamScheduleMapping(schedule_id=schedule_id, user_id=user_id)
             session.add(mapping)
+        recompute_schedule_completion(session, schedule_id)
         session.commit()
+        queue_paper_preparation(add_schedule)
         json_data = {"statusMessage": "Schedule added successfully", "status": True}
         return json_data, 200
     except Exception as e:
@@ -335,6 +346,9 @@ def update_exam_schedule(request):
                 sched.number_of_attempts = exam.number_of_attempts
                 sched.pass_mark = exam.pass_mark
 
+        if "pregenerate_papers" in data and not has_attendance:
+            sched.pregenerate_papers = _as_bool(data.get("pregenerate_papers"), False)
+
         if "total_questions" in data and not has_attendance:
             try:
                 sched.total_questions = int(data.get("total_questions") or 0)
@@ -477,10 +491,20 @@ def update_exam_schedule(request):
                     session.add(mapping)
             except Exception as e:
                 print(f"Error updating mappings: {e}")
+            # Outside the try above: a failed recount must fail the update,
+            # not leave the completion counters stale.
+            recompute_schedule_completion(session, schedule_id)
+
+        if not has_attendance:
+            # Nothing has been served yet; redraw from the current exam and assignments.
+            session.query(PreparedPaper).filter_by(schedule_id=schedule_id).delete(
+                synchronize_session=False
+            )
 
         sched.updated_date = datetime.datetime.utcnow()
         session.add(sched)
         session.commit()
+        queue_paper_preparation(sched)
 
         return {"statusMessage": "Schedule updated successfully", "status": True}, 200
     except Exception as e:
@@ -809,6 +833,7 @@ def get_exam_schedule_details(request):
                     "user_review": True if schedule.user_review == 1 else False,
                     "instant_review": True if schedule.user_review == 1 else False,
                     "multiple_review": bool(schedule.multiple_review),
+                    "pregenerate_papers": bool(schedule.pregenerate_papers),
                     "review_mode": schedule.review_mode
                     or ("instant" if schedule.user_review == 1 else "no_review"),
                     "manual_review_enabled": bool(schedule.manual_review_enabled),
@@ -917,7 +942,9 @@ def manage_schedule(action, uuid, updated_by="system"):
             sched.updated_by = updated_by
         elif action == "delete":
             # delete mappings and schedule
+            session.query(PreparedPaper).filter_by(schedule_id=uuid).delete()
             session.query(ExamScheduleMapping).filter_by(schedule_id=uuid).delete()
+            delete_schedule_completion(session, uuid)
             session.delete(sched)
             session.commit()
             return {"statusMessage": "Schedule deleted", "status": True}, 200
@@ -927,6 +954,7 @@ def manage_schedule(action, uuid, updated_by="system"):
         sched.updated_date = datetime.datetime.utcnow()
         session.add(sched)
         session.commit()
+        queue_paper_preparation(sched)
         return {"statusMessage": "Schedule updated", "status": True}, 200
     except Exception as e:
         session.rollback()
@@ -1037,12 +1065,17 @@ def submit_exam_answers(data):
 
         # update records in Exam_Attempt
         # Update the Exam_Attempt record for the given attempt_id
+        # Locked so the expiry sweeper cannot finalize it (and count it as
+        # finished) between this read and the status change.
         exam_attempt = (
-            session.query(Exam_Attempt).filter_by(attempt_id=attempt_id).first()
+            session.query(Exam_Attempt).filter_by(attempt_id=attempt_id).with_for_update().first()
         )
         if exam_attempt:
+            already_finished = exam_attempt.submitted_date is not None or exam_attempt.status in ("submitted", "evaluated")
             exam_attempt.submitted_date = submitted_date
             exam_attempt.status = "submitted"
+            if not already_finished:
+                record_attempts_finished(session, [exam_attempt])
             session.commit()
 
         for question_id, answer_value in answers.items():
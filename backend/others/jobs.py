@@ -0,0 +1,184 @@
+import datetime
+import json
+import os
+import socket
+import sys
+import threading
+
+from db.db import SQLiteDB
+from db.models import BackgroundJob
+from others.background import register_periodic_task
+
+# Durable job queue on dbo.BackgroundJobs. Handlers enqueue work inside
+# their own transaction (so a job exists exactly when the change that needs
+# it commits) and job workers claim rows with UPDLOCK/READPAST, so any number
+# of threads and processes can share the queue.
+#
+# Each web worker runs JOB_WORKER_THREADS worker threads, started with the
+# background tasks. Dedicated worker processes run scripts/run_job_worker.py;
+# set JOB_WORKER_THREADS=0 on the web tier to leave the work to them.
+JOB_WORKER_THREADS = int(os.getenv('JOB_WORKER_THREADS', 2))
+JOB_POLL_INTERVAL_SECS = float(os.getenv('JOB_POLL_INTERVAL_SECS', 2))
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', 5))
+JOB_RETRY_BASE_SECS = float(os.getenv('JOB_RETRY_BASE_SECS', 30))
+# A running job whose worker died is re-queued after this long.
+JOB_LOCK_TIMEOUT_SECS = float(os.getenv('JOB_LOCK_TIMEOUT_SECS', 900))
+
+_handlers = {}
+_wake = threading.Event()
+_workers_pid = None
+_workers_lock = threading.Lock()
+
+
+def register_job_handler(job_type, handler):
+    """handler(job) runs the job; raising schedules a retry. Its return value is stored as the result."""
+    _handlers[job_type] = handler
+
+
+def enqueue_job(session, job_type, target_id=None, payload=None, run_after=None, dedupe=True):
+    """Add a job to the caller's transaction; the caller commits.
+
+    With dedupe, nothing is added while a queued or running job of the same
+    type already exists for target_id.
+    """
+    if dedupe and target_id is not None:
+        pending = session.query(BackgroundJob.job_id).filter(
+            BackgroundJob.job_type == job_type,
+            BackgroundJob.target_id == str(target_id),
+            BackgroundJob.status.in_(('queued', 'running'))
+        ).first()
+        if pending:
+            return None
+    job = BackgroundJob(
+        job_type=job_type,
+        target_id=str(target_id) if target_id is not None else None,
+        payload=json.dumps(payload) if payload is not None else None,
+        status='queued',
+        run_after=run_after or datetime.datetime.utcnow()
+    )
+    session.add(job)
+    return job
+
+
+def wake_job_workers():
+    _wake.set()
+
+
+def latest_job_status(session, job_type, target_id):
+    row = session.query(BackgroundJob.status).filter(
+        BackgroundJob.job_type == job_type,
+        BackgroundJob.target_id == str(target_id)
+    ).order_by(BackgroundJob.created_date.desc()).first()
+    return row.status if row else None
+
+
+def _worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.current_thread().name}"
+
+
+def _claim_job(session):
+    job = session.query(BackgroundJob).filter(
+        BackgroundJob.status == 'queued',
+        BackgroundJob.run_after <= datetime.datetime.utcnow(),
+        BackgroundJob.job_type.in_(list(_handlers))
+    ).order_by(BackgroundJob.run_after).with_for_update(skip_locked=True).first()
+    if job is None:
+        session.rollback()
+        return None
+    job.status = 'running'
+    job.attempts = (job.attempts or 0) + 1
+    job.locked_by = _worker_name()[:255]
+    job.locked_at = datetime.datetime.utcnow()
+    job.updated_date = job.locked_at
+    session.commit()
+    return job
+
+
+def run_next_job():
+    """Claim and run one due job; returns False when the queue had nothing to do."""
+    if not _handlers:
+        return False
+    db = SQLiteDB()
+    session = db.connect()
+    if not session:
+        return False
+    try:
+        job = _claim_job(session)
+        if job is None:
+            return False
+        try:
+            result = _handlers[job.job_type](job)
+            job.status = 'done'
+            job.result = json.dumps(result, default=str) if result is not None else None
+            job.last_error = None
+        except Exception as e:
+            print(f"{e} occurred while running {job.job_type} job {job.job_id} at line {sys.exc_info()[-1].tb_lineno}")
+            session.rollback()
+            job.last_error = str(e)
+            if job.attempts >= JOB_MAX_ATTEMPTS:
+                job.status = 'failed'
+            else:
+                job.status = 'queued'
+                delay = JOB_RETRY_BASE_SECS * (2 ** (job.attempts - 1))
+                job.run_after = datetime.datetime.utcnow() + datetime.timedelta(seconds=delay)
+        job.locked_by = None
+        job.locked_at = None
+        job.updated_date = datetime.datetime.utcnow()
+        session.commit()
+        return True
+    except Exception as e:
+        session.rollback()
+        print(f"{e} occurred while claiming a job at line {sys.exc_info()[-1].tb_lineno}")
+        return False
+    finally:
+        session.close()
+
+
+def requeue_stale_jobs():
+    db = SQLiteDB()
+    session = db.connect()
+    if not session:
+        return
+    try:
+        cutoff = datetime.datetime.utcnow() - datetime.timedelta(seconds=JOB_LOCK_TIMEOUT_SECS)
+        requeued = session.query(BackgroundJob).filter(
+            BackgroundJob.status == 'running',
+            BackgroundJob.locked_at < cutoff
+        ).update({
+            BackgroundJob.status: 'queued',
+            BackgroundJob.locked_by: None,
+            BackgroundJob.locked_at: None,
+            BackgroundJob.updated_date: datetime.datetime.utcnow()
+        }, synchronize_session=False)
+        session.commit()
+        if requeued:
+            print(f"Re-queued {requeued} stale background jobs")
+    except Exception as e:
+        session.rollback()
+        print(f"{e} occurred while re-queueing stale jobs at line {sys.exc_info()[-1].tb_lineno}")
+    finally:
+        session.close()
+
+
+def work_forever():
+    while True:
+        if not run_next_job():
+            _wake.wait(JOB_POLL_INTERVAL_SECS)
+            _wake.clear()
+
+
+def start_job_workers(threads=None):
+    """Start this process's job worker threads once; safe to call per request."""
+    global _workers_pid
+    threads = JOB_WORKER_THREADS if threads is None else threads
+    if threads <= 0 or _workers_pid == os.getpid():
+        return
+    with _workers_lock:
+        if _workers_pid == os.getpid():
+            return
+        _workers_pid = os.getpid()
+    for i in range(threads):
+        threading.Thread(target=work_forever, name=f'edu-job-worker-{i + 1}', daemon=True).start()
+
+
+register_periodic_task('requeue_stale_jobs', 60, requeue_stale_jobs)
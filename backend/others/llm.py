@@ -1,11 +1,17 @@
 
+import email.utils
 import json
 import os
+import random
+import threading
+import time
 from pathlib import Path
 
-import httpx
 from dotenv import dotenv_values
 
+from others.circuit_breaker import CircuitBreaker
+from others.llm_limits import llm_limiter
+
 
 class _ErrorResponse:
     def __init__(self, status_code, message):
@@ -15,8 +21,114 @@ class _ErrorResponse:
     def json(self):
         return {"error": self._message}
 
+# One pooled httpx.Client per process keeps connections to the API alive
+# between calls instead of paying a TCP+TLS handshake for every answer.
+# Read timeouts differ per call type: grading calls are short, question
+# generation can return thousands of tokens. 429 and 5xx responses (and
+# connection failures) are retried with full-jitter exponential backoff,
+# waiting at least as long as the server's Retry-After asks.
+OPENAI_HTTP2 = str(os.getenv('OPENAI_HTTP2', '0')).strip().lower() in ('1', 'true', 'yes', 'on')
+OPENAI_MAX_CONNECTIONS = int(os.getenv('OPENAI_MAX_CONNECTIONS', 20))
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv('OPENAI_MAX_KEEPALIVE_CONNECTIONS', 10))
+OPENAI_KEEPALIVE_EXPIRY_SECS = float(os.getenv('OPENAI_KEEPALIVE_EXPIRY_SECS', 60))
+OPENAI_TIMEOUTS = {
+    'grading': (float(os.getenv('OPENAI_GRADING_CONNECT_TIMEOUT', 5)), float(os.getenv('OPENAI_GRADING_READ_TIMEOUT', 30))),
+    'generation': (float(os.getenv('OPENAI_GENERATION_CONNECT_TIMEOUT', 5)), float(os.getenv('OPENAI_GENERATION_READ_TIMEOUT', 120))),
+}
+OPENAI_MAX_RETRIES = int(os.getenv('OPENAI_MAX_RETRIES', 3))
+OPENAI_RETRY_BASE_SECS = float(os.getenv('OPENAI_RETRY_BASE_SECS', 0.5))
+OPENAI_RETRY_MAX_SECS = float(os.getenv('OPENAI_RETRY_MAX_SECS', 20))
+_RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# Opens when OpenAI keeps failing or is too slow; calls then fail fast with
+# a 503 instead of waiting on timeouts (see others/circuit_breaker.py).
+openai_circuit = CircuitBreaker('openai')
+
+_http_client = None
+_http_client_pid = None
+_http_client_lock = threading.Lock()
+
+
+def get_http_client():
+    """Return this process's pooled client, creating it on first use (and after a fork)."""
+    global _http_client, _http_client_pid
+    if _http_client is not None and _http_client_pid == os.getpid():
+        return _http_client
+    import httpx
+    with _http_client_lock:
+        if _http_client is None or _http_client_pid != os.getpid():
+            http2 = OPENAI_HTTP2
+            if http2:
+                try:
+                    import h2  # noqa: F401
+                except ImportError:
+                    print("OPENAI_HTTP2 is set but the h2 package is not installed; using HTTP/1.1")
+                    http2 = False
+            _http_client = httpx.Client(
+                http2=http2,
+                verify=False,
+                limits=httpx.Limits(
+                    max_connections=OPENAI_MAX_CONNECTIONS,
+                    max_keepalive_connections=OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY_SECS
+                )
+            )
+            _http_client_pid = os.getpid()
+    return _http_client
+
+
+def _retry_after_seconds(response):
+    value = response.headers.get("retry-after") if response is not None else None
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+        return max(retry_at.timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def _backoff_seconds(attempt, response=None):
+    delay = random.uniform(0, min(OPENAI_RETRY_MAX_SECS, OPENAI_RETRY_BASE_SECS * (2 ** attempt)))
+    retry_after = _retry_after_seconds(response)
+    if retry_after is not None:
+        delay = max(delay, min(retry_after, OPENAI_RETRY_MAX_SECS))
+    return delay
+
+
+def _post_with_retries(url, headers, payload, call_type):
+    import httpx
+    connect_timeout, read_timeout = OPENAI_TIMEOUTS.get(call_type, OPENAI_TIMEOUTS['generation'])
+    timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+    client = get_http_client()
+    attempt = 0
+    while True:
+        try:
+            response = client.post(url, headers=headers, json=payload, timeout=timeout)
+        except httpx.ReadTimeout:
+            # The request may still be running upstream; retrying would
+            # double the cost of a slow call.
+            return _ErrorResponse(504, "OpenAI request timed out")
+        except httpx.RequestError as exc:
+            if attempt >= OPENAI_MAX_RETRIES:
+                return _ErrorResponse(502, str(exc))
+            time.sleep(_backoff_seconds(attempt))
+            attempt += 1
+            continue
+        if response.status_code not in _RETRY_STATUS_CODES or attempt >= OPENAI_MAX_RETRIES:
+            return response
+        delay = _backoff_seconds(attempt, response)
+        print(f"OpenAI returned {response.status_code}; retrying in {delay:.1f}s ({attempt + 1}/{OPENAI_MAX_RETRIES})")
+        time.sleep(delay)
+        attempt += 1
+
+
 class openai_client:
-    def __init__(self,api_key=None,  model=None):
+    def __init__(self,api_key=None,  model=None, institute_id=None):
         # Resolve the file relative to this module so configuration does not
         # depend on the directory from which Flask was started. Environment
         # variables take precedence in deployed environments.
@@ -31,13 +143,16 @@ class openai_client:
         self.model1 = (model or configured_model1).strip()
         self.model2 = (model or configured_model2).strip()
 
+        # Calls are rate limited per institute (see others/llm_limits.py).
+        self.institute_id = institute_id
+
         self.url = "https://api.openai.com/v1/chat/completions"
         self.headers = {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json",
         }
 
-    def chat_completion(self, system_message, InputData, aimodel =1, max_tokens: int = 5200, temperature: float = 0.2):
+    def chat_completion(self, system_message, InputData, aimodel =1, max_tokens: int = 5200, temperature: float = 0.2, call_type: str = 'generation'):
         if not self.api_key:
             return _ErrorResponse(
                 503,
@@ -61,13 +176,68 @@ class openai_client:
             "max_tokens": max_tokens
         }
 
-        try:
-            response = httpx.post(self.url, headers=self.headers, json=payload, verify=False, timeout=30.0)
-        except httpx.ReadTimeout:
-            response = _ErrorResponse(504, "OpenAI request timed out")
-        except httpx.RequestError as exc:
-            response = _ErrorResponse(502, str(exc))
+        if not openai_circuit.allow():
+            return _ErrorResponse(
+                503,
+                "The AI service is temporarily unavailable. Please try again shortly."
+            )
+        estimated_tokens = (len(system_message or "") + len(InputData or "")) // 4 + max_tokens
+        grant = llm_limiter.acquire(self.institute_id, call_type, estimated_tokens)
+        if grant is None:
+            openai_circuit.cancel()
+            return _ErrorResponse(
+                429,
+                "The AI usage limit has been reached. Please try again in a minute."
+            )
+        started = time.monotonic()
+        response = _post_with_retries(self.url, self.headers, payload, call_type)
+        openai_circuit.record(response.status_code < 500 and response.status_code != 429, time.monotonic() - started)
+        grant.settle(response)
         return response
+
+
+def _response_content(response_json):
+    result_text = response_json['choices'][0]['message']['content'].strip()
+
+    # Remove markdown code blocks if present
+    if result_text.startswith('```'):
+        result_text = result_text.split('```')[1]
+        if result_text.startswith('json'):
+            result_text = result_text[4:]
+        result_text = result_text.strip()
+    return result_text
+
+
+def _normalize_ai_confidence(result, question_mark):
+    # Ensure ai_confidence exists and is an int between 0 and 100
+    ai_conf = result.get('ai_confidence')
+    if isinstance(ai_conf, int) and 0 <= ai_conf <= 100:
+        result['ai_confidence'] = ai_conf
+    else:
+        # Fallback: derive confidence from numeric score if possible
+        try:
+            max_marks = int(question_mark) if str(question_mark).isdigit() else None
+            score = result.get('score')
+            if max_marks and isinstance(score, (int, float)):
+                # Map score in [0, max_marks] -> confidence in [0,100]
+                conf = int(round(100.0 * float(score) / float(max_marks)))
+                result['ai_confidence'] = max(0, min(100, conf))
+            else:
+                result['ai_confidence'] = 0
+        except Exception:
+            result['ai_confidence'] = 0
+
+
+# Part of every evaluation cache key; bump it whenever the single-answer
+# grading prompt or result format change so earlier evaluations are not
+# served again. The batched prompt has its own DESCRIPTIVE_BATCH_PROMPT_VERSION,
+# and every successful result carries the version of the prompt that graded it.
+DESCRIPTIVE_PROMPT_VERSION = 'descriptive-v2'
+# Completion budget for one evaluation (the request's max_tokens, as before
+# rate limiting). The limiter reserves it and settles to the reported usage.
+DESCRIPTIVE_MAX_TOKENS = int(os.getenv('DESCRIPTIVE_MAX_TOKENS', 5200))
+
+
 def descriptive_evaluation(api_client, question_mark, expected_answer, student_answer):
     system_message = '''You are an automated, impartial answer evaluator. Always respond ONLY with a single, valid JSON object (no markdown, no surrounding text). Follow these rules:
         1. Output exactly the JSON object described in the user instructions and nothing else.
@@ -101,39 +271,15 @@ def descriptive_evaluation(api_client, question_mark, expected_answer, student_a
         Note: Use the pipe character '|' as the separator between list items (no spaces around the pipe) to avoid ambiguity with commas. If there are no items for a field, return "None".
         '''
     try:
-        response = api_client.chat_completion(system_message, user_message)
+        response = api_client.chat_completion(system_message, user_message, max_tokens=DESCRIPTIVE_MAX_TOKENS, call_type='grading')
         response_json = response.json()
         if response.status_code != 200:
             result = {"status": False, "error": response_json.get("error", "Unknown error")}
             return result
-        result_text = response_json['choices'][0]['message']['content'].strip()
-        
-        # Remove markdown code blocks if present
-        if result_text.startswith('```'):
-            result_text = result_text.split('```')[1]
-            if result_text.startswith('json'):
-                result_text = result_text[4:]
-            result_text = result_text.strip()
-        
-        result = json.loads(result_text)
-        # Ensure ai_confidence exists and is an int between 0 and 100
-        ai_conf = result.get('ai_confidence')
-        if isinstance(ai_conf, int) and 0 <= ai_conf <= 100:
-            result['ai_confidence'] = ai_conf
-        else:
-            # Fallback: derive confidence from numeric score if possible
-            try:
-                max_marks = int(question_mark) if str(question_mark).isdigit() else None
-                score = result.get('score')
-                if max_marks and isinstance(score, (int, float)):
-                    # Map score in [0, max_marks] -> confidence in [0,100]
-                    conf = int(round(100.0 * float(score) / float(max_marks)))
-                    result['ai_confidence'] = max(0, min(100, conf))
-                else:
-                    result['ai_confidence'] = 0
-            except Exception:
-                result['ai_confidence'] = 0
+        result = json.loads(_response_content(response_json))
+        _normalize_ai_confidence(result, question_mark)
         result['status'] = True
+        result['prompt_version'] = DESCRIPTIVE_PROMPT_VERSION
     except Exception as e:
         print(f"Error in evaluate_topic_answer: {str(e)}" + " - Line # : " + str(e.__traceback__.tb_lineno))
         result = {
@@ -148,3 +294,129 @@ def descriptive_evaluation(api_client, question_mark, expected_answer, student_a
         }
     
     return result
+
+
+# Batched grading packs several answers into one request so the system
+# prompt and instructions are sent once per batch instead of once per answer.
+# Batches are cut by a rough prompt-token estimate (4 characters per token,
+# as in generate_questions) and by item count. Bump the version whenever the
+# batched prompt or its result format change.
+DESCRIPTIVE_BATCH_PROMPT_VERSION = 'descriptive-batch-v1'
+DESCRIPTIVE_BATCH_MAX_TOKENS = int(os.getenv('DESCRIPTIVE_BATCH_MAX_TOKENS', 6000))
+DESCRIPTIVE_BATCH_MAX_ITEMS = int(os.getenv('DESCRIPTIVE_BATCH_MAX_ITEMS', 10))
+# Completion budget reserved for each answer's result object.
+DESCRIPTIVE_BATCH_OUTPUT_TOKENS = int(os.getenv('DESCRIPTIVE_BATCH_OUTPUT_TOKENS', 400))
+_BATCH_ITEM_OVERHEAD_TOKENS = 40
+_BATCH_RESULT_KEYS = ("score", "missing", "incomplete", "incorrect", "feedback")
+
+
+def estimate_tokens(text):
+    return len(str(text or "")) // 4 + 1
+
+
+def plan_evaluation_batches(items, max_tokens=None, max_items=None):
+    """Split (question_mark, expected_answer, student_answer) items into batches of indexes.
+
+    An item larger than the token budget still gets a batch of its own.
+    """
+    max_tokens = max_tokens or DESCRIPTIVE_BATCH_MAX_TOKENS
+    max_items = max(1, max_items or DESCRIPTIVE_BATCH_MAX_ITEMS)
+    batches, current, current_tokens = [], [], 0
+    for index, (question_mark, expected_answer, student_answer) in enumerate(items):
+        tokens = estimate_tokens(expected_answer) + estimate_tokens(student_answer) + _BATCH_ITEM_OVERHEAD_TOKENS
+        if current and (current_tokens + tokens > max_tokens or len(current) >= max_items):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(index)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _evaluate_batch(api_client, items):
+    """One request for all items; returns a result per item, or None when the reply is unusable."""
+    system_message = '''You are an automated, impartial answer evaluator. Always respond ONLY with a single, valid JSON array (no markdown, no surrounding text). Follow these rules:
+        1. Output exactly one JSON object per answer, in a JSON array, and nothing else.
+        2. Evaluate every answer independently; never let one answer influence another.
+        3. For lists (missing, incomplete, incorrect) return either "None" or a pipe-separated string of short phrases.
+        4. Keep `feedback` short (1-2 sentences) and constructive.
+        5. If you cannot evaluate a candidate answer, return score 0 for it and put diagnostic text in its `feedback`.
+        6. Include an integer field `ai_confidence` (0-100) in every object representing the model's confidence in that evaluation.
+        7. Do not ask questions or include explanations outside the JSON array.'''
+
+    answers = "\n".join(
+        f'''
+        ### Answer {number}
+        **Question Marking Scheme:** {question_mark}
+        **Expected Answer Key Points:** {expected_answer}
+        **Candidate's Answer:** {student_answer}'''
+        for number, (question_mark, expected_answer, student_answer) in enumerate(items, start=1)
+    )
+    user_message = f'''
+        Evaluate each of the {len(items)} candidate answers below against its own expected answer key points.
+        For each answer, compare every expected key point with the candidate's answer, give a score between 0 and that answer's marking scheme, report only the missing part of partially answered points, and for incorrect points highlight what is incorrect based on the expected answer.
+        Don't need a summary in the output. Also not required to mention the expected answer in the output.
+        {answers}
+
+        Return ONLY a valid JSON array with exactly {len(items)} objects, in the same order as the answers, each in this exact format (no markdown, no extra text):
+        {{
+        "answer": <answer number>,
+        "score": <number between 0 and the answer's marking scheme>,
+        "missing": "<pipe-separated list of Crisp phrase on what is missed or 'None'>",
+        "incomplete": "<pipe-separated list of Crisp explanation on which part is incomplete or 'None'>",
+        "incorrect": "<pipe-separated list of Crisp explanation on what is incorrect and why or 'None'>",
+        "feedback": "<brief constructive feedback>",
+        "ai_confidence": <integer between 0-100>
+        }}
+
+        Note: Use the pipe character '|' as the separator between list items (no spaces around the pipe) to avoid ambiguity with commas. If there are no items for a field, return "None".
+        '''
+    max_tokens = DESCRIPTIVE_BATCH_OUTPUT_TOKENS * len(items)
+    try:
+        response = api_client.chat_completion(system_message, user_message, max_tokens=max_tokens, call_type='grading')
+        response_json = response.json()
+        if response.status_code != 200:
+            print(f"Batched evaluation failed: {response_json.get('error', 'Unknown error')}")
+            return None
+        parsed = json.loads(_response_content(response_json))
+    except Exception as e:
+        print(f"Error in batched evaluation: {str(e)}" + " - Line # : " + str(e.__traceback__.tb_lineno))
+        return None
+    if isinstance(parsed, dict):
+        parsed = parsed.get("results")
+    if not isinstance(parsed, list) or len(parsed) != len(items):
+        print(f"Batched evaluation returned {len(parsed) if isinstance(parsed, list) else 'no'} results for {len(items)} answers")
+        return None
+
+    results = []
+    for number, (result, (question_mark, _, _)) in enumerate(zip(parsed, items), start=1):
+        if not isinstance(result, dict) or not all(key in result for key in _BATCH_RESULT_KEYS):
+            results.append(None)
+            continue
+        if result.pop("answer", number) != number:
+            return None
+        if not isinstance(result.get("score"), (int, float)):
+            results.append(None)
+            continue
+        _normalize_ai_confidence(result, question_mark)
+        result['status'] = True
+        result['prompt_version'] = DESCRIPTIVE_BATCH_PROMPT_VERSION
+        results.append(result)
+    return results
+
+
+def descriptive_evaluation_batch(api_client, items):
+    """Grade (question_mark, expected_answer, student_answer) items in batched requests.
+
+    Returns one descriptive_evaluation-style result per item, in order. A
+    batch whose reply does not parse, and any single malformed result in it,
+    is graded again one answer at a time.
+    """
+    results = [None] * len(items)
+    for batch in plan_evaluation_batches(items):
+        batch_results = _evaluate_batch(api_client, [items[index] for index in batch]) if len(batch) > 1 else None
+        for position, index in enumerate(batch):
+            result = batch_results[position] if batch_results else None
+            results[index] = result or descriptive_evaluation(api_client, *items[index])
+    return results
@@ -0,0 +1,404 @@
+import datetime
+import os
+import sys
+import threading
+import time
+
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+
+from db.db import get_session_factory
+from db.metrics import register_metrics_provider
+from db.models import LLMRateBucket, openai_requests
+
+# Token-bucket scheduler in front of openai_client. Every call takes one
+# request and its estimated tokens (prompt characters / 4 + max_tokens) from
+# the global bucket pair and from its institute's pair; the token charge is
+# corrected with the response's usage once it returns. An institute's
+# buckets start out drained by whatever openai_requests recorded for it in
+# the last minute, so a restart does not hand out a fresh budget.
+#
+# The buckets live in dbo.LLMRateBuckets, one row per scope ('global' or an
+# institute_id), so the limits hold for all workers together: a call reads,
+# refills and charges its institute's row under a row lock in one short
+# transaction, so only calls of the same institute queue on each other. The
+# global row is not locked per call: each worker leases
+# LLM_GLOBAL_LEASE_REQUESTS calls' worth of global capacity at a time and
+# hands it out locally. If that store is unavailable (before its
+# migration ran, or with LLM_SHARED_BUCKETS=0), each worker falls back to
+# in-process buckets holding 1/LLM_WORKER_COUNT of every limit; declare the
+# number of worker processes there so the fallback stays within the quota.
+#
+# Grading has priority: question generation may not dip into the last
+# LLM_GRADING_RESERVE share of any bucket and yields while grading calls of
+# the same worker are waiting. A call that cannot be admitted within its
+# wait budget (LLM_GRADING_MAX_WAIT_SECS / LLM_GENERATION_MAX_WAIT_SECS)
+# gets a 429 response without reaching OpenAI. A limit of 0 disables that
+# bucket.
+LLM_GLOBAL_RPM = float(os.getenv('LLM_GLOBAL_RPM', 500))
+LLM_GLOBAL_TPM = float(os.getenv('LLM_GLOBAL_TPM', 200000))
+LLM_INSTITUTE_RPM = float(os.getenv('LLM_INSTITUTE_RPM', 120))
+LLM_INSTITUTE_TPM = float(os.getenv('LLM_INSTITUTE_TPM', 60000))
+LLM_GRADING_RESERVE = float(os.getenv('LLM_GRADING_RESERVE', 0.25))
+LLM_GRADING_MAX_WAIT_SECS = float(os.getenv('LLM_GRADING_MAX_WAIT_SECS', 60))
+LLM_GENERATION_MAX_WAIT_SECS = float(os.getenv('LLM_GENERATION_MAX_WAIT_SECS', 5))
+LLM_SHARED_BUCKETS = os.getenv('LLM_SHARED_BUCKETS', '1').strip().lower() not in ('0', 'false', 'no', 'off')
+LLM_WORKER_COUNT = max(int(os.getenv('LLM_WORKER_COUNT', 1)), 1)
+LLM_GLOBAL_LEASE_REQUESTS = max(int(os.getenv('LLM_GLOBAL_LEASE_REQUESTS', 5)), 1)
+# After the shared store fails, use the local buckets this long before retrying it.
+LLM_SHARED_RETRY_SECS = float(os.getenv('LLM_SHARED_RETRY_SECS', 30))
+GRADING = 'grading'
+GLOBAL_SCOPE = 'global'
+
+
+def _timestamp(value):
+    return value.replace(tzinfo=datetime.timezone.utc).timestamp()
+
+
+def _recent_usage(session, institute_id):
+    since = datetime.datetime.now() - datetime.timedelta(minutes=1)
+    count, tokens = session.query(
+        func.count(openai_requests.request_id), func.sum(openai_requests.total_tokens)
+    ).filter(
+        openai_requests.institute_id == institute_id,
+        openai_requests.created_date >= since
+    ).one()
+    return int(count or 0), int(tokens or 0)
+
+
+def _limits(institute_id):
+    """{scope: (requests per minute, tokens per minute)} for a call of the institute."""
+    scopes = {GLOBAL_SCOPE: (LLM_GLOBAL_RPM, LLM_GLOBAL_TPM)}
+    if institute_id is not None:
+        scopes[str(institute_id)] = (LLM_INSTITUTE_RPM, LLM_INSTITUTE_TPM)
+    return scopes
+
+
+class TokenBucket:
+    def __init__(self, per_minute, level=None, updated=None):
+        self.capacity = float(per_minute)
+        self.level = self.capacity if level is None else float(level)
+        self.rate = self.capacity / 60.0
+        self.updated = time.monotonic() if updated is None else updated
+
+    def _refill(self, now):
+        # Shared buckets are stamped with each worker's clock; ignore small skews.
+        elapsed = max(now - self.updated, 0.0)
+        self.level = min(self.capacity, self.level + elapsed * self.rate)
+        self.updated = max(now, self.updated)
+
+    def wait_seconds(self, now, amount, reserve):
+        """Seconds until amount can be taken while leaving reserve * capacity behind."""
+        if self.capacity <= 0:
+            return 0.0
+        self._refill(now)
+        # A single call larger than the bucket waits for a full bucket.
+        floor = self.capacity * reserve
+        amount = min(amount, self.capacity - floor)
+        short = amount + floor - self.level
+        return short / self.rate if short > 0 else 0.0
+
+    def take(self, amount):
+        if self.capacity > 0:
+            # Usage corrections may push the level below zero; the debt is
+            # repaid by refill before anything else is admitted.
+            self.level -= amount
+
+
+class SharedBuckets:
+    """The bucket rows in dbo.LLMRateBuckets; methods return None when the store is unavailable."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Global capacity this worker has charged to the global row but not
+        # handed out yet. Usage corrections can leave the tokens negative;
+        # the next lease repays that debt.
+        self._lease_requests = 0.0
+        self._lease_tokens = 0.0
+
+    def _use_lease(self, estimated_tokens):
+        with self._lock:
+            if self._lease_requests >= 1 and self._lease_tokens >= estimated_tokens:
+                self._lease_requests -= 1
+                self._lease_tokens -= estimated_tokens
+                return True
+            return False
+
+    def _add_lease(self, requests, tokens):
+        with self._lock:
+            self._lease_requests += requests
+            self._lease_tokens += tokens
+
+    def _lease_debt(self):
+        with self._lock:
+            return max(-self._lease_tokens, 0.0)
+
+    def _locked_rows(self, session, scopes, now):
+        # Row locks, taken in scope order so two workers never deadlock.
+        rows = {
+            row.scope: row for row in
+            session.query(LLMRateBucket).filter(LLMRateBucket.scope.in_(sorted(scopes)))
+            .order_by(LLMRateBucket.scope).with_for_update().all()
+        }
+        for scope in sorted(set(scopes) - set(rows)):
+            rpm, tpm = scopes[scope]
+            requests_used, tokens_used = (0, 0) if scope == GLOBAL_SCOPE else _recent_usage(session, scope)
+            try:
+                with session.begin_nested():
+                    session.add(LLMRateBucket(scope=scope, requests_level=rpm - requests_used,
+                                              tokens_level=tpm - tokens_used, updated_at=now))
+            except IntegrityError:
+                pass  # Another worker created the row first.
+            rows[scope] = session.query(LLMRateBucket).filter(LLMRateBucket.scope == scope).with_for_update().one()
+        return rows
+
+    def take(self, scopes, estimated_tokens, reserve):
+        """(wait, levels): wait is 0.0 once charged to every scope, else seconds until it could be."""
+        leased = GLOBAL_SCOPE in scopes and self._use_lease(estimated_tokens)
+        if leased:
+            scopes = {scope: limits for scope, limits in scopes.items() if scope != GLOBAL_SCOPE}
+        if not scopes:
+            return 0.0, {}
+        session = get_session_factory()()
+        try:
+            now_dt = datetime.datetime.utcnow()
+            now = _timestamp(now_dt)
+            rows = self._locked_rows(session, scopes, now_dt)
+            charged = []
+            wait = 0.0
+            for scope, (rpm, tpm) in scopes.items():
+                row = rows[scope]
+                updated = _timestamp(row.updated_at)
+                request_bucket = TokenBucket(rpm, row.requests_level, updated)
+                token_bucket = TokenBucket(tpm, row.tokens_level, updated)
+                requests, tokens = 1, estimated_tokens
+                if scope == GLOBAL_SCOPE:
+                    # Lease several calls when the bucket has room, else just this one.
+                    debt = self._lease_debt()
+                    lease_tokens = estimated_tokens * LLM_GLOBAL_LEASE_REQUESTS + debt
+                    if (request_bucket.wait_seconds(now, LLM_GLOBAL_LEASE_REQUESTS, reserve) <= 0
+                            and token_bucket.wait_seconds(now, lease_tokens, reserve) <= 0):
+                        requests, tokens = LLM_GLOBAL_LEASE_REQUESTS, lease_tokens
+                    else:
+                        tokens = estimated_tokens + debt
+                wait = max(wait, request_bucket.wait_seconds(now, requests, reserve),
+                           token_bucket.wait_seconds(now, tokens, reserve))
+                charged.append((scope, row, request_bucket, token_bucket, requests, tokens))
+            levels = {}
+            for scope, row, request_bucket, token_bucket, requests, tokens in charged:
+                if wait <= 0:
+                    request_bucket.take(requests)
+                    token_bucket.take(tokens)
+                row.requests_level = request_bucket.level
+                row.tokens_level = token_bucket.level
+                row.updated_at = now_dt
+                levels[scope] = (request_bucket.level, token_bucket.level)
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            if leased:
+                self._add_lease(1, estimated_tokens)
+            print(f"{e} occurred while taking shared LLM rate limits at line {sys.exc_info()[-1].tb_lineno}")
+            return None
+        finally:
+            session.close()
+        if wait > 0:
+            if leased:
+                self._add_lease(1, estimated_tokens)
+        else:
+            for scope, _, _, _, requests, tokens in charged:
+                if scope == GLOBAL_SCOPE:
+                    # The rest of the lease, less this call.
+                    self._add_lease(requests - 1, tokens - estimated_tokens)
+        return wait, levels
+
+    def adjust_tokens(self, scopes, delta):
+        if GLOBAL_SCOPE in scopes:
+            # Settled against the lease; a shortfall is repaid by the next one.
+            self._add_lease(0, -delta)
+            scopes = [scope for scope in scopes if scope != GLOBAL_SCOPE]
+            if not scopes:
+                return True
+        session = get_session_factory()()
+        try:
+            session.query(LLMRateBucket).filter(LLMRateBucket.scope.in_(list(scopes))).update(
+                {LLMRateBucket.tokens_level: LLMRateBucket.tokens_level - delta}, synchronize_session=False
+            )
+            session.commit()
+            return True
+        except Exception as e:
+            session.rollback()
+            print(f"{e} occurred while adjusting shared LLM rate limits at line {sys.exc_info()[-1].tb_lineno}")
+            return None
+        finally:
+            session.close()
+
+
+class LLMGrant:
+    def __init__(self, limiter, institute_id, call_type, estimated_tokens, waited, shared=False):
+        self.limiter = limiter
+        self.institute_id = institute_id
+        self.call_type = call_type
+        self.estimated_tokens = estimated_tokens
+        self.waited = waited
+        self.shared = shared
+
+    def settle(self, response):
+        """Charge the buckets the difference between the estimate and the reported usage."""
+        try:
+            if response.status_code != 200:
+                return
+            used = (response.json().get("usage") or {}).get("total_tokens")
+        except Exception:
+            return
+        if used is not None:
+            self.limiter.adjust_tokens(self.institute_id, used - self.estimated_tokens, self.shared)
+
+
+class LLMRateLimiter:
+    def __init__(self, shared=LLM_SHARED_BUCKETS, workers=LLM_WORKER_COUNT):
+        self._lock = threading.Lock()
+        self._shared = SharedBuckets() if shared else None
+        self._shared_retry_at = 0.0
+        self._shared_levels = {}
+        self._workers = max(int(workers), 1)
+        self._global = self._local_pair(LLM_GLOBAL_RPM, LLM_GLOBAL_TPM)
+        self._institutes = {}
+        self._grading_waiters = 0
+        self._stats = {}
+
+    def _local_pair(self, rpm, tpm):
+        # This worker's share of a limit when the shared buckets are unavailable.
+        return (TokenBucket(rpm / self._workers), TokenBucket(tpm / self._workers))
+
+    def _recent_usage(self, institute_id):
+        session = get_session_factory()()
+        try:
+            return _recent_usage(session, institute_id)
+        except Exception as e:
+            print(f"{e} occurred while reading recent OpenAI usage at line {sys.exc_info()[-1].tb_lineno}")
+            return 0, 0
+        finally:
+            session.close()
+
+    def _buckets(self, institute_id):
+        if institute_id is None:
+            return [self._global]
+        key = str(institute_id)
+        with self._lock:
+            buckets = self._institutes.get(key)
+        if buckets is None:
+            requests_used, tokens_used = self._recent_usage(key)
+            created = self._local_pair(LLM_INSTITUTE_RPM, LLM_INSTITUTE_TPM)
+            created[0].take(requests_used)
+            created[1].take(tokens_used)
+            with self._lock:
+                buckets = self._institutes.setdefault(key, created)
+        return [self._global, buckets]
+
+    def _count(self, call_type, outcome):
+        name = (call_type, outcome)
+        self._stats[name] = self._stats.get(name, 0) + 1
+
+    def _take_shared(self, institute_id, estimated_tokens, reserve):
+        """Seconds to wait (0.0 once taken), or None to use the local buckets instead."""
+        if self._shared is None or time.monotonic() < self._shared_retry_at:
+            return None
+        result = self._shared.take(_limits(institute_id), estimated_tokens, reserve)
+        with self._lock:
+            if result is None:
+                self._shared_retry_at = time.monotonic() + LLM_SHARED_RETRY_SECS
+                return None
+            wait, levels = result
+            self._shared_levels.update(levels)
+        return wait
+
+    def _take_local(self, institute_id, estimated_tokens, reserve):
+        pairs = self._buckets(institute_id)
+        with self._lock:
+            now = time.monotonic()
+            wait = 0.0
+            for request_bucket, token_bucket in pairs:
+                wait = max(wait, request_bucket.wait_seconds(now, 1, reserve),
+                           token_bucket.wait_seconds(now, estimated_tokens, reserve))
+            if wait <= 0:
+                for request_bucket, token_bucket in pairs:
+                    request_bucket.take(1)
+                    token_bucket.take(estimated_tokens)
+        return wait
+
+    def acquire(self, institute_id, call_type, estimated_tokens):
+        """Wait for capacity; returns an LLMGrant, or None when the wait budget ran out."""
+        grading = call_type == GRADING
+        reserve = 0.0 if grading else LLM_GRADING_RESERVE
+        max_wait = LLM_GRADING_MAX_WAIT_SECS if grading else LLM_GENERATION_MAX_WAIT_SECS
+        started = time.monotonic()
+        waiting = False
+        slept = False
+        try:
+            while True:
+                shared = False
+                if not grading and self._grading_waiters:
+                    # Yield to waiting grading calls without touching the buckets.
+                    wait = 0.25
+                else:
+                    wait = self._take_shared(institute_id, estimated_tokens, reserve)
+                    shared = wait is not None
+                    if not shared:
+                        wait = self._take_local(institute_id, estimated_tokens, reserve)
+                now = time.monotonic()
+                with self._lock:
+                    if wait <= 0:
+                        self._count(call_type, "queued" if slept else "admitted")
+                        return LLMGrant(self, institute_id, call_type, estimated_tokens, now - started, shared)
+                    if now + wait - started > max_wait:
+                        self._count(call_type, "rejected")
+                        return None
+                    if grading and not waiting:
+                        waiting = True
+                        self._grading_waiters += 1
+                time.sleep(min(wait, 1.0))
+                slept = True
+        finally:
+            if waiting:
+                with self._lock:
+                    self._grading_waiters -= 1
+
+    def adjust_tokens(self, institute_id, delta, shared=False):
+        if shared and self._shared.adjust_tokens(_limits(institute_id), delta):
+            return
+        pairs = self._buckets(institute_id)
+        with self._lock:
+            for _, token_bucket in pairs:
+                token_bucket.take(delta)
+
+    def metrics(self):
+        with self._lock:
+            stats = dict(self._stats)
+            local = [(GLOBAL_SCOPE, self._global)] + sorted(self._institutes.items())
+            now = time.monotonic()
+            for _, buckets in local:
+                for bucket in buckets:
+                    bucket._refill(now)
+            # Shared levels are as this worker last saw them after a charge.
+            levels = {name: (request_bucket.level, token_bucket.level) for name, (request_bucket, token_bucket) in local}
+            levels.update(self._shared_levels)
+            levels = [(name, requests, tokens) for name, (requests, tokens) in sorted(levels.items())]
+        lines = [
+            "# HELP edu_llm_limiter_calls_total OpenAI calls by call type and limiter outcome.",
+            "# TYPE edu_llm_limiter_calls_total counter",
+        ]
+        for (call_type, outcome), count in sorted(stats.items()):
+            lines.append(f'edu_llm_limiter_calls_total{{call_type="{call_type}",outcome="{outcome}"}} {count}')
+        lines.append("# HELP edu_llm_limiter_tokens_available Tokens left in each bucket (scope is global or an institute_id).")
+        lines.append("# TYPE edu_llm_limiter_tokens_available gauge")
+        for name, _, tokens in levels:
+            lines.append(f'edu_llm_limiter_tokens_available{{scope="{name}"}} {tokens:g}')
+        lines.append("# TYPE edu_llm_limiter_requests_available gauge")
+        for name, requests, _ in levels:
+            lines.append(f'edu_llm_limiter_requests_available{{scope="{name}"}} {requests:g}')
+        return lines
+
+
+llm_limiter = LLMRateLimiter()
+register_metrics_provider(llm_limiter.metrics)
@@ -0,0 +1,185 @@
+from collections import OrderedDict
+import os
+import random
+import threading
+import time
+
+from sqlalchemy import and_, func
+
+from db.models import Categories, Exam, ExamMapping, ExamQuestionMapping, Option, Question, QuestionMapping
+from db.cache_versions import VersionWatcher, bump_cache_version
+from others.settings import get_setting
+
+# Compiled exam papers keyed by exam_id: the exam header, one section per
+# ExamMapping row (the category pool for randomized sections, the resolved
+# question set for fixed ones) and the question/option payloads of every
+# question a section can serve. launch_exam_details only samples from it.
+#
+# Edits to exams, questions or categories call invalidate_exam_papers(),
+# which clears this worker's cache and bumps the 'exam_papers' version so
+# other workers drop theirs within PAPER_CACHE_VERSION_CHECK_SECS. Entries
+# also expire after the paper_cache_ttl setting (others/settings.py).
+PAPER_CACHE_VERSION_NAME = 'exam_papers'
+_paper_cache_size = int(os.getenv('PAPER_CACHE_SIZE', 200))
+_paper_cache = OrderedDict()
+_paper_cache_lock = threading.Lock()
+# Bumped on every local invalidation so a paper compiled from data read
+# before the invalidation is not stored after it.
+_paper_generation = 0
+_paper_version = VersionWatcher(PAPER_CACHE_VERSION_NAME, float(os.getenv('PAPER_CACHE_VERSION_CHECK_SECS', 5)))
+
+# SQL Server accepts at most 2100 parameters per statement.
+_IN_CHUNK_SIZE = 1000
+
+
+class CompiledPaper:
+    def __init__(self, exam, sections, questions):
+        self.exam_id = exam.exam_id
+        self.title = exam.title
+        self.duration_mins = exam.duration_mins
+        self.total_questions = exam.total_questions
+        # [(randomize, number_of_questions, question_ids)]
+        self.sections = sections
+        # {str(question_id): payload}
+        self.questions = questions
+
+    def draw_question_ids(self):
+        """Pick one student's question ids: randomized sections first, then fixed ones."""
+        randomized = []
+        fixed = []
+        for randomize, number_of_questions, question_ids in self.sections:
+            if randomize:
+                if number_of_questions is not None and len(question_ids) >= number_of_questions:
+                    randomized.extend(random.sample(question_ids, number_of_questions))
+                else:
+                    randomized.extend(question_ids)  # Take all if not enough
+            else:
+                fixed.extend(question_ids)
+        seen = set()
+        selected = []
+        for question_id in randomized + fixed:
+            key = str(question_id)
+            if key in seen or key not in self.questions:
+                continue
+            seen.add(key)
+            selected.append(question_id)
+        return selected
+
+    def question_payloads(self, question_ids):
+        return [self.questions[str(question_id)] for question_id in question_ids]
+
+
+def _chunks(values):
+    for i in range(0, len(values), _IN_CHUNK_SIZE):
+        yield values[i:i + _IN_CHUNK_SIZE]
+
+
+def _compile_paper(session, exam_id):
+    from others.exams import _resolve_fixed_question_ids
+
+    exam = session.query(Exam).filter_by(exam_id=exam_id).first()
+    if not exam:
+        return None
+    exam_mapping = session.query(ExamMapping).filter_by(exam_id=exam_id).all()
+
+    # One read for every mapped category's bank. Randomized sections draw
+    # from the whole mapping; fixed sections only top up from categories
+    # that are still live, as _category_pool_question_ids would.
+    pools = {}
+    live_pools = {}
+    category_ids = list({str(m.category_id): m.category_id for m in exam_mapping if m.category_id}.values())
+    if category_ids:
+        rows = session.query(
+            QuestionMapping.category_id, QuestionMapping.question_id, Categories.category_id.label('live_category_id')
+        ).outerjoin(
+            Categories,
+            and_(Categories.category_id == QuestionMapping.category_id,
+                 func.coalesce(Categories.is_deleted, False) == False)
+        ).filter(QuestionMapping.category_id.in_(category_ids)).all()
+        for row in rows:
+            pools.setdefault(str(row.category_id), []).append(row.question_id)
+            if row.live_category_id is not None:
+                live_pools.setdefault(str(row.category_id), []).append(row.question_id)
+
+    predefined = {}
+    rows = session.query(ExamQuestionMapping.category_id, ExamQuestionMapping.question_id).filter(
+        ExamQuestionMapping.exam_id == exam_id
+    ).all()
+    for row in rows:
+        predefined.setdefault(str(row.category_id), []).append(row.question_id)
+
+    sections = []
+    for mapping in exam_mapping:
+        if mapping.randomize_questions == 1:
+            sections.append((True, mapping.number_of_questions, pools.get(str(mapping.category_id), [])))
+        else:
+            # Legacy tests may have the category mapping but no
+            # ExamQuestionMapping rows; those are filled from the category
+            # pool once per compile, so every launch serves the same set.
+            fixed_question_ids = predefined.get(str(mapping.category_id), [])
+            sections.append((False, None, _resolve_fixed_question_ids(
+                session,
+                mapping.category_id,
+                mapping.number_of_questions or len(fixed_question_ids),
+                fixed_question_ids,
+                pool_ids=live_pools.get(str(mapping.category_id), [])
+            )))
+
+    question_ids = list({str(qid): qid for _, _, ids in sections for qid in ids}.values())
+    questions = []
+    options = {}
+    for chunk in _chunks(question_ids):
+        questions.extend(session.query(Question).filter(Question.question_id.in_(chunk)).all())
+        for opt in session.query(Option).filter(Option.question_id.in_(chunk)).all():
+            options.setdefault(str(opt.question_id), []).append({"id": opt.options_id, "text": opt.option_text})
+
+    payloads = {}
+    for question in questions:
+        payloads[str(question.question_id)] = {
+            "question_id": question.question_id,
+            "question_text": question.question_text,
+            "question_type": question.question_type,
+            "options": options.get(str(question.question_id), []) if question.question_type in ['choose', 'multi'] else []
+        }
+    return CompiledPaper(exam, sections, payloads)
+
+
+def get_compiled_paper(session, exam_id):
+    """Return the compiled paper for exam_id, compiling it on a miss."""
+    if _paper_version.changed(session):
+        clear_exam_paper_cache()
+    key = str(exam_id)
+    with _paper_cache_lock:
+        entry = _paper_cache.get(key)
+        if entry is not None:
+            expires_at, paper = entry
+            if expires_at >= time.monotonic():
+                _paper_cache.move_to_end(key)
+                return paper
+            del _paper_cache[key]
+        generation = _paper_generation
+
+    paper = _compile_paper(session, exam_id)
+    ttl = get_setting('paper_cache_ttl', session)
+    if paper is None or ttl <= 0:
+        return paper
+    with _paper_cache_lock:
+        if generation == _paper_generation:
+            _paper_cache[key] = (time.monotonic() + ttl, paper)
+            _paper_cache.move_to_end(key)
+            while len(_paper_cache) > _paper_cache_size:
+                _paper_cache.popitem(last=False)
+    return paper
+
+
+def clear_exam_paper_cache():
+    global _paper_generation
+    with _paper_cache_lock:
+        _paper_cache.clear()
+        _paper_generation += 1
+
+
+def invalidate_exam_papers(session):
+    """Drop compiled papers everywhere; call before committing the edit that made them stale."""
+    bump_cache_version(session, PAPER_CACHE_VERSION_NAME)
+    clear_exam_paper_cache()
@@ -0,0 +1,159 @@
+import datetime
+import json
+import os
+import sys
+
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+
+from db.db import SQLiteDB
+from db.models import ExamSchedule, ExamScheduleMapping, PreparedPaper
+from others.background import register_periodic_task, trigger_task
+from others.paper_cache import get_compiled_paper
+
+# Schedules with pregenerate_papers set get one PreparedPapers row per
+# assigned user, drawn from the compiled paper PAPER_PREPARE_LEAD_MINS before
+# start_time. A launch then reads that row, and every relaunch of the same
+# schedule serves the same set. Users without a row (assigned late, or the
+# job has not run yet) get theirs drawn and stored on first launch.
+PAPER_PREPARE_TASK_NAME = 'prepare_papers'
+PAPER_PREPARE_LEAD_MINS = float(os.getenv('PAPER_PREPARE_LEAD_MINS', 10))
+PAPER_PREPARE_INTERVAL_SECS = float(os.getenv('PAPER_PREPARE_INTERVAL_SECS', 60))
+_INSERT_BATCH_SIZE = 500
+
+
+def _serialize_question_ids(question_ids):
+    return json.dumps([str(question_id) for question_id in question_ids])
+
+
+def prepare_schedule_papers(session, schedule):
+    """Store a question set for every assigned user that lacks one; returns the number created."""
+    paper = get_compiled_paper(session, schedule.exam_id)
+    if not paper:
+        return 0
+    assigned = {
+        str(row.user_id) for row in session.query(ExamScheduleMapping.user_id).filter(
+            ExamScheduleMapping.schedule_id == schedule.schedule_id,
+            ExamScheduleMapping.user_id.isnot(None)
+        ).distinct().all()
+    }
+    prepared = {
+        str(row.user_id) for row in session.query(PreparedPaper.user_id).filter(
+            PreparedPaper.schedule_id == schedule.schedule_id
+        ).all()
+    }
+    missing = sorted(assigned - prepared)
+    created = 0
+    for i in range(0, len(missing), _INSERT_BATCH_SIZE):
+        batch = missing[i:i + _INSERT_BATCH_SIZE]
+        # Skip users another worker (or a launch) prepared since the read above.
+        taken = {
+            str(row.user_id) for row in session.query(PreparedPaper.user_id).filter(
+                PreparedPaper.schedule_id == schedule.schedule_id,
+                PreparedPaper.user_id.in_(batch)
+            ).all()
+        }
+        batch = [user_id for user_id in batch if user_id not in taken]
+        papers = [_new_paper(schedule, user_id, paper) for user_id in batch]
+        session.add_all(papers)
+        try:
+            session.commit()
+            created += len(papers)
+        except IntegrityError:
+            # A row appeared between the check and the insert; store the
+            # rest of the batch one row at a time instead of losing it.
+            session.rollback()
+            created += _insert_one_by_one(session, schedule, batch, paper)
+    return created
+
+
+def _new_paper(schedule, user_id, paper):
+    return PreparedPaper(
+        schedule_id=schedule.schedule_id,
+        user_id=user_id,
+        exam_id=schedule.exam_id,
+        question_ids=_serialize_question_ids(paper.draw_question_ids())
+    )
+
+
+def _insert_one_by_one(session, schedule, user_ids, paper):
+    created = 0
+    for user_id in user_ids:
+        try:
+            with session.begin_nested():
+                session.add(_new_paper(schedule, user_id, paper))
+            created += 1
+        except IntegrityError:
+            pass  # Prepared concurrently; that row is served instead.
+    session.commit()
+    return created
+
+
+def prepare_upcoming_papers():
+    db = SQLiteDB()
+    session = db.connect()
+    if not session:
+        return
+    try:
+        now = datetime.datetime.utcnow()
+        schedules = session.query(ExamSchedule).filter(
+            ExamSchedule.pregenerate_papers == True,
+            ExamSchedule.published == 1,
+            or_(ExamSchedule.is_deleted == False, ExamSchedule.is_deleted == None),
+            ExamSchedule.start_time <= now + datetime.timedelta(minutes=PAPER_PREPARE_LEAD_MINS),
+            ExamSchedule.end_time > now
+        ).all()
+        for schedule in schedules:
+            created = prepare_schedule_papers(session, schedule)
+            if created:
+                print(f"Prepared {created} papers for schedule {schedule.schedule_id}")
+    except Exception as e:
+        session.rollback()
+        print(f"{e} occurred while preparing papers at line {sys.exc_info()[-1].tb_lineno}")
+    finally:
+        session.close()
+
+
+def queue_paper_preparation(schedule):
+    """Run the preparation job now when a published schedule is already inside the lead window."""
+    if not schedule.pregenerate_papers or not schedule.published or not schedule.start_time:
+        return
+    lead = datetime.timedelta(minutes=PAPER_PREPARE_LEAD_MINS)
+    if schedule.start_time <= datetime.datetime.utcnow() + lead:
+        trigger_task(PAPER_PREPARE_TASK_NAME)
+
+
+def prepared_question_ids(session, schedule, user_id, paper):
+    """Return the user's stored question set, drawing and storing it on first use.
+
+    The new row is written in a savepoint and committed with the caller's
+    transaction (the launch's attempt insert).
+    """
+    row = session.query(PreparedPaper.question_ids).filter(
+        PreparedPaper.schedule_id == schedule.schedule_id,
+        PreparedPaper.user_id == user_id
+    ).first()
+    if row is None:
+        question_ids = paper.draw_question_ids()
+        try:
+            with session.begin_nested():
+                session.add(PreparedPaper(
+                    schedule_id=schedule.schedule_id,
+                    user_id=user_id,
+                    exam_id=schedule.exam_id,
+                    question_ids=_serialize_question_ids(question_ids)
+                ))
+            return question_ids
+        except IntegrityError:
+            # A concurrent launch (or the job) stored one first; serve that.
+            row = session.query(PreparedPaper.question_ids).filter(
+                PreparedPaper.schedule_id == schedule.schedule_id,
+                PreparedPaper.user_id == user_id
+            ).first()
+            if row is None:
+                return question_ids
+    # Questions deleted since the set was drawn are skipped.
+    return [question_id for question_id in json.loads(row.question_ids) if str(question_id) in paper.questions]
+
+
+register_periodic_task(PAPER_PREPARE_TASK_NAME, PAPER_PREPARE_INTERVAL_SECS, prepare_upcoming_papers)
@@ -2,10 +2,12 @@ from db.models import Question, Option, QuestionMapping, Categories, CategoriesD
 from db.db import SQLiteDB
 from sqlalchemy import func, or_
 import sys
-import pandas as pd
 import json
 import datetime
 from others.llm import descriptive_evaluation, openai_client
+from others.paper_cache import invalidate_exam_papers
+from others.rescoring import answer_key, queue_question_rescore, rescore_status
+from others.jobs import wake_job_workers
 
 def _resolve_institute_scope(request):
     args = getattr(request, "args", {})
@@ -97,6 +99,8 @@ def add_question(request):
             )
             session.add(mapping_data)
             session.commit()
+        invalidate_exam_papers(session)
+        session.commit()
         json_data ={
             "statusMessage": "Question inserted successfully",
             "status": True
@@ -123,6 +127,7 @@ def bulk_upload_questions(request):
     if not file:
         return {"statusMessage": "No file provided", "status": False}, 400
     # read file using pandas
+    import pandas as pd
     filename = (getattr(file, "filename", "") or "").lower()
     df = pd.read_excel(file) if filename.endswith((".xlsx", ".xls")) else pd.read_csv(file)
 
@@ -205,6 +210,8 @@ def bulk_upload_questions(request):
         )
         session.add(mapping_data)
         session.commit()
+    invalidate_exam_papers(session)
+    session.commit()
     json_data ={
         "statusMessage": "Question inserted successfully",
         "status": True
@@ -370,6 +377,7 @@ def update_question(question_id, request):
         q = session.query(Question).filter_by(question_id=question_id).first()
         if not q:
             return {"statusMessage": "Question not found", "status": False}, 404
+        previous_key = answer_key(session, q)
 
         # Update basic fields
         if 'type' in data: q.question_type = data.get('type')
@@ -446,12 +454,33 @@ def update_question(question_id, request):
                 session.add(newmap)
         q.updated_by = updated_by
         q.updated_date = datetime.datetime.utcnow()
+        invalidate_exam_papers(session)
+        # Answers already marked against the old answer key are re-marked in the background.
+        rescore_queued = queue_question_rescore(session, q, previous_key)
         session.commit()
-        return {"statusMessage": "Question updated", "status": True}, 200
+        if rescore_queued:
+            wake_job_workers()
+        return {"statusMessage": "Question updated", "status": True, "rescore_queued": rescore_queued}, 200
     except Exception as e:
         session.rollback()
         return {"statusMessage": str(e), "status": False}, 500
 
+def get_question_rescore_status(question_id):
+    db = SQLiteDB()
+    session = db.connect()
+    if not session:
+        return {"statusMessage": "Error connecting to database", "status": False}, 500
+    try:
+        rescore = rescore_status(session, question_id)
+        if rescore is None:
+            return {"statusMessage": "No rescore has been run for this question", "status": False}, 404
+        return {"statusMessage": "Rescore status fetched", "status": True, "data": rescore}, 200
+    except Exception as e:
+        print(f"{e} occurred while fetching rescore status at line {sys.exc_info()[-1].tb_lineno}")
+        return {"statusMessage": str(e), "status": False}, 500
+    finally:
+        session.close()
+
 def delete_question(question_id, deleted_by):
     db = SQLiteDB()
     session = db.connect()
@@ -469,6 +498,7 @@ def delete_question(question_id, deleted_by):
         session.query(QuestionMapping).filter_by(question_id=question_id).delete()
         # delete the question
         session.delete(question)
+        invalidate_exam_papers(session)
         session.commit()
         return {"statusMessage": "Question deleted successfully", "status": True}, 200
     except Exception as e:
@@ -575,7 +605,7 @@ def create_question_using_llm(request):
         recommended_words_count = 'as appropriate'
         character_count = 500  # default estimate
     aimodel = 2 if question_mark <5 else 1
-    openai_client_instance = openai_client()
+    openai_client_instance = openai_client(institute_id=institute_id)
 
     # Token calculation based on number of questions and character count
     total_tokens_estimate = number_of_questions * character_count // 4
@@ -716,7 +746,6 @@ def fine_tune_questions_using_llm(request):
     # return default_fine_tune_result(), 200
     
     data_json = request.get_json(silent=True)
-    openai_client_instance = openai_client()
 
     def gv(key, default=None):
         return data_json.get(key, default)
@@ -726,6 +755,7 @@ def fine_tune_questions_using_llm(request):
     additional_instructions = gv("additional_instructions", "Update the question with additional related items to make the answer also more detailed ( close to 1800 characters) ")
     institute_id = gv("institute_id", None)
     user_id = gv("user_id", None)
+    openai_client_instance = openai_client(institute_id=institute_id)
 
     try:
         system_message = "You are an expert question and answer evaluator. Your task is to evaluate and improve the provided question(s) and answer based on the given answer text and additional instructions."
@@ -0,0 +1,201 @@
+import json
+import os
+import sys
+
+from sqlalchemy import and_, case, func, select, update
+
+from db.db import SQLiteDB
+from db.models import Answer, BackgroundJob, Exam_Attempt, ExamSchedule, Option, Question
+from others.exam_review import score_choice_answers, score_fill_answers
+from others.jobs import enqueue_job, register_job_handler
+
+# When update_question changes an objective question's answer key (correct
+# options, fill answer text or marks), a rescore_question job re-marks every
+# already validated Answer of that question, RESCORE_CHUNK_SIZE attempts at a
+# time: the changed rows are written with one bulk UPDATE per chunk and the
+# chunk's evaluated attempts get score, percentage and Pass/Failed refreshed
+# by a single set-based UPDATE. Descriptive answers are graded by the LLM and
+# are not rescored here.
+RESCORE_QUESTION_JOB = 'rescore_question'
+RESCORE_CHUNK_SIZE = int(os.getenv('RESCORE_CHUNK_SIZE', 500))
+RESCORABLE_TYPES = ('choose', 'multi', 'fill')
+
+
+def answer_key(session, question):
+    """Snapshot of everything objective scoring depends on, for change detection."""
+    options = session.query(Option.options_id, Option.option_text, Option.is_correct, Option.active_status).filter(
+        Option.question_id == question.question_id
+    ).all()
+    if question.question_type == 'fill':
+        active = [opt for opt in options if opt.active_status == 1]
+        expected = (active[0].option_text or "").strip().lower() if active else ""
+        return (question.question_type, question.marks, expected)
+    return (question.question_type, question.marks,
+            frozenset(str(opt.options_id).lower() for opt in options if opt.is_correct == 1))
+
+
+def queue_question_rescore(session, question, previous_key):
+    """Queue a rescore when an objective question's answer key changed; the caller commits."""
+    if question.question_type not in RESCORABLE_TYPES:
+        return False
+    session.flush()
+    if answer_key(session, question) == previous_key:
+        return False
+    # A job that is still queued reads the new key when it runs; a running
+    # one may already have read the old key, so queue another behind it.
+    queued = session.query(BackgroundJob.job_id).filter(
+        BackgroundJob.job_type == RESCORE_QUESTION_JOB,
+        BackgroundJob.target_id == str(question.question_id),
+        BackgroundJob.status == 'queued'
+    ).first()
+    if not queued:
+        enqueue_job(session, RESCORE_QUESTION_JOB, question.question_id, dedupe=False)
+    return True
+
+
+def rescore_status(session, question_id):
+    """Status and report of the question's most recent rescore job, or None."""
+    job = session.query(BackgroundJob).filter(
+        BackgroundJob.job_type == RESCORE_QUESTION_JOB,
+        BackgroundJob.target_id == str(question_id)
+    ).order_by(BackgroundJob.created_date.desc()).first()
+    if job is None:
+        return None
+    return {
+        "status": job.status,
+        "report": json.loads(job.result) if job.result else None,
+        "error": job.last_error,
+        "queued_at": job.created_date.isoformat() if job.created_date else None,
+        "updated_at": job.updated_date.isoformat() if job.updated_date else None,
+    }
+
+
+def _refresh_attempts(session, attempt_ids):
+    """Recompute score, percentage and Pass/Failed of evaluated attempts in one statement."""
+    score = select(func.coalesce(func.sum(Answer.marks_awarded), 0)).where(
+        Answer.attempt_id == Exam_Attempt.attempt_id
+    ).scalar_subquery()
+    possible = select(func.coalesce(func.sum(Question.marks), 0)).select_from(Answer).join(
+        Question, Question.question_id == Answer.question_id
+    ).where(Answer.attempt_id == Exam_Attempt.attempt_id).scalar_subquery()
+    pass_mark = select(ExamSchedule.pass_mark).where(
+        ExamSchedule.schedule_id == Exam_Attempt.schedule_id
+    ).scalar_subquery()
+    percentage = case((possible > 0, score * 100.0 / possible), else_=0)
+    result = session.execute(
+        update(Exam_Attempt).where(
+            Exam_Attempt.attempt_id.in_(attempt_ids),
+            Exam_Attempt.status == 'evaluated'
+        ).values(
+            score=score,
+            percentage=percentage,
+            feedback=case((and_(possible > 0, percentage >= pass_mark), 'Pass'), else_='Failed')
+        ).execution_options(synchronize_session=False)
+    )
+    return result.rowcount or 0
+
+
+def _attempt_outcomes(session, attempt_ids):
+    return {
+        str(row.attempt_id): row.feedback
+        for row in session.query(Exam_Attempt.attempt_id, Exam_Attempt.feedback).filter(
+            Exam_Attempt.attempt_id.in_(attempt_ids),
+            Exam_Attempt.status == 'evaluated'
+        ).all()
+    }
+
+
+def rescore_question(question_id):
+    """Re-mark every validated answer of the question; returns a summary of what changed."""
+    db = SQLiteDB()
+    session = db.connect()
+    if not session:
+        raise RuntimeError("Error connecting to database")
+    report = {
+        "question_id": str(question_id),
+        "answers_checked": 0,
+        "answers_changed": 0,
+        "marks_delta": 0.0,
+        "attempts_refreshed": 0,
+        "attempts_outcome_changed": 0,
+    }
+    try:
+        question = session.query(Question).filter_by(question_id=question_id).first()
+        if not question or question.question_type not in RESCORABLE_TYPES:
+            report["skipped"] = "question is missing or not objective"
+            return report
+        options = session.query(
+            Option.question_id, Option.options_id, Option.option_text, Option.is_correct, Option.active_status
+        ).filter(Option.question_id == question_id).all()
+        score = score_fill_answers if question.question_type == 'fill' else score_choice_answers
+
+        last_attempt_id = None
+        while True:
+            chunk_query = session.query(Answer.attempt_id).filter(
+                Answer.question_id == question_id,
+                Answer.is_validated == 1
+            )
+            if last_attempt_id is not None:
+                chunk_query = chunk_query.filter(Answer.attempt_id > last_attempt_id)
+            attempt_ids = [
+                row.attempt_id for row in
+                chunk_query.distinct().order_by(Answer.attempt_id).limit(RESCORE_CHUNK_SIZE).all()
+            ]
+            if not attempt_ids:
+                break
+            last_attempt_id = attempt_ids[-1]
+
+            rows = session.query(
+                Answer.answer_id, Answer.attempt_id, Answer.selected_option_id, Answer.written_answer,
+                Answer.is_correct, Answer.marks_awarded, Answer.feedback
+            ).filter(
+                Answer.question_id == question_id,
+                Answer.is_validated == 1,
+                Answer.attempt_id.in_(attempt_ids)
+            ).all()
+            by_attempt = {}
+            for row in rows:
+                by_attempt.setdefault(row.attempt_id, []).append(row)
+
+            changed = []
+            touched = set()
+            for attempt_id, attempt_rows in by_attempt.items():
+                current = {row.answer_id: row for row in attempt_rows}
+                for result in score(question, options, attempt_rows):
+                    row = current[result["answer_id"]]
+                    # Feedback text lists option sets in no fixed order, so
+                    # only a change in the marks counts.
+                    if (row.is_correct, row.marks_awarded) == (result["is_correct"], result["marks_awarded"]):
+                        continue
+                    report["marks_delta"] += (result["marks_awarded"] or 0) - (row.marks_awarded or 0)
+                    changed.append(result)
+                    touched.add(str(attempt_id))
+            report["answers_checked"] += len(rows)
+
+            if changed:
+                touched = sorted(touched)
+                before = _attempt_outcomes(session, touched)
+                session.execute(update(Answer), changed)
+                report["answers_changed"] += len(changed)
+                report["attempts_refreshed"] += _refresh_attempts(session, touched)
+                after = _attempt_outcomes(session, touched)
+                report["attempts_outcome_changed"] += sum(
+                    1 for attempt_id, outcome in after.items() if before.get(attempt_id) != outcome
+                )
+            # One transaction per chunk keeps locks short on large cohorts.
+            session.commit()
+        print(f"Rescored question {question_id}: {report}")
+        return report
+    except Exception as e:
+        session.rollback()
+        print(f"{e} occurred while rescoring question {question_id} at line {sys.exc_info()[-1].tb_lineno}")
+        raise
+    finally:
+        session.close()
+
+
+def _run_rescore_job(job):
+    return rescore_question(job.target_id)
+
+
+register_job_handler(RESCORE_QUESTION_JOB, _run_rescore_job)
@@ -0,0 +1,201 @@
+import datetime
+import sys
+
+from sqlalchemy import or_
+
+from db.db import SQLiteDB
+from db.models import Exam, ExamSchedule, ReviewQueueEntry
+from others.settings import get_ai_confidence_threshold
+
+# dbo.ReviewQueue has one row per AI-graded descriptive answer with the
+# columns reviewers filter and sort on, so the review queue is an index
+# range scan rather than a walk over attempts. validate_answers adds rows as
+# answers are graded; instructor mark edits and the manual-review flag update
+# them. The confidence threshold is applied when the queue is read, so
+# changing it needs no rewrite.
+REVIEW_QUEUE_CHUNK_SIZE = 500
+REVIEW_QUEUE_MAX_PAGE_SIZE = 200
+REVIEW_QUEUE_STATUSES = ("pending", "reviewed", "all")
+
+
+def _chunks(items, size=REVIEW_QUEUE_CHUNK_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _existing_entries(session, answer_ids):
+    entries = {}
+    for chunk in _chunks(answer_ids):
+        for entry in session.query(ReviewQueueEntry).filter(ReviewQueueEntry.answer_id.in_(chunk)).all():
+            entries[str(entry.answer_id).lower()] = entry
+    return entries
+
+
+def _new_entry(answer, institute_id):
+    return ReviewQueueEntry(
+        answer_id=answer.answer_id,
+        schedule_id=answer.schedule_id,
+        attempt_id=answer.attempt_id,
+        question_id=answer.question_id,
+        user_id=answer.user_id,
+        institute_id=institute_id,
+        manual_review_required=0,
+        reviewed=0
+    )
+
+
+def queue_graded_answers(session, institute_id, graded):
+    """Add or refresh entries for (answer, reviewed) pairs just graded; the caller commits."""
+    if not graded:
+        return
+    existing = _existing_entries(session, [answer.answer_id for answer, _ in graded])
+    now = datetime.datetime.utcnow()
+    for answer, reviewed in graded:
+        entry = existing.get(str(answer.answer_id).lower())
+        if entry is None:
+            entry = _new_entry(answer, institute_id)
+            session.add(entry)
+        entry.ai_confidence = answer.ai_confidence
+        entry.manual_review_required = 1 if answer.manual_review_required == 1 else 0
+        entry.reviewed = 1 if reviewed else 0
+        entry.updated_date = now
+
+
+def _entry_for(session, answer):
+    entry = session.get(ReviewQueueEntry, answer.answer_id)
+    if entry is None:
+        institute_id = session.query(Exam.institute_id).join(
+            ExamSchedule, ExamSchedule.exam_id == Exam.exam_id
+        ).filter(ExamSchedule.schedule_id == answer.schedule_id).scalar()
+        entry = _new_entry(answer, institute_id)
+        entry.ai_confidence = answer.ai_confidence
+        session.add(entry)
+    return entry
+
+
+def mark_answer_reviewed(session, answer, reviewed_by=None):
+    """Record an instructor's mark edit on the answer's entry; the caller commits."""
+    entry = _entry_for(session, answer)
+    entry.reviewed = 1
+    entry.reviewed_by = reviewed_by
+    entry.reviewed_date = datetime.datetime.utcnow()
+    entry.updated_date = entry.reviewed_date
+
+
+def set_manual_review_required(session, answer):
+    """Mirror the answer's manual_review_required flag into the queue; the caller commits."""
+    flagged = 1 if answer.manual_review_required == 1 else 0
+    if not flagged and session.get(ReviewQueueEntry, answer.answer_id) is None:
+        return
+    entry = _entry_for(session, answer)
+    entry.manual_review_required = flagged
+    entry.updated_date = datetime.datetime.utcnow()
+
+
+def discard_attempt_entries(session, attempt_id):
+    """Drop an attempt's entries before its answers are replaced; the caller commits."""
+    session.query(ReviewQueueEntry).filter(
+        ReviewQueueEntry.attempt_id == attempt_id
+    ).delete(synchronize_session=False)
+
+
+def _arg_float(args, name):
+    value = args.get(name)
+    if value in (None, ""):
+        return None
+    return float(value)
+
+
+def get_review_queue(request, institute_id=None):
+    """
+    Page through AI-graded descriptive answers, lowest confidence first.
+
+    institute_id, when given, restricts the queue to that institute and
+    overrides the institute_id query param.
+
+    Query params:
+    - pageNumber / pageSize: pagination (default 1 / 25, pageSize at most 200)
+    - status: pending (default), reviewed or all
+    - needs_review: when true (default), only answers below the AI confidence
+      threshold or flagged for manual review
+    - schedule_id, attempt_id, question_id, institute_id: exact filters
+    - min_confidence / max_confidence: inclusive confidence bounds
+    - sort: asc (default) or desc by confidence
+    """
+    args = getattr(request, "args", {})
+    page_number = max(args.get('pageNumber', 1, type=int) or 1, 1)
+    page_size = min(max(args.get('pageSize', 25, type=int) or 25, 1), REVIEW_QUEUE_MAX_PAGE_SIZE)
+    status = str(args.get('status', 'pending') or 'pending').strip().lower()
+    if status not in REVIEW_QUEUE_STATUSES:
+        return {"statusMessage": f"status must be one of {', '.join(REVIEW_QUEUE_STATUSES)}", "status": False}, 400
+    needs_review = str(args.get('needs_review', '1')).strip().lower() in ('1', 'true', 'yes', 'on')
+    try:
+        min_confidence = _arg_float(args, 'min_confidence')
+        max_confidence = _arg_float(args, 'max_confidence')
+    except ValueError:
+        return {"statusMessage": "min_confidence and max_confidence must be numbers", "status": False}, 400
+    descending = str(args.get('sort', 'asc')).strip().lower() == 'desc'
+
+    db = SQLiteDB()
+    session = db.connect()
+    if not session:
+        return {"statusMessage": "Error connecting to database", "status": False}, 500
+    try:
+        threshold = get_ai_confidence_threshold(session)
+        query = session.query(ReviewQueueEntry)
+        if status != "all":
+            query = query.filter(ReviewQueueEntry.reviewed == (1 if status == "reviewed" else 0))
+        if needs_review:
+            query = query.filter(or_(
+                ReviewQueueEntry.ai_confidence < threshold,
+                ReviewQueueEntry.manual_review_required == 1
+            ))
+        if institute_id:
+            query = query.filter(ReviewQueueEntry.institute_id == institute_id)
+        elif args.get('institute_id'):
+            query = query.filter(ReviewQueueEntry.institute_id == args.get('institute_id'))
+        for name in ('schedule_id', 'attempt_id', 'question_id'):
+            if args.get(name):
+                query = query.filter(getattr(ReviewQueueEntry, name) == args.get(name))
+        if min_confidence is not None:
+            query = query.filter(ReviewQueueEntry.ai_confidence >= min_confidence)
+        if max_confidence is not None:
+            query = query.filter(ReviewQueueEntry.ai_confidence <= max_confidence)
+
+        total_count = query.count()
+        confidence = ReviewQueueEntry.ai_confidence.desc() if descending else ReviewQueueEntry.ai_confidence.asc()
+        entries = query.order_by(confidence, ReviewQueueEntry.answer_id).offset(
+            (page_number - 1) * page_size
+        ).limit(page_size).all()
+
+        data = [{
+            "answer_id": str(entry.answer_id),
+            "schedule_id": str(entry.schedule_id),
+            "attempt_id": str(entry.attempt_id),
+            "question_id": str(entry.question_id),
+            "user_id": str(entry.user_id),
+            "ai_confidence": entry.ai_confidence,
+            "needs_manual_review": entry.ai_confidence is not None and entry.ai_confidence < threshold,
+            "manual_review_required": entry.manual_review_required == 1,
+            "reviewed": entry.reviewed == 1,
+            "reviewed_by": entry.reviewed_by,
+            "reviewed_date": entry.reviewed_date.isoformat() if entry.reviewed_date else None,
+            "updated_date": entry.updated_date.isoformat() if entry.updated_date else None,
+        } for entry in entries]
+        return {
+            "statusMessage": "Review queue fetched successfully",
+            "status": True,
+            "data": data,
+            "ai_confidence_threshold": threshold,
+            "pagination": {
+                "pageNumber": page_number,
+                "pageSize": page_size,
+                "totalCount": total_count,
+                "totalPages": (total_count + page_size - 1) // page_size
+            }
+        }, 200
+    except Exception as e:
+        print(f"{e} occurred while fetching the review queue at line {sys.exc_info()[-1].tb_lineno}")
+        return {"statusMessage": "Error fetching review queue", "status": False}, 500
+    finally:
+        session.close()
@@ -0,0 +1,141 @@
+import datetime
+
+from sqlalchemy import func, select
+
+from db.models import Exam_Attempt, ExamScheduleMapping, ScheduleCompletion
+
+# dbo.ScheduleCompletions holds, per schedule, how many distinct users are
+# assigned and how many of them have finished an attempt, so the
+# after_everyone_finishes review check is a primary-key read instead of a
+# scan of the mappings and attempts on every review request.
+# Submissions bump finished_users with an atomic increment; assignment
+# changes recompute both counts in a single UPDATE. Both run inside the
+# caller's transaction.
+
+
+def _finished_filter():
+    return Exam_Attempt.submitted_date.isnot(None) | Exam_Attempt.status.in_(('submitted', 'evaluated'))
+
+
+def _assigned_users(session, schedule_id):
+    return session.query(ExamScheduleMapping.user_id).filter(
+        ExamScheduleMapping.schedule_id == schedule_id,
+        ExamScheduleMapping.user_id.isnot(None)
+    )
+
+
+def count_schedule_completion(session, schedule_id):
+    """(assigned, finished) computed from the mappings and attempts."""
+    assigned = session.query(func.count(func.distinct(ExamScheduleMapping.user_id))).filter(
+        ExamScheduleMapping.schedule_id == schedule_id,
+        ExamScheduleMapping.user_id.isnot(None)
+    ).scalar() or 0
+    finished = 0
+    if assigned:
+        finished = session.query(func.count(func.distinct(Exam_Attempt.user_id))).filter(
+            Exam_Attempt.schedule_id == schedule_id,
+            Exam_Attempt.user_id.in_(_assigned_users(session, schedule_id)),
+            _finished_filter()
+        ).scalar() or 0
+    return assigned, finished
+
+
+def _recount(session, schedule_id):
+    """Set both counters from subqueries in one statement; 0 when the row is missing.
+
+    Counting and writing in the same UPDATE means a submission committed
+    meanwhile is either counted or blocks the statement, never overwritten
+    by a count read before it.
+    """
+    assigned_users = select(ExamScheduleMapping.user_id).where(
+        ExamScheduleMapping.schedule_id == schedule_id,
+        ExamScheduleMapping.user_id.isnot(None)
+    )
+    assigned = select(func.count(func.distinct(ExamScheduleMapping.user_id))).where(
+        ExamScheduleMapping.schedule_id == schedule_id,
+        ExamScheduleMapping.user_id.isnot(None)
+    ).scalar_subquery()
+    finished = select(func.count(func.distinct(Exam_Attempt.user_id))).where(
+        Exam_Attempt.schedule_id == schedule_id,
+        Exam_Attempt.user_id.in_(assigned_users),
+        _finished_filter()
+    ).scalar_subquery()
+    return session.query(ScheduleCompletion).filter(
+        ScheduleCompletion.schedule_id == schedule_id
+    ).update({
+        ScheduleCompletion.assigned_users: assigned,
+        ScheduleCompletion.finished_users: finished,
+        ScheduleCompletion.updated_date: datetime.datetime.utcnow()
+    }, synchronize_session=False)
+
+
+def recompute_schedule_completion(session, schedule_id):
+    """Rebuild the schedule's counters after its assignments changed; the caller commits."""
+    session.flush()
+    if not _recount(session, schedule_id):
+        session.add(ScheduleCompletion(schedule_id=schedule_id, assigned_users=0, finished_users=0))
+        session.flush()
+        _recount(session, schedule_id)
+    row = session.get(ScheduleCompletion, schedule_id)
+    # The UPDATE bypassed the identity map; reload the counters on next access.
+    session.expire(row)
+    return row
+
+
+def delete_schedule_completion(session, schedule_id):
+    session.query(ScheduleCompletion).filter(
+        ScheduleCompletion.schedule_id == schedule_id
+    ).delete(synchronize_session=False)
+
+
+def record_attempts_finished(session, attempts):
+    """Count attempts that just became submitted; the caller commits.
+
+    Only users who are assigned to the schedule and have no other finished
+    attempt there are new finishers.
+    """
+    by_schedule = {}
+    for attempt in attempts:
+        by_schedule.setdefault(attempt.schedule_id, []).append(attempt)
+    if not by_schedule:
+        return
+    session.flush()
+    now = datetime.datetime.utcnow()
+    for schedule_id, schedule_attempts in by_schedule.items():
+        user_ids = {attempt.user_id for attempt in schedule_attempts}
+        attempt_ids = [attempt.attempt_id for attempt in schedule_attempts]
+        assigned = {
+            row.user_id for row in _assigned_users(session, schedule_id).filter(
+                ExamScheduleMapping.user_id.in_(user_ids)
+            ).distinct().all()
+        }
+        if not assigned:
+            continue
+        already = {
+            row.user_id for row in session.query(Exam_Attempt.user_id).filter(
+                Exam_Attempt.schedule_id == schedule_id,
+                Exam_Attempt.user_id.in_(assigned),
+                Exam_Attempt.attempt_id.notin_(attempt_ids),
+                _finished_filter()
+            ).distinct().all()
+        }
+        newly_finished = len(assigned - already)
+        if not newly_finished:
+            continue
+        updated = session.query(ScheduleCompletion).filter(
+            ScheduleCompletion.schedule_id == schedule_id
+        ).update({
+            ScheduleCompletion.finished_users: ScheduleCompletion.finished_users + newly_finished,
+            ScheduleCompletion.updated_date: now
+        }, synchronize_session=False)
+        if not updated:
+            # Schedules created before the counters existed and missed by the backfill.
+            recompute_schedule_completion(session, schedule_id)
+
+
+def schedule_completion(session, schedule_id):
+    """(assigned, finished) for the schedule; counted directly when it has no counters row."""
+    row = session.get(ScheduleCompletion, schedule_id)
+    if row is None:
+        return count_schedule_completion(session, schedule_id)
+    return row.assigned_users or 0, row.finished_users or 0
@@ -1,35 +1,181 @@
+import datetime
+import os
+import sys
+import threading
+
 from sqlalchemy.sql import func
 
-from db.db import SQLiteDB
-from db.models import Setting
+from db.db import SQLiteDB, get_session_factory
+from db.cache_versions import VersionWatcher, bump_cache_version
+from db.metrics import cache_fill
+from db.models import AppSetting, Setting
+
 
+# Runtime settings, read through one in-process cache per worker. The AI
+# confidence threshold lives in dbo.Settings (latest row wins); the other
+# tunables are optional overrides in dbo.AppSettings, falling back to their
+# environment variable and then to the built-in default. Updates bump the
+# 'settings' version stamp and every worker reloads within
+# SETTINGS_VERSION_CHECK_SECS, so a change needs no restart.
+SETTINGS_CACHE_VERSION_NAME = 'settings'
+SETTINGS_VERSION_CHECK_SECS = float(os.getenv('SETTINGS_VERSION_CHECK_SECS', 5))
 
 DEFAULT_AI_CONFIDENCE_THRESHOLD = 70.0
 
 
+class Tunable:
+    def __init__(self, name, cast, default, minimum, maximum, env=None, description=""):
+        self.name = name
+        self.cast = cast
+        self.env = env
+        self.minimum = minimum
+        self.maximum = maximum
+        self.description = description
+        self.default = self.parse(os.getenv(env), default) if env else default
+
+    def parse(self, raw, fallback):
+        """raw as this tunable's type, or fallback when it is missing or out of range."""
+        if raw is None or raw == "":
+            return fallback
+        try:
+            value = float(raw)
+        except (TypeError, ValueError):
+            return fallback
+        if self.cast is int:
+            if not value.is_integer():
+                return fallback
+            value = int(value)
+        if value < self.minimum or value > self.maximum:
+            return fallback
+        return value
+
+
+TUNABLES = {tunable.name: tunable for tunable in (
+    Tunable('ai_confidence_threshold', float, DEFAULT_AI_CONFIDENCE_THRESHOLD, 0, 100,
+            description="Descriptive answers graded below this AI confidence need manual review."),
+    Tunable('grading_concurrency', int, 4, 1, 32, env='GRADING_CONCURRENCY',
+            description="Descriptive answers of one attempt graded in parallel."),
+    Tunable('auth_session_cache_ttl', float, 30.0, 0, 3600, env='AUTH_SESSION_CACHE_TTL',
+            description="Seconds a verified login session skips the App_Session lookup."),
+    Tunable('paper_cache_ttl', float, 600.0, 0, 86400, env='PAPER_CACHE_TTL',
+            description="Seconds a compiled exam paper stays cached."),
+    Tunable('autosave_flush_interval_secs', float, 3.0, 0.5, 300, env='AUTOSAVE_FLUSH_INTERVAL_SECS',
+            description="Seconds between folds of the autosave journal into Answers."),
+)}
+
+
+class SettingsService:
+    def __init__(self):
+        self._values = None
+        self._lock = threading.Lock()
+        self._version = VersionWatcher(SETTINGS_CACHE_VERSION_NAME, SETTINGS_VERSION_CHECK_SECS)
+
+    def _load(self, session):
+        """(values, complete); values fall back to defaults where a read failed."""
+        values = {name: tunable.default for name, tunable in TUNABLES.items()}
+        complete = True
+        try:
+            setting = session.query(Setting.ai_confidence_threshold).order_by(Setting.updated_at.desc()).first()
+            if setting and setting.ai_confidence_threshold is not None:
+                values['ai_confidence_threshold'] = float(setting.ai_confidence_threshold)
+        except Exception as e:
+            complete = False
+            print(f"{e} occurred while loading the AI confidence threshold at line {sys.exc_info()[-1].tb_lineno}")
+        try:
+            for row in session.query(AppSetting.name, AppSetting.value).all():
+                tunable = TUNABLES.get(row.name)
+                if tunable is not None and tunable.name != 'ai_confidence_threshold':
+                    values[tunable.name] = tunable.parse(row.value, tunable.default)
+        except Exception as e:
+            # For example before the AppSettings migration ran.
+            complete = False
+            print(f"{e} occurred while loading app settings at line {sys.exc_info()[-1].tb_lineno}")
+        return values, complete
+
+    def values(self, session=None):
+        """All tunables by name, reloading at most every SETTINGS_VERSION_CHECK_SECS after a change."""
+        if self._version.changed(session):
+            self.invalidate()
+        values = self._values
+        if values is not None:
+            return values
+        with self._lock:
+            if self._values is not None:
+                return self._values
+            # A private session: reloading must not commit, roll back or
+            # expire anything in the caller's (possibly request) session.
+            owns_session = session is None
+            if owns_session:
+                session = get_session_factory()()
+            try:
+                with cache_fill():
+                    values, complete = self._load(session)
+            finally:
+                if owns_session and session:
+                    session.close()
+            # A failed read is not cached, so the next call tries again.
+            if complete:
+                self._values = values
+            return values
+
+    def get(self, name, session=None):
+        return self.values(session)[name]
+
+    def invalidate(self):
+        with self._lock:
+            self._values = None
+
+    def set(self, session, name, value, updated_by=None):
+        """Validate and store a tunable in the caller's transaction; the caller commits.
+
+        Returns the stored value; raises ValueError for an unknown name or a
+        value of the wrong type or out of range.
+        """
+        tunable = TUNABLES.get(name)
+        if tunable is None:
+            raise ValueError(f"Unknown setting '{name}'")
+        parsed = tunable.parse(value, None)
+        if parsed is None:
+            kind = "a whole number" if tunable.cast is int else "a number"
+            raise ValueError(f"{name} must be {kind} between {tunable.minimum:g} and {tunable.maximum:g}")
+        if name == 'ai_confidence_threshold':
+            setting = session.query(Setting).order_by(Setting.updated_at.desc()).first()
+            if not setting:
+                setting = Setting()
+            setting.ai_confidence_threshold = parsed
+            setting.updated_by = updated_by
+            setting.updated_at = func.now()
+            session.add(setting)
+        else:
+            row = session.get(AppSetting, name)
+            if row is None:
+                row = AppSetting(name=name)
+                session.add(row)
+            row.value = str(parsed)
+            row.updated_by = updated_by
+            row.updated_at = datetime.datetime.utcnow()
+        bump_cache_version(session, SETTINGS_CACHE_VERSION_NAME)
+        return parsed
+
+
+settings = SettingsService()
+
+
+def get_setting(name, session=None):
+    return settings.get(name, session)
+
+
 def get_ai_confidence_threshold(session=None):
     """Return the live threshold, falling back safely before the seed exists."""
-    owns_session = session is None
-    if owns_session:
-        session = SQLiteDB().connect()
     try:
-        try:
-            setting = session.query(Setting).order_by(Setting.updated_at.desc()).first()
-            return float(setting.ai_confidence_threshold) if setting and setting.ai_confidence_threshold is not None else DEFAULT_AI_CONFIDENCE_THRESHOLD
-        except Exception:
-            return DEFAULT_AI_CONFIDENCE_THRESHOLD
-    finally:
-        if owns_session and session:
-            session.close()
+        return settings.get('ai_confidence_threshold', session)
+    except Exception:
+        return DEFAULT_AI_CONFIDENCE_THRESHOLD
 
 
 def get_ai_confidence_threshold_response():
-    db = SQLiteDB()
-    session = db.connect()
-    if not session:
-        return {"status": False, "statusMessage": "Error connecting to database"}, 500
     try:
-        threshold = get_ai_confidence_threshold(session)
+        threshold = get_ai_confidence_threshold()
         return {
             "status": True,
             "statusMessage": "Success",
@@ -37,8 +183,6 @@ def get_ai_confidence_threshold_response():
         }, 200
     except Exception as exc:
         return {"status": False, "statusMessage": f"Error fetching setting: {exc}"}, 500
-    finally:
-        session.close()
 
 
 def update_ai_confidence_threshold(data, current_user):
@@ -55,14 +199,9 @@ def update_ai_confidence_threshold(data, current_user):
     if not session:
         return {"status": False, "statusMessage": "Error connecting to database"}, 500
     try:
-        setting = session.query(Setting).order_by(Setting.updated_at.desc()).first()
-        if not setting:
-            setting = Setting()
-        setting.ai_confidence_threshold = threshold
-        setting.updated_by = current_user.user_id
-        setting.updated_at = func.now()
-        session.add(setting)
+        settings.set(session, 'ai_confidence_threshold', threshold, current_user.user_id)
         session.commit()
+        settings.invalidate()
         return {
             "status": True,
             "statusMessage": "AI confidence threshold updated successfully",
@@ -73,3 +212,49 @@ def update_ai_confidence_threshold(data, current_user):
         return {"status": False, "statusMessage": f"Error updating setting: {exc}"}, 500
     finally:
         session.close()
+
+
+def _describe_settings(values):
+    return [{
+        "name": name,
+        "value": values[name],
+        "default": tunable.default,
+        "minimum": tunable.minimum,
+        "maximum": tunable.maximum,
+        "type": tunable.cast.__name__,
+        "description": tunable.description,
+    } for name, tunable in TUNABLES.items()]
+
+
+def get_settings_response():
+    try:
+        return {"status": True, "statusMessage": "Success", "data": _describe_settings(settings.values())}, 200
+    except Exception as exc:
+        return {"status": False, "statusMessage": f"Error fetching settings: {exc}"}, 500
+
+
+def update_settings(data, current_user):
+    """Update several tunables at once: {"grading_concurrency": 6, ...}."""
+    changes = data or {}
+    if not isinstance(changes, dict) or not changes:
+        return {"status": False, "statusMessage": "No settings provided"}, 400
+    db = SQLiteDB()
+    session = db.connect()
+    if not session:
+        return {"status": False, "statusMessage": "Error connecting to database"}, 500
+    try:
+        try:
+            for name, value in changes.items():
+                settings.set(session, name, value, current_user.user_id)
+        except ValueError as exc:
+            session.rollback()
+            return {"status": False, "statusMessage": str(exc)}, 400
+        session.commit()
+        settings.invalidate()
+        return {"status": True, "statusMessage": "Settings updated successfully",
+                "data": _describe_settings(settings.values())}, 200
+    except Exception as exc:
+        session.rollback()
+        return {"status": False, "statusMessage": f"Error updating settings: {exc}"}, 500
+    finally:
+        session.close()
@@ -1,5 +1,6 @@
-import pandas as pd
+import math
 import re
+import sys
 from db.models import User, Institute, InstituteDepartment, InstituteTeam,InstituteCampus
 from db.models import Credential, UserPageAccess, Page, Country, State,City
 from db.db import SQLiteDB
@@ -7,8 +8,16 @@ from datetime import datetime, timedelta
 from passlib.hash import argon2
 from sqlalchemy import or_, and_
 
+def _is_missing(val):
+    if val is None or (isinstance(val, float) and math.isnan(val)):
+        return True
+    # Bulk uploads hand over pandas scalars (NaT, pd.NA); pandas is only
+    # loaded by the upload handlers, so consult it only when it is present.
+    pd = sys.modules.get('pandas')
+    return bool(pd is not None and pd.api.types.is_scalar(val) and pd.isna(val))
+
 def normalize_phone_number(val):
-    if val is None or pd.isna(val):
+    if _is_missing(val):
         return None
 
     if isinstance(val, (int, float)):
@@ -203,6 +212,7 @@ def user_bulk_upload(request):
         return {"statusMessage": "Please select a file to upload.", "status": False}, 400
 
     # Read file using pandas (supports CSV and Excel formats)
+    import pandas as pd
     try:
         filename = file.filename.lower()
         if filename.endswith(('.xlsx', '.xls')):
@@ -0,0 +1,93 @@
+import os
+import sys
+import argparse
+import subprocess
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+# Imports app.py in a fresh interpreter under `python -X importtime` and
+# checks the cumulative import time against a budget. Migrations are
+# skipped so the number reflects module loading only; pandas, httpx and the
+# Azure AD key helpers should not show up in the breakdown.
+DEFAULT_BUDGET_MS = float(os.getenv("STARTUP_IMPORT_BUDGET_MS", 1500))
+HEAVY_MODULES = ("pandas", "numpy", "httpx", "requests", "rsa")
+# Run in the child interpreter. The stock importer is put back however the
+# import ends, so a failing import never leaves startup_timing's hook behind.
+IMPORT_APP = (
+    "import builtins\n"
+    "original_import = builtins.__import__\n"
+    "try:\n"
+    "    import app\n"
+    "finally:\n"
+    "    builtins.__import__ = original_import\n"
+)
+
+
+def parse_importtime(stderr: str):
+    """Return {module: (self_us, cumulative_us, depth)} from -X importtime output."""
+    timings = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+            stripped = name.strip()
+            depth = (len(name) - len(name.lstrip()) - 1) // 2
+            timings[stripped] = (int(self_us), int(cumulative_us), depth)
+        except ValueError:
+            continue
+    return timings
+
+
+def run_once():
+    env = dict(os.environ)
+    env.setdefault("JWT_SECRET", "import-time-benchmark")
+    env["RUN_MIGRATIONS_ON_START"] = "0"
+    env["STARTUP_TIMING"] = "0"
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", IMPORT_APP],
+        cwd=BACKEND_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        print(result.stderr[-2000:])
+        raise SystemExit(f"Importing app failed with exit code {result.returncode}")
+    return parse_importtime(result.stderr)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Measure the import time of the Flask app and compare it to a budget.")
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS, help="Maximum cumulative import time of app.py in milliseconds.")
+    parser.add_argument("--runs", type=int, default=3, help="Number of fresh interpreters to measure; the fastest run is reported.")
+    parser.add_argument("--top", type=int, default=15, help="Number of slowest top-level imports to list.")
+    args = parser.parse_args()
+
+    best = None
+    for _ in range(max(args.runs, 1)):
+        timings = run_once()
+        total_us = timings.get("app", (0, 0, 0))[1]
+        if best is None or total_us < best[0]:
+            best = (total_us, timings)
+
+    total_us, timings = best
+    # Direct children of app (depth 1) are what app.py itself pays for.
+    children = [(name, cumulative) for name, (_, cumulative, depth) in timings.items() if depth == 1]
+    children.sort(key=lambda item: item[1], reverse=True)
+    print(f"import app: {total_us / 1000:.1f} ms (budget {args.budget_ms:.0f} ms)")
+    for name, cumulative in children[:args.top]:
+        print(f"  {cumulative / 1000:8.1f} ms  {name}")
+
+    loaded_heavy = [name for name in HEAVY_MODULES if name in timings]
+    if loaded_heavy:
+        print(f"Loaded at import time (expected lazily): {', '.join(loaded_heavy)}")
+
+    if total_us / 1000 > args.budget_ms:
+        print("Import time is over budget.")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
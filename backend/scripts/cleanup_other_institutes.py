@@ -24,8 +24,8 @@ from db.models import (
     Institute, InstituteCampus, InstituteDepartment, InstituteTeam,
     User, Credential, AppSession, UserPageAccess,
     Exam, ExamMapping, ExamQuestionMapping, ExamsDepartments, ExamsTeams,
-    ExamSchedule, ExamScheduleMapping, Exam_Attempt, Answer, MarksHistory,
-    ExamReviewComments, ExamReviewCommentsHistory,
+    ExamSchedule, ExamScheduleMapping, ScheduleCompletion, Exam_Attempt, Answer, MarksHistory,
+    ExamReviewComments, ExamReviewCommentsHistory, ReviewQueueEntry,
     Categories, CategoriesDepartments, CategoriesTeams, QuestionMapping, openai_requests
 )
 
@@ -137,20 +137,24 @@ def main():
 
             session.query(ExamReviewCommentsHistory).filter(~ExamReviewCommentsHistory.attempt_id.in_(keep_attempt_ids)).delete(synchronize_session=False)
             session.query(ExamReviewComments).filter(~ExamReviewComments.attempt_id.in_(keep_attempt_ids)).delete(synchronize_session=False)
+            session.query(ReviewQueueEntry).filter(~ReviewQueueEntry.attempt_id.in_(keep_attempt_ids)).delete(synchronize_session=False)
             session.query(Answer).filter(~Answer.attempt_id.in_(keep_attempt_ids)).delete(synchronize_session=False)
             session.query(Exam_Attempt).filter(~Exam_Attempt.attempt_id.in_(keep_attempt_ids)).delete(synchronize_session=False)
         else:
             session.query(MarksHistory).delete(synchronize_session=False)
             session.query(ExamReviewCommentsHistory).delete(synchronize_session=False)
             session.query(ExamReviewComments).delete(synchronize_session=False)
+            session.query(ReviewQueueEntry).delete(synchronize_session=False)
             session.query(Answer).delete(synchronize_session=False)
             session.query(Exam_Attempt).delete(synchronize_session=False)
 
         if keep_schedule_ids:
             session.query(ExamScheduleMapping).filter(~ExamScheduleMapping.schedule_id.in_(keep_schedule_ids)).delete(synchronize_session=False)
+            session.query(ScheduleCompletion).filter(~ScheduleCompletion.schedule_id.in_(keep_schedule_ids)).delete(synchronize_session=False)
             session.query(ExamSchedule).filter(~ExamSchedule.schedule_id.in_(keep_schedule_ids)).delete(synchronize_session=False)
         else:
             session.query(ExamScheduleMapping).delete(synchronize_session=False)
+            session.query(ScheduleCompletion).delete(synchronize_session=False)
             session.query(ExamSchedule).delete(synchronize_session=False)
 
         if keep_exam_ids:
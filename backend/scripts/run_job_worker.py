@@ -0,0 +1,50 @@
+import os
+import sys
+import argparse
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+def load_env_file(path: str) -> None:
+    if not os.path.exists(path):
+        return
+    with open(path, "r", encoding="utf-8") as env_file:
+        for line in env_file:
+            line = line.strip()
+            if not line or line.startswith("#") or "=" not in line:
+                continue
+            key, value = line.split("=", 1)
+            os.environ.setdefault(key.strip(), value.strip().strip('"').strip("'"))
+
+load_env_file(os.path.join(BACKEND_DIR, ".env"))
+
+# Importing the handler modules registers their job types and periodic tasks.
+import others.exam_review
+import others.rescoring
+import others.autosave_journal
+import others.prepared_papers
+from others.background import start_background_tasks
+from others.jobs import JOB_WORKER_THREADS, start_job_workers, work_forever
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Run background job workers (answer evaluation and other queued work).")
+    parser.add_argument("--threads", type=int, default=max(JOB_WORKER_THREADS, 1), help="Number of worker threads in this process.")
+    parser.add_argument("--no-periodic", action="store_true", help="Do not run the periodic tasks (autosave flush, paper preparation, expired-attempt sweep) here.")
+    args = parser.parse_args()
+
+    if not args.no_periodic:
+        start_background_tasks()
+    if args.threads > 1:
+        start_job_workers(args.threads - 1)
+    print(f"Job worker started with {args.threads} thread(s)", flush=True)
+    try:
+        work_forever()
+    except KeyboardInterrupt:
+        print("Job worker stopped")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
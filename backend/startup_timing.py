@@ -0,0 +1,76 @@
+import builtins
+import os
+import sys
+import threading
+import time
+
+# Boot-time profile for app.py: wall time per startup phase plus the slowest
+# top-level imports, printed once when the app module finishes loading.
+# It is the in-process counterpart of `python -X importtime`; use
+# scripts/bench_import_time.py for the full breakdown and the budget check.
+# Set STARTUP_TIMING=0 to disable it.
+
+ENABLED = str(os.getenv('STARTUP_TIMING', '1')).strip().lower() in ('1', 'true', 'yes', 'on')
+TOP_IMPORTS = int(os.getenv('STARTUP_TIMING_TOP', 8))
+
+_original_import = builtins.__import__
+_local = threading.local()
+_started = None
+_last_mark = None
+_phases = []
+_import_seconds = {}
+
+
+def _timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+    # Only the outermost import of a not-yet-loaded package is timed, so the
+    # cost of its own dependencies is attributed to it.
+    if level or getattr(_local, 'depth', 0) or name in sys.modules:
+        return _original_import(name, globals, locals, fromlist, level)
+    _local.depth = 1
+    start = time.perf_counter()
+    try:
+        return _original_import(name, globals, locals, fromlist, level)
+    finally:
+        _local.depth = 0
+        root = name.partition('.')[0]
+        _import_seconds[root] = _import_seconds.get(root, 0.0) + time.perf_counter() - start
+
+
+def begin():
+    global _started, _last_mark
+    if not ENABLED or _started is not None:
+        return
+    _started = _last_mark = time.perf_counter()
+    builtins.__import__ = _timed_import
+
+
+def end_imports():
+    """Put the stock importer back; app.py calls it in a finally around its imports."""
+    if builtins.__import__ is _timed_import:
+        builtins.__import__ = _original_import
+
+
+def mark(phase):
+    """Close the current phase under the given name."""
+    global _last_mark
+    if _started is None:
+        return
+    now = time.perf_counter()
+    _phases.append((phase, now - _last_mark))
+    _last_mark = now
+
+
+def report():
+    """Print the startup summary (and stop timing imports if still on)."""
+    global _started
+    if _started is None:
+        return
+    end_imports()
+    total = time.perf_counter() - _started
+    _started = None
+    phases = ", ".join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in _phases)
+    print(f"Startup finished in {total * 1000:.0f} ms ({phases})", flush=True)
+    slowest = sorted(_import_seconds.items(), key=lambda item: item[1], reverse=True)[:TOP_IMPORTS]
+    if slowest:
+        imports = ", ".join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in slowest)
+        print(f"Slowest imports: {imports}", flush=True)
@@ -0,0 +1,138 @@
+import datetime
+import os
+import uuid
+
+import pytest
+from sqlalchemy import BigInteger
+from sqlalchemy.dialects.mssql import UNIQUEIDENTIFIER
+from sqlalchemy.ext.compiler import compiles
+
+# app.py reads these at import; the suite runs without migrations, background
+# threads or SQL Server and fails any request that breaks its query budget.
+os.environ.setdefault('JWT_SECRET', 'launch-exam-query-test-secret-0123456789')
+os.environ['RUN_MIGRATIONS_ON_START'] = '0'
+os.environ['BACKGROUND_TASKS_ENABLED'] = '0'
+os.environ['JOB_WORKER_THREADS'] = '0'
+os.environ['QUERY_BUDGET_ENFORCE'] = '1'
+
+import db.db as db_module
+from db.models import (
+    AppSession, Base, Categories, Exam, ExamMapping, ExamQuestionMapping, ExamSchedule, Option, Question,
+    QuestionMapping, User
+)
+
+
+@compiles(UNIQUEIDENTIFIER, 'sqlite')
+def _uniqueidentifier_on_sqlite(type_, compiler, **kw):
+    return 'VARCHAR(36)'
+
+
+@compiles(BigInteger, 'sqlite')
+def _biginteger_on_sqlite(type_, compiler, **kw):
+    # SQLite only autoincrements INTEGER PRIMARY KEY columns.
+    return 'INTEGER'
+
+
+USER_ID = '11111111-1111-1111-1111-111111111111'
+INSTITUTE_ID = '22222222-2222-2222-2222-222222222222'
+
+
+@pytest.fixture(scope='module')
+def launch_client(tmp_path_factory):
+    """The real app on a SQLite file, with a signed-in user."""
+    database = tmp_path_factory.mktemp('launch') / 'edu.db'
+    create_engine = db_module.create_engine
+
+    def sqlite_engine(url, **kwargs):
+        for key in ('poolclass', 'pool_size', 'max_overflow', 'pool_timeout', 'fast_executemany'):
+            kwargs.pop(key, None)
+        return create_engine(f'sqlite:///{database}', **kwargs)
+
+    with pytest.MonkeyPatch.context() as patch:
+        # The models store ids as strings; SQLite has no uuid type to convert to.
+        patch.setattr(UNIQUEIDENTIFIER, 'bind_processor', lambda self, dialect: None)
+        patch.setattr(UNIQUEIDENTIFIER, 'result_processor', lambda self, dialect, coltype: None)
+        patch.setattr(db_module, 'create_engine', sqlite_engine)
+        patch.setattr(db_module, '_engine', None)
+        Base.metadata.create_all(db_module.get_engine())
+
+        import app as app_module
+
+        token = app_module.jwt_validator.generate_jwt('student@example.com')
+        session = db_module.get_session_factory()()
+        session.add(User(user_id=USER_ID, full_name='Student', user_name='student',
+                         email='student@example.com', user_role='admin'))
+        session.add(AppSession(user_id=USER_ID, token=token))
+        session.commit()
+        session.close()
+
+        stats = []
+        original_end_request_stats = app_module.end_request_stats
+
+        def end_request_stats():
+            current = original_end_request_stats()
+            stats.append(current)
+            return current
+
+        patch.setattr(app_module, 'end_request_stats', end_request_stats)
+        yield app_module, app_module.app.test_client(), {'Authorization': f'Bearer {token}'}, stats
+        db_module.get_engine().dispose()
+        db_module._engine = None
+
+
+def _add_paper(categories, questions_per_category):
+    """An exam whose categories alternate between randomized, hand-picked and
+    fixed-but-topped-up-from-the-bank sections, on a pregenerated schedule."""
+    session = db_module.get_session_factory()()
+    exam_id = str(uuid.uuid4())
+    schedule_id = str(uuid.uuid4())
+    session.add(Exam(exam_id=exam_id, title='Paper', institute_id=INSTITUTE_ID, duration_mins=30,
+                     total_questions=categories * questions_per_category))
+    for c in range(categories):
+        category_id = str(uuid.uuid4())
+        session.add(Categories(category_id=category_id, name=f'Category {c}', institute_id=INSTITUTE_ID))
+        question_ids = []
+        for q in range(questions_per_category * 2):
+            question_id = str(uuid.uuid4())
+            question_ids.append(question_id)
+            session.add(Question(question_id=question_id, question_text=f'Q{c}.{q}', question_type='choose'))
+            session.add(Option(question_id=question_id, option_text='right', is_correct=1))
+            session.add(Option(question_id=question_id, option_text='wrong', is_correct=0))
+            session.add(QuestionMapping(question_id=question_id, category_id=category_id))
+        kind = c % 3
+        session.add(ExamMapping(exam_id=exam_id, category_id=category_id,
+                                number_of_questions=questions_per_category,
+                                randomize_questions=1 if kind == 0 else 0))
+        if kind == 1:
+            for question_id in question_ids[:questions_per_category]:
+                session.add(ExamQuestionMapping(exam_id=exam_id, category_id=category_id, question_id=question_id))
+    now = datetime.datetime.utcnow()
+    session.add(ExamSchedule(schedule_id=schedule_id, exam_id=exam_id, start_time=now - datetime.timedelta(minutes=5),
+                             end_time=now + datetime.timedelta(hours=1), published=1, pregenerate_papers=1))
+    session.commit()
+    session.close()
+    return schedule_id
+
+
+def _cold_launch(launch_client, schedule_id):
+    app_module, client, headers, stats = launch_client
+    from auth.auth import clear_session_cache
+    from others.paper_cache import clear_exam_paper_cache
+
+    clear_exam_paper_cache()
+    clear_session_cache()
+    response = client.get(f'/edu/api/launch-exam?schedule_id={schedule_id}&user_id={USER_ID}', headers=headers)
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()['data'], stats[-1]
+
+
+def test_cold_launch_query_count_does_not_grow_with_the_paper(launch_client):
+    small_data, small = _cold_launch(launch_client, _add_paper(categories=3, questions_per_category=1))
+    large_data, large = _cold_launch(launch_client, _add_paper(categories=15, questions_per_category=8))
+
+    assert len(small_data['questions']) == 3
+    assert len(large_data['questions']) == 120
+    assert large.budgeted_queries == small.budgeted_queries
+    # The first launch also polls the cache version stamps, one statement
+    # per cache; nothing the paper itself loads may repeat per category.
+    assert large.most_repeated()[1] <= small.most_repeated()[1]
@@ -0,0 +1,101 @@
+from flask import Flask, jsonify, request
+from sqlalchemy import create_engine, text
+
+from db.metrics import (
+    begin_request_stats, cache_fill, end_request_stats, enforce_query_budget, install_query_hooks, query_budget
+)
+
+
+def _make_app(enforce):
+    """A small app wired to the query budget the same way app.py wires the edu blueprint."""
+    engine = create_engine("sqlite://")
+    install_query_hooks(engine)
+    app = Flask(__name__)
+    app.config['QUERY_BUDGET_ENFORCE'] = enforce
+
+    def run(statements, filled=0):
+        with engine.connect() as connection:
+            with cache_fill():
+                for _ in range(filled):
+                    connection.execute(text("SELECT 1"))
+            for i in range(statements):
+                connection.execute(text(f"SELECT {i + 2}"))
+
+    @app.route('/within')
+    @query_budget(max_queries=3)
+    def within():
+        run(3)
+        return jsonify({"status": True}), 200
+
+    @app.route('/over')
+    @query_budget(max_queries=3)
+    def over():
+        run(4)
+        return jsonify({"status": True}), 200
+
+    @app.route('/cache-fill')
+    @query_budget(max_queries=3)
+    def with_cache_fill():
+        run(3, filled=5)
+        return jsonify({"status": True}), 200
+
+    @app.route('/repeated')
+    @query_budget(max_queries=50, max_repeats=2)
+    def repeated():
+        with engine.connect() as connection:
+            for _ in range(3):
+                connection.execute(text("SELECT 1"))
+        return jsonify({"status": True}), 200
+
+    @app.route('/repeated-cache-fill')
+    @query_budget(max_queries=3, max_repeats=2)
+    def repeated_cache_fill():
+        with engine.connect() as connection:
+            with cache_fill():
+                for _ in range(3):
+                    connection.execute(text("SELECT 1"))
+        return jsonify({"status": True}), 200
+
+    @app.before_request
+    def start_stats():
+        begin_request_stats(request.endpoint)
+
+    @app.after_request
+    def check_budget(response):
+        view = app.view_functions.get(request.endpoint)
+        response = enforce_query_budget(response, request.endpoint, view, app.config['QUERY_BUDGET_ENFORCE'])
+        end_request_stats()
+        return response
+
+    return app.test_client()
+
+
+def test_route_within_budget_passes():
+    assert _make_app(enforce=True).get('/within').status_code == 200
+
+
+def test_route_over_budget_fails_when_enforced():
+    response = _make_app(enforce=True).get('/over')
+    assert response.status_code == 500
+    assert "4 SQL statements exceed the budget of 3" in response.get_json()["statusMessage"]
+
+
+def test_route_over_budget_is_only_logged_when_not_enforced(capsys):
+    assert _make_app(enforce=False).get('/over').status_code == 200
+    assert "Query budget exceeded on over" in capsys.readouterr().out
+
+
+def test_cache_fills_are_not_charged():
+    assert _make_app(enforce=True).get('/cache-fill').status_code == 200
+
+
+def test_repeated_statement_fails_when_enforced():
+    response = _make_app(enforce=True).get('/repeated')
+    assert response.status_code == 500
+    assert "statement repeated 3 times" in response.get_json()["statusMessage"]
+
+
+def test_repeats_inside_cache_fills_still_fail():
+    response = _make_app(enforce=True).get('/repeated-cache-fill')
+    assert response.status_code == 500
+    assert "statement repeated 3 times" in response.get_json()["statusMessage"]
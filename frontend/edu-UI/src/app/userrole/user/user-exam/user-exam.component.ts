@@ -73,6 +73,12 @@ export class UserExamRunnerComponent implements OnInit, OnDestroy {
   private submitUrl = `${API_BASE}/submit-exam`;
   private autosaveUrl = `${API_BASE}/autosave-exam`;
   private autosaveTimer: any = null;
+  // Incremental autosave: only questions that differ from the last
+  // acknowledged save are sent, tagged with an increasing revision. The
+  // revision is seeded from the server (launch and active-exam-status) so a
+  // reloaded page continues above the last revision the attempt stored.
+  private autosaveRevision = 0;
+  private savedAnswers: { [key: string]: string } = {};
   private statusUrl = `${API_BASE}/active-exam-status`;
 
   constructor(private http: HttpClient, private confirmService: ConfirmService, private ngZone: NgZone, private router: Router) {
@@ -171,6 +177,7 @@ export class UserExamRunnerComponent implements OnInit, OnDestroy {
       this.examTitle = this.exam.title || this.exam.name || wrapper?.exam_detail?.title || wrapper?.title || wrapper?.exam_id || '';
       this.examId = this.exam.exam_id || wrapper?.exam_detail?.exam_id || wrapper?.exam_id || this.exam.id || this.exam?.exam_id || '';
       this.attempt_id = this.exam.attempt_id || wrapper?.exam_detail?.attempt_id || wrapper?.attempt_id || this.exam.id || this.exam?.attempt_id || '';
+      this.syncAutosaveRevision(wrapper?.exam_detail?.autosave_revision);
       const rawQs = Array.isArray(wrapper?.questions) ? wrapper.questions : (Array.isArray(this.exam.questions) ? this.exam.questions : []);
       this.questions = rawQs.map((q: any) => ({
         id: q.question_id || q.id,
@@ -226,6 +233,7 @@ export class UserExamRunnerComponent implements OnInit, OnDestroy {
     if (this.testStopped || !this.attempt_id) return;
     this.http.get<any>(this.statusUrl, { params: { attempt_id: this.attempt_id } }).subscribe({
       next: (res) => {
+        this.syncAutosaveRevision(res?.autosave_revision);
         if (res?.published === false) this.stopActiveTest();
         if (['submitted', 'evaluated'].includes(res?.attempt_status)) {
           this.stopTimer();
@@ -301,12 +309,38 @@ export class UserExamRunnerComponent implements OnInit, OnDestroy {
     this.scheduleAutosave();
   }
 
+  private syncAutosaveRevision(serverRevision: any) {
+    const revision = Number(serverRevision);
+    if (Number.isFinite(revision) && revision > this.autosaveRevision) this.autosaveRevision = revision;
+  }
+
   scheduleAutosave() {
     if (this.testStopped || !this.attempt_id) return;
     if (this.autosaveTimer) clearTimeout(this.autosaveTimer);
     this.autosaveTimer = setTimeout(() => {
-      this.http.post<any>(this.autosaveUrl, { attempt_id: this.attempt_id, answers: this.answers }).subscribe({
-        error: (err) => { if (err?.status !== 409) console.warn('Answer autosave failed', err); }
+      const changes: { [key: string]: any } = {};
+      const sent: { [key: string]: string } = {};
+      Object.keys(this.answers).forEach(key => {
+        const serialized = JSON.stringify(this.answers[key] ?? null);
+        if (this.savedAnswers[key] !== serialized) {
+          changes[key] = this.answers[key];
+          sent[key] = serialized;
+        }
+      });
+      if (!Object.keys(changes).length) return;
+      const revision = ++this.autosaveRevision;
+      this.http.post<any>(this.autosaveUrl, { attempt_id: this.attempt_id, revision, changes }).subscribe({
+        next: () => { Object.assign(this.savedAnswers, sent); },
+        error: (err) => {
+          if (err?.status === 409 && err?.error?.errorCode === 'STALE_REVISION') {
+            // The server already holds a newer revision (for example after a
+            // page reload); continue above it and send the changes again.
+            this.syncAutosaveRevision(err.error.revision);
+            this.scheduleAutosave();
+          } else if (err?.status !== 409) {
+            console.warn('Answer autosave failed', err);
+          }
+        }
       });
     }, 500);
   }